@@ -25,6 +25,7 @@ Algorithmic Spike (algospike)
 This module contains non-ad hoc algorithmic functions that
 can be used through out Spike.
 '''
+from collections import deque
 
 
 def unique(sorted):
@@ -144,6 +145,26 @@ def lb32(x):
     return rc
 
 
+def reachable(roots, edges):
+    '''
+    Find all items that can be reached from a set of items, with time complexity 𝓞(V + E)
+    
+    @param   roots:itr<¿E?>             The items from which to start
+    @param   edges:dict<¿E?, itr<¿E?>>  Map from items to the items they lead to, items without edges may be omitted
+    @return  :set<¿E?>                  The roots and all items that can be reached from them
+    '''
+    rc = set(roots)
+    stack = list(rc)
+    while len(stack) > 0:
+        item = stack.pop()
+        if item in edges:
+            for next in edges[item]:
+                if next not in rc:
+                    rc.add(next)
+                    stack.append(next)
+    return rc
+
+
 def tsort(rc, lostrc, data):
     '''
     Sorts a data set on topologically
@@ -171,62 +192,108 @@ def tsort(rc, lostrc, data):
         for req in removed[remove]:
             data[req][0].remove(remove)
     
-    # Sort cyclic graph topologically
-    removed = [None]
-    while len(removed) > 0:
-        # Sort acyclic graph topologically
-        while len(removed) > 0:
-            removed = []
-            # Report and remove items with no unresolved dependency
-            for item in list(data):
-                if len(data[item][0]) == 0:
-                    rc.append((item, None))
-                    removed.append(item)
-                    del data[item]
-            # Remove reported items from dependency lists
-            for item in data:
-                deps = data[item][0]
-                for old in removed:
-                    if old in deps:
-                        deps.remove(old)
+    # Map dependencies to the items themselves, so items can be compared by identity
+    items = dict((item, item) for item in data)
+    graph = {}
+    for item in data:
+        graph[item] = list(set(items[dep] for dep in data[item][0]))
+    
+    # Find strongly connected components with Tarjan's algorithm, an item's dependencies
+    # are always completed before the item itself so they are found in topological order
+    components = []
+    (index, lowlink, stack, onstack) = ({}, {}, [], set())
+    for root in data:
+        if root in index:
+            continue
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        onstack.add(root)
+        work = [(root, iter(graph[root]))]
+        while len(work) > 0:
+            (item, deps) = work[-1]
+            descended = False
+            for dep in deps:
+                if dep not in index:
+                    index[dep] = lowlink[dep] = len(index)
+                    stack.append(dep)
+                    onstack.add(dep)
+                    work.append((dep, iter(graph[dep])))
+                    descended = True
+                    break
+                elif dep in onstack:
+                    lowlink[item] = min(lowlink[item], index[dep])
+            if descended:
+                continue
+            work.pop()
+            if len(work) > 0:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[item])
+            if lowlink[item] == index[item]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    onstack.remove(member)
+                    component.append(member)
+                    if member is item:
+                        break
+                components.append(component)
+    
+    for component in components:
+        # Report items that are not part of a cycle
+        if (len(component) == 1) and not any(dep is component[0] for dep in graph[component[0]]):
+            rc.append((component[0], None))
+            continue
         
-        # Break one cycle with as few transversial dependencies as possible
-        if len(data) > 0:
+        # Sort the cycle topologically, only dependencies within the cycle are unresolved
+        members = set(component)
+        remaining = dict((item, set(dep for dep in graph[item] if dep in members)) for item in component)
+        requirers = dict((item, []) for item in component)
+        for item in component:
+            for dep in remaining[item]:
+                requirers[dep].append(item)
+        def resolve(item):
+            del remaining[item]
+            resolved = [item]
+            while len(resolved) > 0:
+                done = resolved.pop()
+                for req in requirers[done]:
+                    if req in remaining:
+                        remaining[req].discard(done)
+                        if len(remaining[req]) == 0:
+                            rc.append((req, None))
+                            del remaining[req]
+                            resolved.append(req)
+        while len(remaining) > 0:
+            # Break one cycle with as few transversial dependencies as possible
             best = None
-            # Find best cycle break
-            for item in data:
+            for item in component:
+                if item not in remaining:
+                    continue
                 deps = set()
-                queue = list(data[item][0])
+                queue = deque(remaining[item])
                 deps.add(item)
                 absolute = set(data[item][1])
                 bad = False
                 while len(queue) > 0:
-                    dep = queue[0]
+                    dep = queue.popleft()
                     if dep in absolute:
                         bad = True
                         break
-                    queue[:] = queue[1:]
                     if dep in deps:
                         continue
                     deps.add(dep)
-                    queue += list(data[dep][0])
+                    queue.extend(remaining[dep])
                     for abs in data[dep][1]:
                         absolute.add(abs)
                 if bad:
                     continue
                 deps.remove(item)
-                if (best is None) or (len(best[0]) > len(deps)):
+                if (best is None) or (len(best[1]) > len(deps)):
                     best = (item, list(deps))
             # Report cycle break and remove item
             if best is None:
                 return False
             rc.append(best)
-            bestitem = best[0]
-            removed.append(bestitem)
-            del data[bestitem]
-            # Remove item from dependency lists
-            for item in data:
-                if bestitem in data[item][0]:
-                    data[item][0].remove(bestitem)
+            resolve(best[0])
     return True
 
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+spike – a package manager running on top of git
+
+Copyright © 2012, 2013, 2014  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+'''
+Microbenchmark for version comparison in this directory
+'''
+import time
+import random
+
+from scrlver import *
+
+
+# Build a corpus resembling the versions found in a repository
+random.seed(0)
+corpus = []
+for i in range(4000):
+    kind = i % 8
+    (a, b, c) = (random.randint(0, 30), random.randint(0, 30), random.randint(0, 99))
+    if   kind == 0:  version = '%i.%i.%i' % (a, b, c)
+    elif kind == 1:  version = '%i.%i' % (a, b)
+    elif kind == 2:  version = '%i.%irc%i' % (a, b, c % 5)
+    elif kind == 3:  version = '%i:%i.%i-%i' % (a % 3, b, c, random.randint(1, 9))
+    elif kind == 4:  version = '2014%02i%02i' % (a % 12 + 1, b % 28 + 1)
+    elif kind == 5:  version = '0.9.8%s' % chr(ord('a') + a % 26)
+    elif kind == 6:  version = '%i.%i.%i.%i-%i' % (a, b, c, a + b, random.randint(1, 3))
+    else:            version = '%i.%ibeta%i' % (a, b, c % 4)
+    corpus.append(version)
+
+
+def bench(name, function, repeat = 3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print('%-40s %8.2f ms' % (name, best * 1000))
+
+
+versions = [ScrollVersion.Version(version, False) for version in corpus]
+pairs = [(random.choice(versions), random.choice(versions)) for _ in range(100000)]
+
+bench('construct %i versions' % len(corpus), lambda : [ScrollVersion.Version(version, False) for version in corpus])
+bench('construct %i ranges' % len(corpus), lambda : [ScrollVersion('pony>=' + version) for version in corpus])
+bench('sort %i versions' % len(versions), lambda : sorted(versions))
+bench('%i comparisons (<=)' % len(pairs), lambda : [a <= b for (a, b) in pairs])
+bench('%i comparisons (==)' % len(pairs), lambda : [a == b for (a, b) in pairs])
+bench('slice %i ranges' % (len(corpus) // 10), lambda : ScrollVersion.slice([ScrollVersion('pony>=' + version) for version in corpus[::10]]))
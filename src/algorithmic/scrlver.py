@@ -24,6 +24,8 @@ Scroll Version (scrlver)
 
 This module contains function that has to do with scroll version
 '''
+import re
+import sys
 
 
 class ScrollVersion():
@@ -37,6 +39,9 @@ class ScrollVersion():
     @variable  complement:bool  Whether the range is stored in its complement, can only be true one exact version is specified
     '''
     
+    __slots__ = ('full', 'name', 'lower', 'upper', 'complement', 'union_mode')
+    
+    
     def __init__(self, scroll):
         '''
         Constructor
@@ -62,7 +67,6 @@ class ScrollVersion():
             isupper = '<' in parts[1]
             if islower == isupper:
                 self.complement = islower and isupper
-                ver.isopen = False
                 (self.lower, self.upper) = (ver, ver)
             elif islower:
                 self.lower = ver
@@ -81,6 +85,9 @@ class ScrollVersion():
         A scroll version, not a range and not a scroll name, but with other or not it is open
         '''
         
+        __slots__ = ('version', 'epoch', 'release', 'parts', 'key', 'open')
+        
+        
         def __init__(self, version, open):
             '''
             Constructor
@@ -88,17 +95,43 @@ class ScrollVersion():
             @param  version:str  The version represented in text
             @param  open:bool    Whether this end is open
             '''
-            self.version = version
-            self.epoch = 0
-            self.release = -1
+            # Versions are parsed once, and identical versions share their parsed form
+            cache = ScrollVersion.Version.cache
+            if version not in cache:
+                cache[sys.intern(version)] = ScrollVersion.Version.parse(version)
+            (self.version, self.epoch, self.release, self.parts, self.key) = cache[version]
+            self.open = open
+        
+        
+        @staticmethod
+        def parse(version):
+            '''
+            Parse a version number
+            
+            @param   version:str                                 The version represented in text
+            @return  :(str, int, int, list<str>, (int, tuple))  The version, the epoch, the release number, the
+                                                                 parts of the version and the sort key of the version,
+                                                                 the sort key does not include the release number
+            '''
+            text = sys.intern(version)
+            (epoch, release) = (0, -1)
             if ':' in version:
-                self.epoch = int(version[:version.find(':')])
+                epoch = int(version[:version.find(':')])
                 version = version[version.find(':') + 1:]
             if '-' in version:
-                self.release = int(version[version.find('-') + 1:])
+                release = int(version[version.find('-') + 1:])
                 version = version[:version.find('-')]
-            self.parts = version.split('.')
-            self.open = open
+            parts = version.split('.')
+            # Each part is split into alternating non-numerical and numerical segments,
+            # starting with a non-numerical segment, numerical segments are compared as
+            # integers and the other segments lexicographically
+            key = []
+            for part in parts:
+                segments = re.findall('[0-9]+|[^0-9]+', part)
+                if (len(segments) > 0) and ('0' <= segments[0][0] <= '9'):
+                    segments.insert(0, '')
+                key.append(tuple(int(seg) if (i & 1) == 1 else seg for (i, seg) in enumerate(segments)))
+            return (text, epoch, release, parts, (epoch, tuple(key)))
         
         
         def as_closed(self, closed = True):
@@ -118,49 +151,20 @@ class ScrollVersion():
             @param   other:Version  The other version number
             @return  :int           negative if `self` is less, zero if `self` equals `other`, and positive if `other` is less
             '''
-            if self.epoch != other.epoch:
-                return self.epoch - other.epoch
-            
-            (n, m) = (len(self.parts), len(other.parts))
-            for i in range(min(n, m)):
-                (a, b) = (self.parts[i], other.parts[i])
-                if a == b:
-                    continue
-                (_a, _b) = ([], [])
-                if len(a) > 0:
-                    buf = ''
-                    for j in range(len(a)):
-                        isnum = '0' <= a[j] <= '9'
-                        wantnum = (len(_a) & 1) == 1
-                        if isnum != wantnum:
-                            _a.append(buf)
-                            buf = a[j]
-                        else:
-                            buf += a[j]
-                    _a.append(buf)
-                if len(b) > 0:
-                    buf = ''
-                    for j in range(len(b)):
-                        isnum = '0' <= a[j] <= '9'
-                        wantnum = (len(_b) & 1) == 1
-                        if isnum != wantnum:
-                            _b.append(buf)
-                            buf = b[j]
-                        else:
-                            buf += b[j]
-                    _b.append(buf)
-                (_n, _m) = (len(_a), len(_b))
-                for j in range(min(_n, _m)):
-                    (a, b) = (_a[j], _b[j])
-                    if a != b:
-                        if (j & 1) == 1:
-                            return int(a) - int(b)
-                        else:
-                            return -1 if a < b else 1
-                if _n != _m:
-                    return _n - _m
+            (a, b) = (self.key, other.key)
+            if a is b:
+                return 0
+            return (a > b) - (a < b)
+        
+        
+        def order(self, other):
+            '''
+            Compares two version number, does not compare release number or openness
             
-            return n - m
+            @param   other:Version  The other version number
+            @return  :int           negative if `self` is less, zero if `self` equals `other`, and positive if `other` is less
+            '''
+            return self.__cmp(other)
         
         
         def __lt__(self, other):
@@ -481,13 +485,11 @@ class ScrollVersion():
         '''
         Updates a set of ScrollVersion:s by replacing the existing scroll with the union of that and this scroll
         
-        @param  scroll_set:set<ScrollVersion>  Set of scrolls
+        @param  scroll_set:set<ScrollVersion>|ScrollVersionSet  Set of scrolls
         '''
         self.union_mode = True
         if self in scroll_set:
-            others = list(filter(lambda element : self in element, list(scroll_set)))
-            while self in scroll_set:
-                scroll_set.remove(self)
+            others = ScrollVersionSet.take(scroll_set, self)
             others = [self.union(o) for o in others]
             scroll_set.add(others[0])
             for other in others[1:]:
@@ -500,7 +502,7 @@ class ScrollVersion():
         '''
         Updates a set of ScrollVersion:s by replacing the existing scroll with the intersaction of that and this scroll
         
-        @param  scroll_set:set<ScrollVersion>  Set of scrolls
+        @param  scroll_set:set<ScrollVersion>|ScrollVersionSet  Set of scrolls
         '''
         ## FIXME  The most be rewritten, it is not commutative
         
@@ -516,9 +518,7 @@ class ScrollVersion():
                 a.intersection_add(scroll_set)
                 b.intersection_add(scroll_set)
         elif self in scroll_set:
-            others = list(filter(lambda element : self in element, list(scroll_set)))
-            while self in scroll_set:
-                scroll_set.remove(self)
+            others = ScrollVersionSet.take(scroll_set, self)
             others = [self.intersection(o) for o in others]
             scroll_set.add(others[0])
             for other in others[1:]:
@@ -617,3 +617,175 @@ class ScrollVersion():
                     rc.add(value)
         return list(rc)
 
+
+ScrollVersion.Version.cache = {}
+
+
+
+class ScrollVersionSet():
+    '''
+    Set of disjoint scroll version ranges, indexed by scroll name and ordered by version
+    so that the ranges a scroll intersects can be found in logarithmic time
+    
+    Ranges should be added with `ScrollVersion.union_add` or `ScrollVersion.intersection_add`,
+    which keeps the ranges disjoint
+    
+    @variable  ranges:dict<str, list<ScrollVersion>>       Ranges, that are not complements, sorted by their lower bound, by name
+    @variable  complements:dict<str, list<ScrollVersion>>  Complement ranges by name
+    '''
+    
+    def __init__(self):
+        '''
+        Constructor
+        '''
+        self.ranges = {}
+        self.complements = {}
+        self.count = 0
+    
+    
+    @staticmethod
+    def compare(a, a_none, b, b_none):
+        '''
+        Compares two version bounds, does not compare release number or openness
+        
+        @param   a:Version?   The first bound
+        @param   a_none:int   -1 if `a` is a lower bound, 1 if `a` is an upper bound
+        @param   b:Version?   The second bound
+        @param   b_none:int   -1 if `b` is a lower bound, 1 if `b` is an upper bound
+        @return  :int         negative if `a` is less, zero if `a` equals `b`, and positive if `b` is less
+        '''
+        if (a is None) or (b is None):
+            return (a_none if a is None else 0) - (b_none if b is None else 0)
+        return a.order(b)
+    
+    
+    @staticmethod
+    def take(scroll_set, scroll):
+        '''
+        Remove and return all ranges in a set that a scroll intersects
+        
+        @param   scroll_set:set<ScrollVersion>|ScrollVersionSet  The set
+        @param   scroll:ScrollVersion                            The scroll
+        @return  :list<ScrollVersion>                            The removed ranges
+        '''
+        if isinstance(scroll_set, ScrollVersionSet):
+            others = scroll_set.overlapping(scroll)
+            for other in others:
+                scroll_set.remove(other)
+        else:
+            others = list(filter(lambda element : scroll in element, list(scroll_set)))
+            while scroll in scroll_set:
+                scroll_set.remove(scroll)
+        return others
+    
+    
+    def search(self, ranges, bound, upper):
+        '''
+        Find the first range whose bound is not less than a bound
+        
+        @param   ranges:list<ScrollVersion>  The ranges of a scroll, sorted
+        @param   bound:Version?              The lower bound to search for
+        @param   upper:bool                  Whether to compare against the ranges' upper bounds rather than lower bounds
+        @return  :int                        The index of the range
+        '''
+        (min, max) = (0, len(ranges))
+        while min < max:
+            mid = (min + max) >> 1
+            if upper:
+                cmp = ScrollVersionSet.compare(ranges[mid].upper, 1, bound, -1)
+            else:
+                cmp = ScrollVersionSet.compare(ranges[mid].lower, -1, bound, -1)
+            if cmp < 0:
+                min = mid + 1
+            else:
+                max = mid
+        return min
+    
+    
+    def overlapping(self, scroll):
+        '''
+        Gets all ranges that a scroll intersects
+        
+        @param   scroll:ScrollVersion  The scroll
+        @return  :list<ScrollVersion>  The ranges that intersects the scroll
+        '''
+        ranges = self.ranges[scroll.name] if scroll.name in self.ranges else []
+        candidates = self.complements[scroll.name] if scroll.name in self.complements else []
+        if scroll.complement or ((scroll.lower is None) and (scroll.upper is None)):
+            candidates = candidates + ranges
+        else:
+            # The ranges are disjoint, so their upper bounds are sorted too
+            candidates = list(candidates)
+            i = self.search(ranges, scroll.lower, True)
+            while (i < len(ranges)) and (ScrollVersionSet.compare(ranges[i].lower, -1, scroll.upper, 1) <= 0):
+                candidates.append(ranges[i])
+                i += 1
+        return [candidate for candidate in candidates if candidate in scroll]
+    
+    
+    def add(self, scroll):
+        '''
+        Adds a range to the set, it should not intersect any range already in the set
+        
+        @param  scroll:ScrollVersion  The range
+        '''
+        if scroll.complement:
+            if scroll.name not in self.complements:
+                self.complements[scroll.name] = []
+            self.complements[scroll.name].append(scroll)
+        else:
+            if scroll.name not in self.ranges:
+                self.ranges[scroll.name] = []
+            ranges = self.ranges[scroll.name]
+            ranges.insert(self.search(ranges, scroll.lower, False), scroll)
+        self.count += 1
+    
+    
+    def remove(self, scroll):
+        '''
+        Removes a range from the set, nothing is done if it is not in the set,
+        for example if it is an empty range, such as `a>3<2`, that was never added
+        
+        @param  scroll:ScrollVersion  The range, the very same object that was added
+        '''
+        if scroll.complement:
+            (ranges, i) = (self.complements[scroll.name] if scroll.name in self.complements else [], 0)
+        else:
+            ranges = self.ranges[scroll.name] if scroll.name in self.ranges else []
+            i = self.search(ranges, scroll.lower, False)
+        while (i < len(ranges)) and (ranges[i] is not scroll):
+            i += 1
+        if i == len(ranges):
+            return
+        del ranges[i]
+        self.count -= 1
+    
+    
+    def __contains__(self, scroll):
+        '''
+        Checks if a scroll intersects any range in the set
+        
+        @param   scroll:ScrollVersion  The scroll
+        @return  :bool                 Whether the scroll intersects any range in the set
+        '''
+        return len(self.overlapping(scroll)) > 0
+    
+    
+    def __iter__(self):
+        '''
+        Iterate over all ranges in the set
+        
+        @return  :itr<ScrollVersion>  All ranges in the set
+        '''
+        for ranges in list(self.ranges.values()) + list(self.complements.values()):
+            for scroll in ranges:
+                yield scroll
+    
+    
+    def __len__(self):
+        '''
+        Gets the number of ranges in the set
+        
+        @return  :int  The number of ranges in the set
+        '''
+        return self.count
@@ -320,6 +320,20 @@ class SHA3:
         return bytes(rc)
     
     
+    def hexdigest(self, msg = None):
+        '''
+        Absorb the last part of the message and squeeze the Keccak sponge, in hexadecimal
+        
+        @param   msg:bytes  The rest of the message
+        @return  :str       The hash sum in uppercase hexadecimal
+        '''
+        rc = ''
+        for b in self.digest(msg):
+            rc += "0123456789ABCDEF"[b >> 4]
+            rc += "0123456789ABCDEF"[b & 15]
+        return rc
+    
+    
     def digest_file(self, filename):
         '''
         Calculate the hash sum of an entire file
@@ -334,16 +348,11 @@ class SHA3:
                 blksize = 8192
         except:
             pass
-        rc = ''
         with open(filename, 'rb') as file:
             while True:
                 chunk = file.read(blksize)
                 if len(chunk) == 0:
                     break
                 self.update(chunk)
-            bs = self.digest()
-            for b in bs:
-                rc += "0123456789ABCDEF"[b >> 4]
-                rc += "0123456789ABCDEF"[b & 15]
-        return rc
+        return self.hexdigest()
 
@@ -135,6 +135,47 @@ if got and len(lostrc) == 0 and len(rc) == 7:
             break
     error('algospike.tsort, sortable, does not work', cycles == 1 and xy and order_ok)
 
+def _(p, deps, reqs):
+    data[p] = (set(__(deps)), __(reqs))
+data = {}
+_('a', 'b', '')
+_('b', 'c', '')
+_('c', 'a', '')
+_('d', 'a e', '')
+_('e', 'f', '')
+_('f', 'e g', '')
+_('g', '', '')
+_('h', 'd z', '')
+_('i', 'i', '')
+rc, lostrc = [], []
+got = tsort(rc, lostrc, data)
+error('algospike.tsort, several cycles, does not work', got and (lostrc == [('z', 'h')]) and (len(rc) == 9))
+done = set()
+for (p, later) in rc:
+    deps = data[p][0] - set(later if later is not None else []) - set([p])
+    error('algospike.tsort, several cycles, %s, does not work' % p, (deps <= done) and (p not in done))
+    if later is not None:
+        error('algospike.tsort, several cycles, %s breaks, does not work' % p, len(set(later) & done) == 0)
+    done.add(p)
+cycles = len(list(filter(lambda x : x[1] is not None, rc)))
+error('algospike.tsort, several cycles, does not work', cycles == 3)
+
+data = {}
+for i in range(2000):
+    data[i] = (set([i + 1]) if i < 1999 else set(), [])
+rc = []
+got = tsort(rc, [], data)
+error('algospike.tsort, long chain, does not work', got and [p for (p, _) in rc] == list(reversed(range(2000))))
+
+
+edges = {'a' : ['b', 'c'], 'b' : ['d'], 'c' : ['d', 'a'], 'e' : ['f'], 'f' : ['e'], 'g' : ['a']}
+got = reachable(['a'], edges)
+error('algospike.reachable, does not work', got == set('abcd'))
+got = reachable(['d', 'e'], edges)
+error('algospike.reachable, does not work', got == set('def'))
+got = reachable([], edges)
+error('algospike.reachable, does not work', got == set())
+
 
 
 sha3 = SHA3()
@@ -142,6 +183,13 @@ got = sha3.digest_file('../../LICENSE')
 ref = '827821773FDCE6F142E8C0446530DA596369AB63D5230E2A7D786AEAC0BDC406F1A50D8550F718A70384526980FEEADBF43348ADDBC50A13478B1A958C0E9218DC172DA2CB7591ED'
 error('sha3sum does not work', got == ref)
 
+sha3 = SHA3()
+with open('../../LICENSE', 'rb') as file:
+    data = file.read()
+for i in range(0, len(data), 1000):
+    sha3.update(data[i : i + 1000])
+error('sha3sum does not work when fed in chunks', sha3.hexdigest() == ref)
+
 
 
 scroll = ScrollVersion('test=1')
@@ -734,6 +782,51 @@ ScrollVersion('>1.1<1:1').union_add(union)
 got = str([str(e) for e in list(union)])
 error('scrlver.ScrollVersion.union_add, does not work', got == "['>=1<1:1']")
 
+union = ScrollVersionSet()
+ScrollVersion('=1').union_add(union)
+ScrollVersion('=2').union_add(union)
+ScrollVersion('<>1').union_add(union)
+got = str([str(e) for e in list(union)])
+error('scrlver.ScrollVersionSet, union_add, does not work', got == "['']")
+
+union = ScrollVersionSet()
+ScrollVersion('=1').union_add(union)
+ScrollVersion('=2').union_add(union)
+ScrollVersion('=2').union_add(union)
+got = sorted([str(e) for e in list(union)])
+error('scrlver.ScrollVersionSet, union_add, does not work', got == ['=1', '=2'])
+error('scrlver.ScrollVersionSet.__len__, does not work', len(union) == 2)
+ScrollVersion('>1<2').union_add(union)
+ScrollVersion('>1.1<1:1').union_add(union)
+got = str([str(e) for e in list(union)])
+error('scrlver.ScrollVersionSet, union_add, does not work', got == "['>=1<1:1']")
+
+union = ScrollVersionSet()
+for scroll in ('a<1', 'a>=2<3', 'a>=4<5', 'a>=6', 'b=3'):
+    ScrollVersion(scroll).union_add(union)
+for (scroll, expect) in (('a=0', ['a<1']), ('a>2.5<4.5', ['a>=2<3', 'a>=4<5']), ('a=5', []), ('a>=1<2', []),
+                         ('a', ['a<1', 'a>=2<3', 'a>=4<5', 'a>=6']), ('a<>2', ['a<1', 'a>=2<3', 'a>=4<5', 'a>=6']),
+                         ('a>7', ['a>=6']), ('b<4', ['b=3']), ('c', [])):
+    got = sorted([str(e) for e in union.overlapping(ScrollVersion(scroll))])
+    error('scrlver.ScrollVersionSet.overlapping, %s, does not work' % scroll, got == expect)
+    error('scrlver.ScrollVersionSet.__contains__, %s, does not work' % scroll, (ScrollVersion(scroll) in union) == (len(expect) > 0))
+
+intersection = ScrollVersionSet()
+ScrollVersion('a>=1').intersection_add(intersection)
+ScrollVersion('a<3').intersection_add(intersection)
+ScrollVersion('b').intersection_add(intersection)
+got = sorted([str(e) for e in list(intersection)])
+error('scrlver.ScrollVersionSet, intersection_add, does not work', got == ['a>=1<3', 'b'])
+
+intersection.remove(ScrollVersion('a>3<2'))
+intersection.remove(ScrollVersion('c'))
+error('scrlver.ScrollVersionSet.remove, removed a range that is not in the set', len(intersection) == 2)
+empty = ScrollVersion('a>3<2')
+intersection.add(empty)
+intersection.remove(empty)
+got = sorted([str(e) for e in list(intersection)])
+error('scrlver.ScrollVersionSet.remove, does not work with empty ranges', got == ['a>=1<3', 'b'])
+
 
 
 
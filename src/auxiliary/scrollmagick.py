@@ -20,6 +20,7 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
 
 import os
+import builtins
 
 
 SOFTWARE_SHAREABLE = 1
@@ -47,6 +48,16 @@ OSI_APPROVED = 64
 GPL_COMPATIBLE = 128
 COPYLEFT = 256
 
+SCROLL_NONE_FIELDS = 'pkgname pkgver pkgdesc upstream arch freedom license metalicense private extension variant patches reason source sha3sums'.split(' ')
+'''
+Scroll fields that are `None` by default
+'''
+
+SCROLL_LIST_FIELDS = 'conflicts replaces provides patchbefore patchafter groups depends makedepends checkdepends optdepends noextract options backup'.split(' ')
+'''
+Scroll fields that are empty lists by default
+'''
+
 
 
 class ScrollMagick():
@@ -85,12 +96,40 @@ class ScrollMagick():
         @param  globals:dict<str, any>  Should be `globals()`
         '''
         code = None
-        with open(scroll, 'rb') as file:
-            code = file.read().decode('utf8', 'replace') + '\n'
-            code = compile(code, scroll, 'exec')
+        if ScrollMagick.code_cache is not None:
+            code = ScrollMagick.code_cache.compile(scroll)
+        else:
+            with open(scroll, 'rb') as file:
+                code = file.read().decode('utf8', 'replace') + '\n'
+                code = compile(code, scroll, 'exec')
         exec(code, globals)
     
     
+    @staticmethod
+    def namespace():
+        '''
+        Create a fresh namespace in which a scroll can be executed, without
+        interfering with other scrolls or the program executing the scroll
+        
+        @return  :dict<str, any>  The namespace, with the scroll fields and methods set to their default values
+        '''
+        if ScrollMagick.template is None:
+            import dragonsuite
+            template = {'__builtins__' : builtins}
+            for name in dir(dragonsuite):
+                if not name.startswith('_'):
+                    template[name] = getattr(dragonsuite, name)
+            for name in ('SOFTWARE_SHAREABLE SOFTWARE_COMMERCIAL SOFTWARE_DERIVATIVE MEDIA_SHAREABLE MEDIA_COMMERCIAL '
+                         'MEDIA_DERIVATIVE TRADEMARKED PATENTED MEDIA SOFTWARE UNSUPPORTED SUPPORTED MANDITORY NO_TRADEMARKS '
+                         'NO_PATENTS CONTRACT_BASED COMMERCIAL DERIVATIVE FSF_APPROVED OSI_APPROVED GPL_COMPATIBLE COPYLEFT').split(' '):
+                template[name] = globals()[name]
+            ScrollMagick.init_methods(template)
+            ScrollMagick.template = template
+        namespace = dict(ScrollMagick.template)
+        ScrollMagick.init_fields(namespace)
+        return namespace
+    
+    
     @staticmethod
     def init_fields(globals):
         '''
@@ -98,12 +137,10 @@ class ScrollMagick():
         
         @param  globals:dict<str, any>  Should be `globals()`
         '''
-        vars = 'pkgname pkgver pkgdesc upstream arch freedom license metalicense private extension variant patches reason source sha3sums'
-        for var in vars.split(' '):
+        for var in SCROLL_NONE_FIELDS:
             globals[var] = None
         
-        vars = 'conflicts replaces provides patchbefore patchafter groups depends makedepends checkdepends optdepends noextract options backup'
-        for var in vars.split(' '):
+        for var in SCROLL_LIST_FIELDS:
             globals[var] = []
         
         globals['pkgrel'] = 1
@@ -111,6 +148,16 @@ class ScrollMagick():
         globals['interactive'] = False
     
     
+    @staticmethod
+    def field_names():
+        '''
+        Get the names of all scroll fields
+        
+        @return  :list<str>  The names of the fields set by `init_fields`
+        '''
+        return SCROLL_NONE_FIELDS + SCROLL_LIST_FIELDS + ['pkgrel', 'epoch', 'interactive']
+    
+    
     @staticmethod
     def init_methods(globals):
         '''
@@ -316,3 +363,7 @@ class ScrollMagick():
                     return ('Unsupported', 'Supported', 'Manditory')[value]
         return value
 
+
+ScrollMagick.code_cache = None
+ScrollMagick.template = None
+
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+spike – a package manager running on top of git
+
+Copyright © 2012, 2013, 2014  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+'''
+Benchmark for `dragonsuite.decompress`, comparing in-process extraction, extraction
+with external programs, and the default choice between them
+
+Usage: benchmark.py [ARCHIVES [FILES [SIZE]]]
+'''
+import sys
+import os
+import io
+import time
+import shutil
+import tarfile
+import tempfile
+
+import dragonsuite
+from dragonsuite import *
+
+
+(archives, files, size) = ([int(arg) for arg in sys.argv[1:]] + [8, 200, 1 << 14][len(sys.argv) - 1:])[:3]
+dragonsuite._dragonsuite_output = None
+
+
+def make_archives(directory):
+    '''
+    Create the archives to extract
+    
+    @param   directory:str  The directory in which to create the archives
+    @return  :list<str>     The archives
+    '''
+    rc = []
+    for compression in ('', 'gz', 'bz2', 'xz'):
+        for i in range(archives):
+            file = '%s/archive%i.tar%s' % (directory, i, ('.' + compression) if compression != '' else '')
+            with tarfile.open(file, 'w:' + compression) as archive:
+                for j in range(files):
+                    data = os.urandom(size // 2) + bytes(size - size // 2)
+                    info = tarfile.TarInfo('archive%i/file%i' % (i, j))
+                    info.size = len(data)
+                    archive.addfile(info, io.BytesIO(data))
+            rc.append(file)
+    return rc
+
+
+def measure(archives, native):
+    '''
+    Time the extraction of a set of archives
+    
+    @param   archives:list<str>  The archives
+    @param   native:bool?        Whether to extract in-process, `None` for the default choice
+    @return  :float              The number of seconds the extraction took
+    '''
+    directory = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        start = time.monotonic()
+        decompress(archives, native = native)
+        return time.monotonic() - start
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(directory)
+
+
+directory = tempfile.mkdtemp()
+try:
+    files_ = make_archives(directory)
+    print('%i archives with %i files of %i bytes each' % (len(files_), files, size))
+    for compression in ('', '.gz', '.bz2', '.xz', None):
+        if compression is None:
+            (subset, compression) = (files_, ' (all)')
+        else:
+            subset = [file for file in files_ if file.endswith('.tar' + compression)]
+        (native, shell, auto) = (measure(subset, True), measure(subset, False), measure(subset, None))
+        print('tar%-10s  native: %7.3f s  shell: %7.3f s  default: %7.3f s' % (compression, native, shell, auto))
+finally:
+    shutil.rmtree(directory)
+
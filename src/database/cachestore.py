@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+spike – a package manager running on top of git
+
+Copyright © 2012, 2013, 2014  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import os
+import marshal
+import hashlib
+import threading
+
+import dragonsuite
+
+
+
+class CacheStore():
+    '''
+    Persistent, rebuildable, cache file in Spike's var directory
+    
+    @variable  file:str  The cache file
+    '''
+    
+    def __init__(self, spike_path, name):
+        '''
+        Constructor
+        
+        @param  spike_path:str  The path for Spike
+        @param  name:str        The name of the cache
+        '''
+        self.file = '%s%s.cache' % (CacheStore.directory(spike_path), name)
+    
+    
+    @staticmethod
+    def directory(spike_path):
+        '''
+        Get the directory in which caches are stored
+        
+        @param   spike_path:str  The path for Spike
+        @return  :str            The directory, with a trailing slash
+        '''
+        syspath = spike_path + os.sep + 'var' + os.sep
+        homepath = os.environ['HOME'] + '/.local/var/spike/var/'.replace('/', os.sep)
+        # Use the system's cache if we can update it, otherwise use a private cache
+        parent = syspath
+        while not os.path.exists(parent):
+            parent = os.path.dirname(parent.rstrip(os.sep))
+        return syspath if os.access(parent, os.W_OK) else homepath
+    
+    
+    def load(self):
+        '''
+        Load the cache
+        
+        @return  :¿E?  The content of the cache, `None` if missing or unreadable
+        '''
+        try:
+            with open(self.file, 'rb') as file:
+                return marshal.load(file)
+        except:
+            return None
+    
+    
+    def save(self, data):
+        '''
+        Save the cache, atomically, failure is silently ignored
+        
+        @param  data:¿E?  The content of the cache, must be serialisable with `marshal`
+        '''
+        temp = '%s.%i.%i~' % (self.file, os.getpid(), threading.get_ident())
+        try:
+            path = os.path.dirname(self.file)
+            if not os.path.exists(path):
+                dragonsuite.mkdir_p(path)
+            with open(temp, 'wb') as file:
+                marshal.dump(data, file)
+            os.rename(temp, self.file)
+        except:
+            if os.path.lexists(temp):
+                os.unlink(temp)
+    
+    
+    @staticmethod
+    def identity(file):
+        '''
+        Get the cheaply retrieved identity of a file, that changes when the file is modified
+        
+        @param   file:str          The file
+        @return  :(int, int, int)  The modification time in nanoseconds, the size and the inode of the file
+        '''
+        stat = os.stat(file)
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    
+    
+    @staticmethod
+    def digest(file):
+        '''
+        Get the hash of the content of a file
+        
+        @param   file:str  The file
+        @return  :str      The hash of the file in hexadecimal
+        '''
+        with open(file, 'rb') as file:
+            return hashlib.sha3_256(file.read()).hexdigest()
+    
+    
+    @staticmethod
+    def environment():
+        '''
+        Get the environment that can affect information in scrolls
+        
+        @return  :str  The environment encoded as a string
+        '''
+        vars = [var for var in os.environ if var.lower().startswith('i_use_')]
+        vars += ['ARCH', 'HOST']
+        return '\n'.join(['%s=%s' % (var, os.getenv(var, '')) for var in sorted(vars)])
+
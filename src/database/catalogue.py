@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+spike – a package manager running on top of git
+
+Copyright © 2012, 2013, 2014  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import os
+import marshal
+import hashlib
+import threading
+
+import dragonsuite
+from database.cachestore import *
+
+
+
+class Catalogue():
+    '''
+    Index of the scrolls in a repository, so that scrolls can be
+    located without listing the repository's directories
+    
+    @variable  repository:str                      The repository directory
+    @variable  file:str                            The file in which the catalogue is stored
+    @variable  commit:str?                         The commit the catalogue was updated to, `None` if unknown
+    @variable  mtimes:dict<str, int>               Category → modification time of its directory, the repository's is keyed by ''
+    @variable  scrolls:dict<str, set<str>>         Scroll name → categories with the scroll
+    '''
+    
+    def __init__(self, repository):
+        '''
+        Constructor, loads the catalogue but does not check that it is up to date
+        
+        @param  repository:str  The repository directory
+        '''
+        self.repository = repository
+        # Store the catalogue outside the repository, storing it inside would change the repository's modification time
+        name = hashlib.sha3_256(os.path.realpath(repository).encode('utf-8')).hexdigest()
+        self.file = '%scatalogues%s%s.spike' % (CacheStore.directory(os.environ['SPIKE_PATH']), os.sep, name)
+        (self.commit, self.mtimes, self.scrolls) = (None, {}, {})
+        try:
+            with open(self.file, 'rb') as file:
+                (self.commit, self.mtimes, self.scrolls) = marshal.load(file)
+        except:
+            pass
+    
+    
+    @staticmethod
+    def get(repository):
+        '''
+        Get the up to date catalogue of a repository, it is rebuilt if it is out of date
+        
+        @param   repository:str  The repository directory
+        @return  :Catalogue      The catalogue of the repository
+        '''
+        # The catalogues are shared between the threads in the daemon
+        with Catalogue.mutex:
+            if repository in Catalogue.catalogues:
+                catalogue = Catalogue.catalogues[repository]
+            else:
+                catalogue = Catalogue(repository)
+                Catalogue.catalogues[repository] = catalogue
+            if not catalogue.valid():
+                catalogue.rebuild()
+                catalogue.save()
+            return catalogue
+    
+    
+    @staticmethod
+    def is_scroll(category, filename):
+        '''
+        Checks whether a file name is the name of a scroll file
+        
+        @param   category:str  The category directory
+        @param   filename:str  The name of the file in the category
+        @return  :bool         Whether the file is a scroll
+        '''
+        if filename.startswith('.') or filename.startswith('-') or not filename.endswith('.scroll'):
+            return False
+        return os.path.isfile(category + os.sep + filename)
+    
+    
+    def valid(self):
+        '''
+        Checks whether the catalogue is up to date, that is, no scroll has been added or removed
+        
+        @return  :bool  Whether the catalogue is up to date
+        '''
+        if '' not in self.mtimes:
+            return False
+        try:
+            for category in self.mtimes:
+                if os.stat(self.repository + os.sep + category).st_mtime_ns != self.mtimes[category]:
+                    return False
+        except:
+            return False
+        return True
+    
+    
+    def refresh(self):
+        '''
+        Record the current modification times of the repository's and the categories' directories
+        '''
+        self.mtimes = {'' : os.stat(self.repository).st_mtime_ns}
+        for category in os.listdir(self.repository):
+            if not category.startswith('.'):
+                cdir = self.repository + os.sep + category
+                if os.path.isdir(cdir):
+                    self.mtimes[category] = os.stat(cdir).st_mtime_ns
+    
+    
+    def rebuild(self):
+        '''
+        Rebuild the catalogue by listing the repository, the scrolls are replaced at once
+        so that the catalogue can be read while it is being rebuilt
+        '''
+        scrolls = {}
+        self.refresh()
+        for category in self.mtimes:
+            if category != '':
+                cdir = self.repository + os.sep + category
+                for filename in os.listdir(cdir):
+                    if Catalogue.is_scroll(cdir, filename):
+                        name = filename[:-len('.scroll')]
+                        if name not in scrolls:
+                            scrolls[name] = set()
+                        scrolls[name].add(category)
+        (self.commit, self.scrolls) = (None, scrolls)
+    
+    
+    def add(self, category, name):
+        '''
+        Add a scroll to the catalogue
+        
+        @param  category:str  The scroll's category
+        @param  name:str      The scroll's name
+        '''
+        if name not in self.scrolls:
+            self.scrolls[name] = set()
+        self.scrolls[name].add(category)
+    
+    
+    def remove(self, category, name):
+        '''
+        Remove a scroll from the catalogue
+        
+        @param  category:str  The scroll's category
+        @param  name:str      The scroll's name
+        '''
+        if (name in self.scrolls) and (category in self.scrolls[name]):
+            self.scrolls[name].remove(category)
+            if len(self.scrolls[name]) == 0:
+                del self.scrolls[name]
+    
+    
+    def save(self):
+        '''
+        Store the catalogue, atomically, failure is silently ignored
+        '''
+        temp = '%s.%i.%i~' % (self.file, os.getpid(), threading.get_ident())
+        try:
+            path = os.path.dirname(self.file)
+            if not os.path.exists(path):
+                dragonsuite.mkdir_p(path)
+            with open(temp, 'wb') as file:
+                marshal.dump((self.commit, self.mtimes, self.scrolls), file)
+            os.rename(temp, self.file)
+        except:
+            if os.path.lexists(temp):
+                os.unlink(temp)
+    
+    
+    def categories(self):
+        '''
+        Get the categories in the repository
+        
+        @return  :list<str>  The categories
+        '''
+        return [category for category in self.mtimes if category != '']
+    
+    
+    def lookup(self, name):
+        '''
+        Find a scroll by its name
+        
+        @param   name:str         The scroll's name
+        @return  :dict<str, str>  Category → scroll file, for each category with the scroll
+        '''
+        if name not in self.scrolls:
+            return {}
+        return dict((category, '%s/%s/%s.scroll' % (self.repository, category, name)) for category in self.scrolls[name])
+    
+    
+    def files(self):
+        '''
+        Get all scrolls in the repository
+        
+        @return  :list<(str, str, str)>  The category, the name and the file of each scroll
+        '''
+        rc = []
+        for name in self.scrolls:
+            for category in self.scrolls[name]:
+                rc.append((category, name, '%s/%s/%s.scroll' % (self.repository, category, name)))
+        return rc
+
+
+Catalogue.catalogues = {}
+Catalogue.mutex = threading.Lock()
+
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+spike – a package manager running on top of git
+
+Copyright © 2012, 2013, 2014  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import os
+import marshal
+import hashlib
+import importlib.util
+import threading
+
+from database.cachestore import *
+
+
+
+class CodeCache():
+    '''
+    Persistent cache of compiled scrolls and add-ons
+    '''
+    
+    def __init__(self, spike_path, limit = 32 << 20):
+        '''
+        Constructor
+        
+        @param  spike_path:str  The path for Spike
+        @param  limit:int       The number of bytes the cache may use before old entries are evicted
+        '''
+        self.path = CacheStore.directory(spike_path) + 'codecache' + os.sep
+        self.limit = limit
+        self.modified = False
+    
+    
+    def compile(self, file):
+        '''
+        Compile a Python file, or load it from the cache if it has already been compiled
+        
+        @param   file:str  The file
+        @return  :code     The compiled code
+        '''
+        stat = os.stat(file)
+        key = (importlib.util.MAGIC_NUMBER, file, stat.st_size, stat.st_mtime_ns)
+        cachefile = self.path + hashlib.sha1(file.encode('utf-8')).hexdigest()
+        
+        # Load from cache
+        try:
+            with open(cachefile, 'rb') as cache:
+                (cachekey, code) = marshal.load(cache)
+            if cachekey == key:
+                # Mark as recently used, for the eviction
+                os.utime(cachefile)
+                return marshal.loads(code)
+        except:
+            pass
+        
+        # Compile and store in cache
+        code = None
+        with open(file, 'rb') as source:
+            code = source.read().decode('utf8', 'replace') + '\n'
+            code = compile(code, file, 'exec')
+        temp = '%s.%i.%i~' % (cachefile, os.getpid(), threading.get_ident())
+        try:
+            if not os.path.exists(self.path):
+                os.makedirs(self.path)
+            with open(temp, 'wb') as cache:
+                marshal.dump((key, marshal.dumps(code)), cache)
+            os.rename(temp, cachefile)
+            self.modified = True
+        except:
+            if os.path.lexists(temp):
+                os.unlink(temp)
+        return code
+    
+    
+    def evict(self):
+        '''
+        Remove the least recently used entries until the cache is within its size limit,
+        does nothing unless the cache has been added to
+        '''
+        if not self.modified:
+            return
+        self.modified = False
+        try:
+            entries = []
+            for entry in os.scandir(self.path):
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+            size = sum([entry[1] for entry in entries])
+            for (_mtime, entrysize, entry) in sorted(entries):
+                if size <= self.limit:
+                    break
+                os.unlink(entry)
+                size -= entrysize
+        except:
+            pass
+
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+spike – a package manager running on top of git
+
+Copyright © 2012, 2013, 2014  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import os
+import shutil
+import hashlib
+import threading
+
+import dragonsuite
+from database.cachestore import *
+from database.sourcecache import *
+
+
+
+PACKAGE_CACHE_SIZE = 8 << 30
+'''
+The maximum total size, in bytes, of the cached packages
+'''
+
+
+
+class PackageCache():
+    '''
+    Cache of built packages, that is, the package directories scrolls have been built
+    into, shared between installation roots, the least recently used packages are
+    evicted when the cache grows too large
+    
+    Packages are addressed by a hash of everything that goes into the build: the scroll,
+    its sources, the scrolls that patch it, the environment and the version of Spike.
+    Each package is stored as a directory that links to the files of the package
+    
+    @variable  directory:str  The directory of the cache, with a trailing slash
+    @variable  size:int       The maximum total size, in bytes, of the cached packages
+    '''
+    
+    def __init__(self, spike_path, size = PACKAGE_CACHE_SIZE):
+        '''
+        Constructor
+        
+        @param  spike_path:str  The path for Spike, without installation root
+        @param  size:int        The maximum total size, in bytes, of the cached packages
+        '''
+        self.directory = CacheStore.directory(spike_path) + 'packages' + os.sep
+        self.size = size
+    
+    
+    @staticmethod
+    def key(scrollfile, fields, patches, private, version):
+        '''
+        Get the address of the package built from a scroll
+        
+        @param   scrollfile:str         The scroll file
+        @param   fields:dict<str, ¿E?>  The value of each field in the scroll
+        @param   patches:itr<str>       The files of the scrolls that patch the scroll
+        @param   private:bool           Whether the scroll is built for a private installation
+        @param   version:str            The version of Spike
+        @return  :str?                  The address of the package, `None` if it cannot be cached because
+                                        the scroll has a remote source without a SHA3 sum or a missing local source
+        '''
+        (source, sha3sums) = (fields['source'] or [], fields['sha3sums'] or [])
+        scrolldir = os.path.dirname(os.path.realpath(scrollfile))
+        inputs = [version, 'private' if private else 'public', CacheStore.environment(), CacheStore.digest(scrollfile)]
+        for i in range(len(source)):
+            src = source[i] if isinstance(source[i], str) else source[i][0]
+            checksum = sha3sums[i] if i < len(sha3sums) else None
+            if src.startswith('file:'):
+                src = src[5:]
+                if src.startswith('//'):
+                    src = src[2:]
+            elif ':' in src:
+                # The content of remote sources is only known from their sum
+                if checksum is None:
+                    return None
+                inputs.append(checksum.lower())
+                continue
+            src = os.path.join(scrolldir, src)
+            if not os.path.isfile(src):
+                return None
+            inputs.append(CacheStore.digest(src))
+        inputs += [CacheStore.digest(patch) for patch in sorted(patches)]
+        return hashlib.sha3_256('\0'.join(inputs).encode('utf-8')).hexdigest()
+    
+    
+    def contains(self, key):
+        '''
+        Check whether a package is cached
+        
+        @param   key:str?  The address of the package, `None` if it cannot be cached
+        @return  :bool     Whether the package is cached
+        '''
+        return (key is not None) and os.path.isdir(self.directory + key + os.sep + 'pkg')
+    
+    
+    def get(self, key, pkgdir):
+        '''
+        Place a cached package in a package directory, replacing its content
+        
+        @param   key:str?    The address of the package, `None` if it cannot be cached
+        @param   pkgdir:str  The package directory
+        @return  :bool       Whether the package was cached
+        '''
+        if not self.contains(key):
+            return False
+        try:
+            if os.path.lexists(pkgdir):
+                shutil.rmtree(pkgdir)
+            PackageCache.link_tree(self.directory + key + os.sep + 'pkg', pkgdir)
+            # Mark the package as recently used
+            os.utime(self.directory + key)
+            return True
+        except:
+            if os.getenv('SPIKE_DEBUG', '').lower() == 'yes':
+                import traceback
+                traceback.print_exc()
+            if os.path.lexists(pkgdir):
+                shutil.rmtree(pkgdir)
+            os.mkdir(pkgdir)
+            return False
+    
+    
+    def put(self, key, pkgdir):
+        '''
+        Cache a package, failure is silently ignored
+        
+        @param  key:str?    The address of the package, `None` if it cannot be cached
+        @param  pkgdir:str  The package directory, the files in it must not be modified afterwards
+        '''
+        if (key is None) or self.contains(key):
+            return
+        entry = self.directory + key
+        temp = '%s.%i.%i~' % (entry, os.getpid(), threading.get_ident())
+        try:
+            if not os.path.exists(self.directory):
+                dragonsuite.mkdir_p(self.directory)
+            os.mkdir(temp)
+            size = PackageCache.link_tree(pkgdir, temp + os.sep + 'pkg')
+            with open(temp + os.sep + 'size', 'wb') as file:
+                file.write(str(size).encode('utf-8'))
+            os.rename(temp, entry)
+            self.evict()
+        except:
+            if os.path.lexists(temp):
+                shutil.rmtree(temp)
+    
+    
+    def evict(self):
+        '''
+        Remove the least recently used packages until the cache is small enough
+        '''
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('~'):
+                entry = self.directory + name
+                try:
+                    with open(entry + os.sep + 'size', 'rb') as file:
+                        size = int(file.read().decode('utf-8'))
+                except:
+                    size = 0
+                entries.append((os.stat(entry).st_mtime_ns, size, name))
+        total = sum(size for (_mtime, size, _name) in entries)
+        for (_mtime, size, name) in sorted(entries):
+            if total <= self.size:
+                break
+            shutil.rmtree(self.directory + name)
+            total -= size
+    
+    
+    @staticmethod
+    def link_tree(source, dest):
+        '''
+        Recreate a directory tree with hard links to the files in it rather
+        than copies of them where possible, see `SourceCache.copy`
+        
+        @param   source:str  The directory
+        @param   dest:str    The new directory, must not exist
+        @return  :int        The total size of the files in the tree
+        '''
+        size = 0
+        directories = []
+        for (directory, dirnames, filenames) in os.walk(source):
+            target = dest + directory[len(source):]
+            os.mkdir(target)
+            directories.append((directory, target))
+            for name in list(dirnames):
+                if os.path.islink(directory + os.sep + name):
+                    # Links to directories are recreated rather than followed
+                    dirnames.remove(name)
+                    filenames.append(name)
+            for name in filenames:
+                (file, link) = (directory + os.sep + name, target + os.sep + name)
+                if os.path.islink(file):
+                    os.symlink(os.readlink(file), link)
+                    if os.geteuid() == 0:
+                        stat = os.lstat(file)
+                        os.lchown(link, stat.st_uid, stat.st_gid)
+                else:
+                    try:
+                        os.link(file, link)
+                    except OSError:
+                        SourceCache.copy(file, link)
+                    size += os.lstat(link).st_size
+        # Set the metadata of the directories after their content has been created
+        for (directory, target) in reversed(directories):
+            shutil.copystat(directory, target)
+            if os.geteuid() == 0:
+                stat = os.stat(directory)
+                os.chown(target, stat.st_uid, stat.st_gid)
+        return size
+
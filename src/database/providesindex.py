@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+spike – a package manager running on top of git
+
+Copyright © 2012, 2013, 2014  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import os
+
+from database.cachestore import *
+
+
+
+class ProvidesIndex():
+    '''
+    Persistent index from provided scroll names to the scrolls that provides them,
+    so that providers can be selected without reading every scroll in the repositories
+    '''
+    
+    def __init__(self, spike_path):
+        '''
+        Constructor
+        
+        @param  spike_path:str  The path for Spike
+        '''
+        self.store = CacheStore(spike_path, 'providesindex')
+        self.entries = self.store.load()
+        if not isinstance(self.entries, dict):
+            self.entries = {}
+        self.modified = False
+        
+        # Map each provided name to the scrolls that provides it
+        self.names = {}
+        for scrollfile in self.entries:
+            self.map(scrollfile)
+    
+    
+    @staticmethod
+    def name(scroll):
+        '''
+        Get the name of a scroll with version range
+        
+        @param   scroll:str  The scroll with version range
+        @return  :str        The name of the scroll
+        '''
+        for c in '<>=':
+            if c in scroll:
+                scroll = scroll[:scroll.find(c)]
+        return scroll
+    
+    
+    def map(self, scrollfile):
+        '''
+        Add a scroll in the index to the name map
+        
+        @param  scrollfile:str  The scroll file
+        '''
+        for provides in self.entries[scrollfile][3]:
+            name = ProvidesIndex.name(provides)
+            if name not in self.names:
+                self.names[name] = set()
+            self.names[name].add(scrollfile)
+    
+    
+    def unmap(self, scrollfile):
+        '''
+        Remove a scroll in the index from the name map
+        
+        @param  scrollfile:str  The scroll file
+        '''
+        for provides in self.entries[scrollfile][3]:
+            name = ProvidesIndex.name(provides)
+            if name in self.names:
+                self.names[name].discard(scrollfile)
+                if len(self.names[name]) == 0:
+                    del self.names[name]
+    
+    
+    def refresh(self, scrollfiles, loader):
+        '''
+        Bring the index up to date, only scrolls that have been modified are read
+        
+        @param  scrollfiles:itr<str>           All available scroll files
+        @param  loader:(str)→(str, list<str>)  Function that reads the scroll, with version, and
+                                               the scrolls, with version ranges, it provides
+        '''
+        scrollfiles = set(scrollfiles)
+        environment = CacheStore.environment()
+        
+        # Forget scrolls that are no longer available
+        for scrollfile in [file for file in self.entries if file not in scrollfiles]:
+            self.unmap(scrollfile)
+            del self.entries[scrollfile]
+            self.modified = True
+        
+        # Reread scrolls that are new or modified
+        for scrollfile in scrollfiles:
+            identity = CacheStore.identity(scrollfile)
+            if scrollfile in self.entries:
+                entry = self.entries[scrollfile]
+                if (entry[0] == identity) and (entry[1] == environment):
+                    continue
+                self.unmap(scrollfile)
+                del self.entries[scrollfile]
+            (scroll, provides) = loader(scrollfile)
+            self.entries[scrollfile] = (identity, environment, scroll, list(provides))
+            self.map(scrollfile)
+            self.modified = True
+    
+    
+    def lookup(self, name):
+        '''
+        Get the scrolls that provides a scroll
+        
+        @param   name:str                The name of the provided scroll
+        @return  :list<(str, str, str)>  The provided scroll, with version range, the providing
+                                         scroll, with version, and its file, for each provision
+        '''
+        rc = []
+        for scrollfile in sorted(self.names[name] if name in self.names else []):
+            (_identity, _environment, scroll, provides) = self.entries[scrollfile]
+            for provision in provides:
+                if ProvidesIndex.name(provision) == name:
+                    rc.append((provision, scroll, scrollfile))
+        return rc
+    
+    
+    def save(self):
+        '''
+        Store the index, if it has been modified
+        '''
+        if self.modified:
+            self.store.save(self.entries)
+            self.modified = False
+
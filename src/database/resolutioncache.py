@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+spike – a package manager running on top of git
+
+Copyright © 2012, 2013, 2014  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import marshal
+import hashlib
+
+from database.cachestore import *
+
+
+
+RESOLUTION_CACHE_SIZE = 32
+'''
+The number of resolutions to remember
+'''
+
+
+
+class ResolutionCache():
+    '''
+    Persistent cache of resolved installation plans, keyed by the request,
+    the state of the installed scrolls and the repositories, and the environment
+    '''
+    
+    def __init__(self, spike_path):
+        '''
+        Constructor
+        
+        @param  spike_path:str  The path for Spike
+        '''
+        self.store = CacheStore(spike_path, 'resolution')
+        self.plans = self.store.load()
+        if not isinstance(self.plans, list):
+            self.plans = []
+        self.modified = False
+    
+    
+    @staticmethod
+    def key(request, fingerprints):
+        '''
+        Create a key for a resolution
+        
+        @param   request:tuple                 The request, must be serialisable with `marshal`
+        @param   fingerprints:itr<(str, str)>  The directory and the fingerprint of each repository, the installed scrolls
+                                               are included with the empty string as their directory
+        @return  :str                          The key
+        '''
+        state = (request, sorted(fingerprints), CacheStore.environment())
+        return hashlib.sha3_256(marshal.dumps(state)).hexdigest()
+    
+    
+    def get(self, key):
+        '''
+        Get a remembered plan
+        
+        @param   key:str  The key of the resolution
+        @return  :¿E?     The plan, `None` if not remembered
+        '''
+        for (k, plan) in self.plans:
+            if k == key:
+                return plan
+        return None
+    
+    
+    def put(self, key, plan):
+        '''
+        Remember a plan, the least recently remembered plan is forgotten if the cache is full
+        
+        @param  key:str   The key of the resolution
+        @param  plan:¿E?  The plan, must be serialisable with `marshal`
+        '''
+        self.plans = [(k, p) for (k, p) in self.plans if k != key]
+        self.plans.append((key, plan))
+        self.plans = self.plans[-RESOLUTION_CACHE_SIZE:]
+        self.modified = True
+    
+    
+    def save(self):
+        '''
+        Store the cache, if it has been modified
+        '''
+        if self.modified:
+            self.store.save(self.plans)
+            self.modified = False
+
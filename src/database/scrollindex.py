@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+spike – a package manager running on top of git
+
+Copyright © 2012, 2013, 2014  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import os
+import marshal
+import threading
+
+from database.cachestore import *
+
+
+
+class ScrollIndex():
+    '''
+    Persistent index of the information fields in scrolls, so that
+    scrolls only need to be executed when they have been modified
+    '''
+    
+    def __init__(self, spike_path):
+        '''
+        Constructor
+        
+        @param  spike_path:str  The path for Spike
+        '''
+        self.store = CacheStore(spike_path, 'scrollindex')
+        self.entries = self.store.load()
+        if not isinstance(self.entries, dict):
+            self.entries = {}
+        self.modified = False
+        self.mutex = threading.Lock()
+    
+    
+    def get(self, scrollfile, loader):
+        '''
+        Get the information fields in a scroll
+        
+        @param   scrollfile:str               The scroll file
+        @param   loader:(str)→dict<str, ¿E?>  Function that reads the fields from a scroll file
+        @return  :dict<str, ¿E?>              The value of each field
+        '''
+        identity = CacheStore.identity(scrollfile)
+        environment = CacheStore.environment()
+        with self.mutex:
+            entry = self.entries[scrollfile] if scrollfile in self.entries else None
+        if (entry is not None) and (entry[2] == environment):
+            # Reuse if the file has not been touched
+            if entry[0] == identity:
+                return ScrollIndex.copy(entry[3])
+            # Reuse if the file has been touched but not modified
+            digest = CacheStore.digest(scrollfile)
+            if entry[1] == digest:
+                with self.mutex:
+                    self.entries[scrollfile] = (identity, digest, environment, entry[3])
+                    self.modified = True
+                return ScrollIndex.copy(entry[3])
+        else:
+            digest = CacheStore.digest(scrollfile)
+        
+        fields = loader(scrollfile)
+        try:
+            # Only index fields that can be stored
+            marshal.dumps(fields)
+        except ValueError:
+            return fields
+        with self.mutex:
+            self.entries[scrollfile] = (identity, digest, environment, ScrollIndex.copy(fields))
+            self.modified = True
+        return fields
+    
+    
+    def digest(self, scrollfile):
+        '''
+        Get the hash of the content of a scroll, from the index if the file has not been touched
+        
+        @param   scrollfile:str  The scroll file
+        @return  :str            The hash of the scroll in hexadecimal
+        '''
+        identity = CacheStore.identity(scrollfile)
+        with self.mutex:
+            entry = self.entries[scrollfile] if scrollfile in self.entries else None
+        if (entry is not None) and (entry[0] == identity):
+            return entry[1]
+        return CacheStore.digest(scrollfile)
+    
+    
+    def version(self, scrollfile):
+        '''
+        Get the version of the information about a scroll in the index
+        
+        @param   scrollfile:str  The scroll file
+        @return  :(str, str)?    The digest of the scroll and the environment it was read in, `None` if not indexed
+        '''
+        with self.mutex:
+            if scrollfile not in self.entries:
+                return None
+            entry = self.entries[scrollfile]
+            return (entry[1], entry[2])
+    
+    
+    def save(self):
+        '''
+        Store the index, if it has been modified
+        '''
+        with self.mutex:
+            if self.modified:
+                for scrollfile in [file for file in self.entries if not os.path.exists(file)]:
+                    del self.entries[scrollfile]
+                self.store.save(self.entries)
+                self.modified = False
+    
+    
+    @staticmethod
+    def copy(fields):
+        '''
+        Copy the fields in a scroll so that modifications are not made to the index
+        
+        @param   fields:dict<str, ¿E?>  The value of each field
+        @return  :dict<str, ¿E?>        Copy of `fields`
+        '''
+        return dict((field, list(value) if isinstance(value, list) else value) for (field, value) in fields.items())
+
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+spike – a package manager running on top of git
+
+Copyright © 2012, 2013, 2014  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import os
+import shutil
+import hashlib
+import threading
+
+import dragonsuite
+from database.cachestore import *
+
+
+
+SOURCE_CACHE_SIZE = 4 << 30
+'''
+The maximum total size, in bytes, of the cached sources
+'''
+
+
+
+class SourceCache():
+    '''
+    Content addressed cache of downloaded sources, shared between builds and
+    installation roots, the least recently used sources are evicted when the
+    cache grows too large
+    
+    Sources are addressed by their SHA3 sum, or if the scroll does not have
+    one, by their URL and the entity tag the server reports for them
+    
+    Sources are copied, or reflinked, in and out of the cache, never hard linked,
+    so that builds that modify their sources do not modify the cached sources
+    
+    @variable  directory:str          The directory of the cache, with a trailing slash
+    @variable  size:int               The maximum total size, in bytes, of the cached sources
+    @variable  etags:dict<str, str?>  URL → entity tag, for the remote files whose entity tag has been requested
+    '''
+    
+    def __init__(self, spike_path, size = SOURCE_CACHE_SIZE):
+        '''
+        Constructor
+        
+        @param  spike_path:str  The path for Spike, without installation root
+        @param  size:int        The maximum total size, in bytes, of the cached sources
+        '''
+        self.directory = CacheStore.directory(spike_path) + 'sources' + os.sep
+        self.size = size
+        self.etags = {}
+        self.mutex = threading.Lock()
+    
+    
+    @staticmethod
+    def etag(url):
+        '''
+        Get the entity tag for a remote file
+        
+        @param   url:str  The URL of the file
+        @return  :str?    The entity tag, `None` if not available
+        '''
+        if not (url.startswith('http://') or url.startswith('https://')):
+            return None
+        try:
+            import urllib.request
+            request = urllib.request.Request(url, method = 'HEAD')
+            with urllib.request.urlopen(request, timeout = 30) as response:
+                return response.headers.get('ETag', None)
+        except:
+            return None
+    
+    
+    def resolve(self, urls):
+        '''
+        Request the entity tags of remote files concurrently, so that `key` need not wait for them
+        
+        @param  urls:itr<str>  The URL of each file, that does not have a SHA3 sum
+        '''
+        with self.mutex:
+            urls = set(url for url in urls if url not in self.etags)
+        if len(urls) == 0:
+            return
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers = min(len(urls), 8)) as executor:
+            etags = dict(zip(urls, executor.map(SourceCache.etag, urls)))
+        with self.mutex:
+            self.etags.update(etags)
+    
+    
+    def key(self, url, checksum):
+        '''
+        Get the address of a source
+        
+        @param   url:str        The URL of the source
+        @param   checksum:str?  The SHA3 sum of the source, in hexadecimal, `None` if not specified by the scroll
+        @return  :str?          The address of the source, `None` if it cannot be cached
+        '''
+        if checksum is not None:
+            return 'sha3-' + checksum.lower()
+        with self.mutex:
+            etag = self.etags[url] if url in self.etags else None
+            known = url in self.etags
+        if not known:
+            etag = SourceCache.etag(url)
+            with self.mutex:
+                self.etags[url] = etag
+        if etag is None:
+            return None
+        return 'etag-' + hashlib.sha3_256(('%s\0%s' % (url, etag)).encode('utf-8')).hexdigest()
+    
+    
+    def get(self, key, dest):
+        '''
+        Place a cached source in a build directory
+        
+        @param   key:str   The address of the source
+        @param   dest:str  The file to which to place the source
+        @return  :bool     Whether the source was cached
+        '''
+        file = self.directory + key
+        try:
+            if not os.path.exists(file):
+                return False
+            if os.path.lexists(dest):
+                os.unlink(dest)
+            SourceCache.copy(file, dest)
+            # Mark the source as recently used
+            os.utime(file)
+            return True
+        except:
+            return False
+    
+    
+    def put(self, key, source):
+        '''
+        Cache a source, failure is silently ignored
+        
+        @param  key:str     The address of the source
+        @param  source:str  The file with the source
+        '''
+        file = self.directory + key
+        temp = '%s.%i.%i~' % (file, os.getpid(), threading.get_ident())
+        try:
+            if os.path.exists(file):
+                return
+            if not os.path.exists(self.directory):
+                dragonsuite.mkdir_p(self.directory)
+            SourceCache.copy(source, temp)
+            os.rename(temp, file)
+            self.evict()
+        except:
+            if os.path.lexists(temp):
+                os.unlink(temp)
+    
+    
+    def discard(self, key):
+        '''
+        Remove a source from the cache, failure is silently ignored
+        
+        @param  key:str  The address of the source
+        '''
+        try:
+            os.unlink(self.directory + key)
+        except:
+            pass
+    
+    
+    def evict(self):
+        '''
+        Remove the least recently used sources until the cache is small enough
+        '''
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('~'):
+                stat = os.stat(self.directory + name)
+                entries.append((stat.st_mtime_ns, stat.st_size, name))
+        total = sum(size for (_mtime, size, _name) in entries)
+        for (_mtime, size, name) in sorted(entries):
+            if total <= self.size:
+                break
+            os.unlink(self.directory + name)
+            total -= size
+    
+    
+    @staticmethod
+    def copy(source, dest):
+        '''
+        Copy a file, by reflinking it if the file system supports it, so that
+        the data is not duplicated until either of the files is modified
+        
+        @param  source:str  The file
+        @param  dest:str    The new file
+        '''
+        with open(source, 'rb') as ifile:
+            with open(dest, 'wb') as ofile:
+                try:
+                    import fcntl
+                    FICLONE = 0x40049409 # Linux's ioctl request for reflinking
+                    fcntl.ioctl(ofile.fileno(), FICLONE, ifile.fileno())
+                except:
+                    shutil.copyfileobj(ifile, ofile)
+        shutil.copystat(source, dest)
+
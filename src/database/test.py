@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+spike – a package manager running on top of git
+
+Copyright © 2012, 2013, 2014  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+'''
+Test for this directory
+'''
+import os
+import sys
+import shutil
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database.catalogue import *
+from database.sourcecache import *
+
+
+errno = 0
+def error(message, ok = False):
+    global errno
+    if not ok:
+        errno = 2
+        print('\033[31m%s\033[00m' % message)
+
+
+
+
+directory = tempfile.mkdtemp()
+os.environ['SPIKE_PATH'] = directory + '/spike'
+os.environ['HOME'] = directory + '/home'
+repository = directory + '/repository'
+os.makedirs(repository + '/core')
+os.makedirs(directory + '/spike/var')
+open(repository + '/core/example.scroll', 'w').close()
+open(repository + '/core/.hidden.scroll', 'w').close()
+
+catalogue = Catalogue.get(repository)
+error('Catalogue.get did not catalogue the repository', catalogue.files() == [('core', 'example', repository + '/core/example.scroll')])
+error('Catalogue is not valid after Catalogue.get', catalogue.valid())
+error('Catalogue was not stored outside the repository', os.listdir(repository) == ['core'])
+error('Stored catalogue is not valid', Catalogue(repository).valid())
+
+open(repository + '/core/new.scroll', 'w').close()
+error('Catalogue is valid after a scroll was added', not Catalogue(repository).valid())
+del Catalogue.catalogues[repository]
+error('Catalogue.get did not recatalogue the repository', Catalogue.get(repository).lookup('new') == {'core' : repository + '/core/new.scroll'})
+
+del Catalogue.catalogues[repository]
+os.makedirs(repository + '/extra')
+for i in range(100):
+    open(repository + '/extra/scroll-%i.scroll' % i, 'w').close()
+found = []
+threads = [threading.Thread(target = lambda : found.append(len(Catalogue.get(repository).files()))) for _ in range(8)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+error('Catalogue.get returned a partial catalogue to concurrent callers', found == [102] * 8)
+
+
+cache = SourceCache(directory + '/spike')
+with open(directory + '/source', 'wb') as file:
+    file.write(b'source')
+cache.put('sha3-source', directory + '/source')
+error('SourceCache.get did not place the source', cache.get('sha3-source', directory + '/placed'))
+with open(directory + '/placed', 'ab') as file:
+    file.write(b' modified by a build')
+error('SourceCache.get placed a source that shares its content with the cache',
+      open(cache.directory + 'sha3-source', 'rb').read() == b'source')
+cache.discard('sha3-source')
+error('SourceCache.discard did not remove the source', not cache.get('sha3-source', directory + '/placed'))
+
+shutil.rmtree(directory)
+
+
+
+
+if errno == 0:
+    print('\033[32m%s\033[00m' % 'Everyting seems to be working')
+exit(errno)
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+spike – a package manager running on top of git
+
+Copyright © 2012, 2013, 2014  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import os
+import re
+
+from database.cachestore import *
+
+
+
+TRIGRAM_FIELDS = ['pkgdesc', 'groups', 'provides']
+'''
+The scroll fields that are indexed for full-text search
+'''
+
+
+
+class TrigramIndex():
+    '''
+    Persistent inverted index from trigrams to scrolls whose information contains them
+    '''
+    
+    def __init__(self, spike_path):
+        '''
+        Constructor
+        
+        @param  spike_path:str  The path for Spike
+        '''
+        self.store = CacheStore(spike_path, 'trigramindex')
+        data = self.store.load()
+        (self.docs, self.postings) = data if isinstance(data, tuple) else ({}, {})
+        self.ids = dict((self.docs[id][0], id) for id in self.docs)
+        self.next_id = max(list(self.docs.keys()) + [-1]) + 1
+        self.modified = False
+    
+    
+    @staticmethod
+    def trigrams(text):
+        '''
+        Get the trigrams in a text
+        
+        @param   text:str   The text
+        @return  :set<str>  The trigrams in the text
+        '''
+        return set(text[i : i + 3] for i in range(len(text) - 2))
+    
+    
+    @staticmethod
+    def required_trigrams(pattern):
+        '''
+        Get trigrams that any text matching a pattern must contain
+        
+        @param   pattern:str  Regular expression search pattern
+        @return  :set<str>    Trigrams, texts matching the pattern contains all of them
+        '''
+        # Inline flags, such as case-insensitivity, and top-level alternation can make any text match
+        if re.search(r'\(\?[aiLmsux]', pattern) is not None:
+            return set()
+        # Collect literal runs outside groups and classes
+        (runs, run, depth, i, n) = ([], '', 0, 0, len(pattern))
+        while i < n:
+            (c, literal) = (pattern[i], None)
+            if c == '\\':
+                if (i + 1 < n) and not pattern[i + 1].isalnum():
+                    literal = pattern[i + 1]
+                i += 2
+            elif c in '[{':
+                # Skip character class or repetition count
+                end = ']' if c == '[' else '}'
+                i += 1
+                if (c == '[') and (i < n) and (pattern[i] == '^'):
+                    i += 1
+                if (c == '[') and (i < n) and (pattern[i] == ']'):
+                    i += 1
+                while (i < n) and (pattern[i] != end):
+                    i += 2 if pattern[i] == '\\' else 1
+                i += 1
+            elif c == '(':
+                depth += 1
+                i += 1
+            elif c == ')':
+                depth -= 1
+                i += 1
+            elif (c == '|') and (depth == 0):
+                return set()
+            else:
+                if c not in '.^$*+?}':
+                    literal = c
+                i += 1
+            # A literal that may be repeated zero times is not required
+            optional = (i < n) and (pattern[i] in '*?{')
+            if (literal is not None) and (depth == 0) and not optional:
+                run += literal
+            else:
+                runs.append(run)
+                run = ''
+        runs.append(run)
+        rc = set()
+        for run in runs:
+            rc |= TrigramIndex.trigrams(run)
+        return rc
+    
+    
+    def stale(self, scrollfiles):
+        '''
+        Find the scrolls whose indexed information is out of date, by comparing
+        the scrolls' modification times with those recorded in the index
+        
+        @param   scrollfiles:itr<str>      The scroll files
+        @return  :list<(str, ((int, int, int), str)?)>  The scroll file and its version, `None` if it cannot be
+                                                         read, for each scroll that is out of date
+        '''
+        environment = CacheStore.environment()
+        rc = []
+        for scrollfile in scrollfiles:
+            try:
+                version = (CacheStore.identity(scrollfile), environment)
+            except:
+                version = None
+            if (version is None) or (scrollfile not in self.ids) or (self.docs[self.ids[scrollfile]][1] != version):
+                rc.append((scrollfile, version))
+        return rc
+    
+    
+    def update(self, scrollfile, version, fields):
+        '''
+        Add or update the indexed information about a scroll
+        
+        @param  scrollfile:str                   The scroll file
+        @param  version:((int, int, int), str)?  The version of the scroll's information, as returned by `stale`,
+                                                 `None` if it cannot be compared
+        @param  fields:dict<str, ¿E?>            The value of each field in the scroll
+        '''
+        if scrollfile in self.ids:
+            id = self.ids[scrollfile]
+            if (version is not None) and (self.docs[id][1] == version):
+                return
+            self.remove(scrollfile)
+        values = []
+        for field in TRIGRAM_FIELDS:
+            value = fields[field] if field in fields else None
+            for v in value if isinstance(value, list) else [value]:
+                if isinstance(v, str):
+                    values.append((field, v))
+        id = self.next_id
+        self.next_id += 1
+        self.ids[scrollfile] = id
+        self.docs[id] = (scrollfile, version, values)
+        for (_field, value) in values:
+            for trigram in TrigramIndex.trigrams(value):
+                if trigram not in self.postings:
+                    self.postings[trigram] = set()
+                self.postings[trigram].add(id)
+        self.modified = True
+    
+    
+    def remove(self, scrollfile):
+        '''
+        Remove a scroll from the index
+        
+        @param  scrollfile:str  The scroll file
+        '''
+        if scrollfile not in self.ids:
+            return
+        id = self.ids[scrollfile]
+        for (_field, value) in self.docs[id][2]:
+            for trigram in TrigramIndex.trigrams(value):
+                if trigram in self.postings:
+                    self.postings[trigram].discard(id)
+                    if len(self.postings[trigram]) == 0:
+                        del self.postings[trigram]
+        del self.docs[id]
+        del self.ids[scrollfile]
+        self.modified = True
+    
+    
+    def search(self, patterns, scrollfiles):
+        '''
+        Search for scrolls whose indexed information matches any of a set of patterns
+        
+        @param   patterns:itr<str>       Regular expression search patterns
+        @param   scrollfiles:set<str>    The scrolls to search among
+        @return  :list<(str, str, str)>  The file, the field and the field value for each matching scroll, every scroll is listed once
+        '''
+        matches = {}
+        for pattern in patterns:
+            regex = re.compile(pattern)
+            # Find candidates by intersecting the posting lists
+            candidates = None
+            for trigram in sorted(TrigramIndex.required_trigrams(pattern), key = lambda t : len(self.postings.get(t, ()))):
+                posting = self.postings[trigram] if trigram in self.postings else set()
+                candidates = set(posting) if candidates is None else (candidates & posting)
+                if len(candidates) == 0:
+                    break
+            candidates = self.docs.keys() if candidates is None else candidates
+            # Verify candidates
+            for id in candidates:
+                (scrollfile, _version, values) = self.docs[id]
+                if (scrollfile in matches) or (scrollfile not in scrollfiles):
+                    continue
+                for (field, value) in values:
+                    if regex.search(value) is not None:
+                        matches[scrollfile] = (scrollfile, field, value)
+                        break
+        return [matches[scrollfile] for scrollfile in sorted(matches.keys())]
+    
+    
+    def save(self):
+        '''
+        Store the index, if it has been modified
+        '''
+        if self.modified:
+            for scrollfile in [file for file in self.ids if not os.path.exists(file)]:
+                self.remove(scrollfile)
+            self.store.save((self.docs, self.postings))
+            self.modified = False
+
@@ -774,6 +774,52 @@ def cp_r(source, destination):
     cp(source, destination, True)
 
 
+def __copy_file(ifd, ofd):
+    '''
+    Copy the content of a file, without passing it through userspace when possible
+    
+    The file is reflinked if the file system supports it, otherwise it is copied in the
+    kernel with `copy_file_range` or `sendfile`, and as a last resort with read and write
+    
+    @param  ifd:int  The file descriptor of the file to copy, at its beginning
+    @param  ofd:int  The file descriptor of the new file, which must be empty
+    '''
+    try:
+        import fcntl
+        FICLONE = 0x40049409 # Linux's ioctl request for reflinking
+        fcntl.ioctl(ofd, FICLONE, ifd)
+        return
+    except:
+        pass
+    stat = os.fstat(ifd)
+    (size, blksize) = (stat.st_size, max(stat.st_blksize, 1 << 16))
+    copied = 0
+    # Files in pseudo file systems report their size as zero and must be read
+    for copy in ('copy_file_range', 'sendfile') if size > 0 else ():
+        if not hasattr(os, copy):
+            continue
+        try:
+            while True:
+                if copy == 'copy_file_range':
+                    n = os.copy_file_range(ifd, ofd, min(size - copied, 1 << 30))
+                else:
+                    n = os.sendfile(ofd, ifd, None, min(size - copied, 1 << 30))
+                if n == 0:
+                    return
+                copied += n
+        except OSError:
+            # The kernel or the file system does not support the system call, unless data
+            # has already been copied, in which case it is a real error, such as a full disc
+            if copied > 0:
+                raise
+    while True:
+        chunk = os.read(ifd, blksize)
+        if len(chunk) == 0:
+            break
+        while len(chunk) > 0:
+            chunk = chunk[os.write(ofd, chunk):]
+
+
 def install(source, destination, owner = -1, group = -1, mode = -1, strip = False, directory = False, parents = True, recursive = True, savemode = True):
     '''
     Copies files and set attributes
@@ -837,20 +883,11 @@ def install(source, destination, owner = -1, group = -1, mode = -1, strip = Fals
         elif os.path.islink(src):
             ln(os.readlink(src), dest)
         else:
-            blksize = 8192
-            try:
-                blksize = os.stat(os.path.realpath(ifile)).st_blksize
-            except:
-                pass
             with open(src, 'rb') as ifile:
                 if parents and not os.path.lexists(dirname(dest)):
                     mkdir_p(dirname(dest))
                 with open(dest, 'wb') as ofile:
-                    while True:
-                        chunk = ifile.read(blksize)
-                        if len(chunk) == 0:
-                            break
-                        ofile.write(chunk)
+                    __copy_file(ifile.fileno(), ofile.fileno())
         (u, g) = (owner, group)
         if (isinstance(u, str) or (u != -1) or isinstance(g, str) or (g != -1)):
             stat = os.lstat(dest) if directory else os.lstat(src)
@@ -867,6 +904,105 @@ def install(source, destination, owner = -1, group = -1, mode = -1, strip = Fals
             install(sources, dest, owner, group, mode, strip, False, False, True, savemode)
 
 
+def install_tree(source, destination, owner = -1, group = -1, savemode = True, jobs = None):
+    '''
+    Copies the content of a directory into another directory, merging it with the directory's existing
+    content, like `install` but scanning the directory once and copying files concurrently
+    
+    @param   source:str       The directory whose content to copy
+    @param   destination:str  The directory to copy the content into, it is created if missing
+    @param   owner:int|str    The new owner, `-1` for preserved
+    @param   group:int|str    The new group, `-1` for preserved, `-2` to select by owner
+    @param   savemode:bool    Whether to use the protection bits of already installed versions
+    @param   jobs:int?        The number of files to copy concurrently, `None` for the number of CPU:s
+    @return  :list<str>       The installed files, symbolic links and directories that did not already exist
+    '''
+    __print('install -T %s -D -r%s%s%s %s/*' % (destination,
+                                                ' --savemode' if savemode else '',
+                                                ('' if owner == -1 else (' -u ' + str(owner))) if isinstance(owner, int) else (' -u ' + owner),
+                                                ('' if group == -1 else (' -g $' if group == -2 else (' -g ' + str(group)))) if isinstance(group, int) else (' -g ' + group),
+                                                source))
+    # Paths in the directories are joined with the directories as `directory + os.sep + path`,
+    # so the root directory becomes the empty string
+    (source, destination) = (source.rstrip(os.sep), destination.rstrip(os.sep))
+    
+    # Scan the directory once, parents are listed before their content
+    (directories, files, links) = ([], [], [])
+    stack = ['']
+    while len(stack) > 0:
+        relative = stack.pop()
+        with os.scandir((source + relative) or os.sep) as entries:
+            for entry in entries:
+                path = relative + os.sep + entry.name
+                if entry.is_symlink():
+                    links.append((path, os.readlink(entry.path), entry.stat(follow_symlinks = False)))
+                elif entry.is_dir():
+                    directories.append((path, entry.stat()))
+                    stack.append(path)
+                else:
+                    files.append((path, entry.stat()))
+    
+    # Create the directories up front, existing directories keep their protection bits if `savemode`, and their ownership
+    (manifest, modes, created) = ([], [], [])
+    if not os.path.lexists(destination or os.sep):
+        mkdir_p(destination)
+    for (path, stat) in directories:
+        dest = destination + path
+        if os.path.isdir(dest):
+            if not savemode:
+                modes.append((dest, stat.st_mode))
+        else:
+            if os.path.lexists(dest):
+                os.unlink(dest)
+            os.mkdir(dest, 0o700)
+            modes.append((dest, stat.st_mode))
+            created.append((path, stat))
+            manifest.append(dest)
+    
+    # Copy the regular files concurrently, and recreate the symbolic links
+    def copy(job):
+        (path, stat) = job
+        dest = destination + path
+        protection = stat.st_mode
+        if os.path.islink(dest):
+            # Do not write through a symbolic link that is being replaced by a file
+            os.unlink(dest)
+        elif savemode and os.path.lexists(dest):
+            protection = os.lstat(dest).st_mode
+        with open(source + path, 'rb') as ifile:
+            with open(dest, 'wb') as ofile:
+                __copy_file(ifile.fileno(), ofile.fileno())
+        return (dest, protection)
+    if len(files) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(min(len(files), jobs or os.cpu_count() or 1)) as pool:
+            copied = list(pool.map(copy, files))
+    else:
+        copied = [copy(job) for job in files]
+    for (path, target, _stat) in links:
+        dest = destination + path
+        if os.path.lexists(dest):
+            os.unlink(dest)
+        os.symlink(target, dest)
+    
+    # Apply ownership and protection bits, directories last so that they can be read-only
+    if isinstance(owner, str) or (owner != -1) or isinstance(group, str) or (group != -1):
+        u = owner if isinstance(owner, str) or (owner != -1) else None
+        g = group if isinstance(group, str) or (group != -1) else None
+        u = usermodule.getpwnam(u).pw_uid if isinstance(u, str) else u
+        g = groupmodule.getgrnam(g).gr_gid if isinstance(g, str) else g
+        for (path, stat) in files + [(path, stat) for (path, _target, stat) in links] + created:
+            uid = stat.st_uid if u is None else u
+            gid = stat.st_gid if g is None else (usermodule.getpwuid(uid).pw_gid if g == -2 else g)
+            os.lchown(destination + path, uid, gid)
+    for (dest, protection) in copied + modes[::-1]:
+        os.chmod(dest, protection)
+    
+    manifest += [dest for (dest, _protection) in copied]
+    manifest += [destination + path for (path, _target, _stat) in links]
+    return manifest
+
+
 def find(path, maxdepth = -1, hardlinks = True):
     '''
     Gets all existing subfiles, does not follow links including hardlinks
@@ -1112,18 +1248,158 @@ def path(exprs, existing = False):
     return rc[0] if len(rc) == 1 else rc
 
 
-def decompress(path, format = None):
+_dragonsuite_decompress_commands = {'gz' : 'gzip -d %s',
+                                    'bz' : 'bzip2 -d %s',
+                                    'bz2' : 'bzip2 -d %s',
+                                    'xz' : 'xz -d %s',
+                                    'lzma' : 'lzma -d %s',
+                                    'lrz' : 'lrzip -d %s',
+                                    'lz' : 'lzip -d %s',
+                                    'lzop' : 'lzop -d %s',
+                                    'z' : 'unzip %s',
+                                    'tar' : 'tar --get < %s',
+                                    'tgz' : 'tar --gzip --get < %s',
+                                    'targz' : 'tar --gzip --get < %s',
+                                    'tarbz' : 'tar --bzip2 --get < %s',
+                                    'tarbz2' : 'tar --bzip2 --get < %s',
+                                    'tarxz' : 'tar --xz --get < %s',
+                                    'tarlzma' : 'tar --lzma --get < %s',
+                                    'tarlz' : 'tar --lzip --get < %s',
+                                    'tarlzop' : 'tar --lzop --get < %s',
+                                    'tarlrz' : 'lrzip -d < %s | tar --get',
+                                    'cpio' : 'cpio --extract < %s',
+                                    'cpiogz' : 'gzip -d < %s | cpio --extract',
+                                    'cpiobz' : 'bzip2 -d < %s | cpio --extract',
+                                    'cpiobz2' : 'bzip2 -d < %s | cpio --extract',
+                                    'cpioxz' : 'xz -d < %s | cpio --extract',
+                                    'cpiolzma' : 'lzma -d < %s | cpio --extract',
+                                    'cpiolz' : 'lzip -d < %s | cpio --extract',
+                                    'cpiolzop' : 'lzop -d < %s | cpio --extract',
+                                    'cpiolrz' : 'lrzip -d < %s | cpio --extract',
+                                    'shar' : 'sh %s',
+                                    'sfs' : 'unsquashfs %s',
+                                    'squashfs' : 'unsquashfs %s'}
+'''
+Map from archive formats to the shell commands that extracts them
+'''
+
+_dragonsuite_decompress_native = {'gz' : 'gz',
+                                  'bz' : 'bz2',
+                                  'bz2' : 'bz2',
+                                  'xz' : 'xz',
+                                  'lzma' : 'xz',
+                                  'z' : 'zip',
+                                  'tar' : 'tar',
+                                  'tgz' : 'tar',
+                                  'targz' : 'tar',
+                                  'tarbz' : 'tar',
+                                  'tarbz2' : 'tar',
+                                  'tarxz' : 'tar',
+                                  'tarlzma' : 'tarlzma'}
+'''
+Map from archive formats that can be extracted without external programs to the method of extraction
+'''
+
+
+def __decompress_native(path, method, directory):
+    '''
+    Decompress and extract an archive without using external programs
+    
+    @param  path:str       The file
+    @param  method:str     The method of extraction, a value in `_dragonsuite_decompress_native`
+    @param  directory:str  The directory to which to extract
+    '''
+    import shutil
+    if method in ('gz', 'bz2', 'xz'):
+        # Decompress the file in place like gzip, bzip2, xz and lzma do
+        if method == 'gz':
+            import gzip as module
+        elif method == 'bz2':
+            import bz2 as module
+        else:
+            import lzma as module
+        dest = path[:path.rfind(os.extsep)]
+        with module.open(path, 'rb') as ifile:
+            with open(dest, 'wb') as ofile:
+                shutil.copyfileobj(ifile, ofile, 1 << 16)
+        shutil.copystat(path, dest)
+        os.unlink(path)
+    elif method == 'zip':
+        import zipfile
+        with zipfile.ZipFile(path) as archive:
+            for member in archive.infolist():
+                extracted = archive.extract(member, directory)
+                mode = member.external_attr >> 16
+                if (mode & 0o170000) == 0o120000:
+                    # Symbolic links are stored as files containing the target
+                    target = archive.read(member).decode('utf-8', 'surrogateescape')
+                    os.unlink(extracted)
+                    os.symlink(target, extracted)
+                elif ((mode & 0o7777) != 0) and not member.is_dir():
+                    os.chmod(extracted, mode & 0o7777)
+    else:
+        # The archive is read in one sequential pass, but not in tarfile's stream mode
+        # which is slow with xz and bzip2, and the same sanitation as GNU tar is applied
+        # when the filter is available
+        import tarfile
+        fileobj = None
+        if method == 'tarlzma':
+            import lzma
+            fileobj = lzma.open(path, 'rb')
+        try:
+            with tarfile.open(path if fileobj is None else None, 'r:' if fileobj is not None else 'r:*', fileobj) as archive:
+                if hasattr(tarfile, 'tar_filter'):
+                    archive.extractall(directory, filter = 'tar')
+                else:
+                    archive.extractall(directory)
+        finally:
+            if fileobj is not None:
+                fileobj.close()
+
+
+def __decompress_external(path, format):
+    '''
+    Decompress and extract an archive using external programs
+    
+    @param  path:str    The file
+    @param  format:str  The format, a key in `_dragonsuite_decompress_commands`
+    '''
+    havecpio = False
+    for d in get('PATH').split(os.pathsep):
+        if not d.endswith(os.sep):
+            d += os.sep
+        if os.path.lexists(d + 'cpio'):
+            havecpio = True
+            break
+    command = _dragonsuite_decompress_commands[format]
+    if not havecpio:
+        command = command.replace('cpio', 'bsdcpio')
+    bash(command % ('\'' + path.replace('\'', '\'\\\'\'') + '\''), fail = True)
+
+
+def decompress(path, format = None, native = None):
     '''
     Decompres and extract archives
     
-    Recognised formats, all using external programs:
+    Recognised formats:
     gzip*, bzip2*, xz*, lzma*, lrzip*, lzip*, lzop*, zip, shar, tar, cpio, squashfs
     Formats marked with and asteriks are recognised compressions for tar and cpio.
-
+    
+    tar, zip, gzip, bzip2, xz, lzma and tar compressed with gzip, bzip2, xz or lzma
+    can be extracted in-process, other formats use external programs. Multiple
+    archives are extracted concurrently.
+    
     @param  path:str|itr<str>  The file or files
     @param  format:str?        The format, `None` for automatic detection (currently uses file extension)
+    @param  native:bool?       Whether to extract in-process when the format permits it, rather than using external
+                               programs, `None` to extract in-process unless `$SPIKE_EXTERNAL_EXTRACT` is `yes`
     '''
     __print('decompress%s %s' % ('' if format is None else ('--format=' + format), str(path)))
+    directory = os.getcwd()
+    extract_native = native
+    if extract_native is None:
+        extract_native = os.getenv('SPIKE_EXTERNAL_EXTRACT', '').lower() != 'yes'
+    jobs = []
     for p in ([path] if isinstance(path, str) else path):
         fmt = format
         if fmt is None:
@@ -1131,48 +1407,25 @@ def decompress(path, format = None):
             if '.tar.' in fmt:
                 fmt = fmt[:fmt.rfind(os.extsep):] + fmt[fmt.rfind(os.extsep) + 1:]
             fmt = fmt[fmt.rfind(os.extsep) + 1:]
-        p = '\'' + p.replace('\'', '\'\\\'\'') + '\''
-        havecpio = False
-        for d in get('PATH').split(os.pathsep):
-            if not d.endswith(os.sep):
-                d += os.sep
-            if os.path.lexists(d + 'cpio'):
-                havecpio = True
-                break
-        fmt = {'gz' : 'gzip -d %s',
-               'bz' : 'bzip2 -d %s',
-               'bz2' : 'bzip2 -d %s',
-               'xz' : 'xz -d %s',
-               'lzma' : 'lzma -d %s',
-               'lrz' : 'lrzip -d %s',
-               'lz' : 'lzip -d %s',
-               'lzop' : 'lzop -d %s',
-               'z' : 'unzip %s',
-               'tar' : 'tar --get < %s',
-               'tgz' : 'tar --gzip --get < %s',
-               'targz' : 'tar --gzip --get < %s',
-               'tarbz' : 'tar --bzip2 --get < %s',
-               'tarbz2' : 'tar --bzip2 --get < %s',
-               'tarxz' : 'tar --xz --get < %s',
-               'tarlzma' : 'tar --lzma --get < %s',
-               'tarlz' : 'tar --lzip --get < %s',
-               'tarlzop' : 'tar --lzop --get < %s',
-               'tarlrz' : 'lzrip -d < %s | tar --get',
-               'cpio' : 'cpio --extract < %s',
-               'cpiogz' : 'gzip -d < %s | cpio --extract',
-               'cpiobz' : 'bzip2 -d < %s | cpio --extract',
-               'cpiobz2' : 'bzip2 -d < %s | cpio --extract',
-               'cpioxz' : 'xz -d < %s | cpio --extract',
-               'cpiolzma' : 'lzma -d < %s | cpio --extract',
-               'cpiolz' : 'lzip -d < %s | cpio --extract',
-               'cpiolzop' : 'lzop -d < %s | cpio --extract',
-               'cpiolrz' : 'lrzip -d < %s | cpio --extract',
-               'shar' : 'sh %s',
-               'sfs' : 'unsquashfs %s',
-               'squashfs' : 'unsquashfs %s'}[fmt.lower().replace(os.extsep, '').replace('zip', 'z')]
-        if not havecpio:
-            fmt = fmt.replace('cpio', 'bsdcpio')
-        bash(fmt % p, fail = True)
+        fmt = fmt.lower().replace(os.extsep, '').replace('zip', 'z')
+        if fmt not in _dragonsuite_decompress_commands:
+            raise Exception('Unrecognised archive format: %s' % p)
+        jobs.append((p, fmt))
+    def extract(job):
+        (p, fmt) = job
+        method = _dragonsuite_decompress_native[fmt] if fmt in _dragonsuite_decompress_native else None
+        if (extract_native is not False) and (method is not None):
+            __decompress_native(p, method, directory)
+        else:
+            __decompress_external(p, fmt)
+    if len(jobs) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(min(len(jobs), os.cpu_count() or 1)) as pool:
+            for _ in pool.map(extract, jobs):
+                pass
+    else:
+        for job in jobs:
+            extract(job)
 
 
 def chroot(directory, function):
@@ -1200,6 +1453,27 @@ def chroot(directory, function):
         return rc
 
 
+def __jobserver_fds():
+    '''
+    Get the file descriptors of the make jobserver, which must be kept open in commands
+    
+    @return  :tuple<int>  The file descriptors of the jobserver given by `MAKEFLAGS`
+    '''
+    for flag in get('MAKEFLAGS').split(' '):
+        for option in ('--jobserver-auth=', '--jobserver-fds='):
+            if flag.startswith(option):
+                fds = flag[len(option):].split(',')
+                if all(fd.isdigit() for fd in fds):
+                    try:
+                        for fd in fds:
+                            os.fstat(int(fd))
+                        return tuple(int(fd) for fd in fds)
+                    except OSError:
+                        # The jobserver is not available to this process
+                        return ()
+    return ()
+
+
 def execute_pipe(command, fail = False, *command_):
     '''
     Execute a command
@@ -1215,7 +1489,7 @@ def execute_pipe(command, fail = False, *command_):
     '''
     command = list([command] if isinstance(command, str) else command) + ([fail] if isinstance(fail, str) else []) + list(command_)
     __print('Executing external command: ' + str(command))
-    proc = Popen(command, stdin = sys.stdin, stdout = PIPE, stderr = sys.stderr)
+    proc = Popen(command, stdin = sys.stdin, stdout = PIPE, stderr = sys.stderr, pass_fds = __jobserver_fds())
     output = proc.communicate()[0]
     if fail and (proc.returncode != 0):
         raise Exception('%s exited with error code %i' % (str(command), proc.returncode))
@@ -1239,7 +1513,7 @@ def execute(command, fail = True, *command_):
     '''
     command = list([command] if isinstance(command, str) else command) + ([fail] if isinstance(fail, str) else []) + list(command_)
     __print('Executing external command: ' + str(command))
-    proc = Popen(command, stdin = sys.stdin, stdout = sys.stdout, stderr = sys.stderr)
+    proc = Popen(command, stdin = sys.stdin, stdout = sys.stdout, stderr = sys.stderr, pass_fds = __jobserver_fds())
     output = proc.communicate()[0]
     if fail and (proc.returncode != 0):
         raise Exception('%s exited with error code %i' % (str(command), proc.returncode))
@@ -1290,6 +1564,7 @@ def sha3sum(files):
     @param   files:str|itr<str>  The files
     @return  :str|list<str>      The sums, will be an string if the input as a string
     '''
+    from algorithmic.sha3sum import SHA3
     sha3 = SHA3()
     if isinstance(files, str):
         return sha3.digest_file(files)
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+spike – a package manager running on top of git
+
+Copyright © 2012, 2013, 2014  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import os
+import tarfile
+import threading
+import http.client
+import urllib.parse
+
+
+
+DOWNLOADER_CONNECTIONS = 4
+'''
+The default maximum number of files to download at the same time
+'''
+
+DOWNLOADER_BLOCK_SIZE = 64 << 10
+'''
+The number of bytes to read from a connection at a time
+'''
+
+DOWNLOADER_REDIRECTS = 10
+'''
+The maximum number of redirections to follow for a file
+'''
+
+
+
+class Downloader():
+    '''
+    In-process HTTP downloader, connections are kept alive and reused for each
+    host, files are downloaded concurrently and directly to the disk, and
+    interrupted downloads are resumed
+    
+    A download is first written to the destination file with the suffix `.part`,
+    if such file exists when a download starts, only the rest of the file is
+    requested, the file is renamed to the destination file when completed;
+    the file's entity tag or modification time is stored with the suffix
+    `.part.validator` and is sent with the request so that the rest of the file
+    is only sent if the file has not changed, otherwise it is downloaded again
+    
+    @variable  connections:int  The maximum number of files to download at the same time
+    '''
+    
+    def __init__(self, connections = DOWNLOADER_CONNECTIONS):
+        '''
+        Constructor
+        
+        @param  connections:int  The maximum number of files to download at the same time
+        '''
+        self.connections = max(1, connections)
+        self.pools = {}
+        self.mutex = threading.Lock()
+    
+    
+    @staticmethod
+    def supported(url):
+        '''
+        Check whether a URL can be downloaded by the downloader
+        
+        @param   url:str  The URL
+        @return  :bool    Whether the URL is supported
+        '''
+        return url.startswith('http://') or url.startswith('https://')
+    
+    
+    def connect(self, host):
+        '''
+        Get a connection to a host, an idle connection is reused if available
+        
+        @param   host:(str, str)          The scheme and the network location of the host
+        @return  :(HTTPConnection, bool)  The connection, and whether it was reused
+        '''
+        with self.mutex:
+            if (host in self.pools) and (len(self.pools[host]) > 0):
+                return (self.pools[host].pop(), True)
+        (scheme, netloc) = host
+        connection = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        return (connection(netloc, timeout = 60), False)
+    
+    
+    def release(self, host, connection):
+        '''
+        Make a connection available for reuse
+        
+        @param  host:(str, str)            The scheme and the network location of the host
+        @param  connection:HTTPConnection  The connection, it must not have any pending response
+        '''
+        with self.mutex:
+            if host not in self.pools:
+                self.pools[host] = []
+            self.pools[host].append(connection)
+    
+    
+    def download(self, url, dest, observer = None):
+        '''
+        Download a file
+        
+        @param  url:str                   The URL of the file
+        @param  dest:str                  The file to which to save the download
+        @param  observer:((bytes)→void)?  Function that is fed the content of the file, in order, as it is received
+        @throws IOError                   If the file cannot be downloaded
+        '''
+        (part, validator) = (dest + '.part', dest + '.part.validator')
+        for _attempt in range(DOWNLOADER_REDIRECTS + 1):
+            parsed = urllib.parse.urlsplit(url)
+            host = (parsed.scheme, parsed.netloc)
+            path = urllib.parse.urlunsplit(('', '', parsed.path or '/', parsed.query, ''))
+            headers = {'User-Agent' : 'spike', 'Accept-Encoding' : 'identity'}
+            
+            # Resume only if the file can be verified to be unchanged since the partial download started
+            offset = os.path.getsize(part) if os.path.exists(part) else 0
+            if offset > 0:
+                if os.path.exists(validator):
+                    with open(validator, 'rb') as file:
+                        headers['If-Range'] = file.read().decode('utf-8')
+                    headers['Range'] = 'bytes=%i-' % offset
+                else:
+                    offset = 0
+            
+            # Send the request, a reused connection may have been closed by the server, if so retry with a new connection
+            while True:
+                (connection, reused) = self.connect(host)
+                try:
+                    connection.request('GET', path, headers = headers)
+                    response = connection.getresponse()
+                    break
+                except (http.client.RemoteDisconnected, ConnectionError):
+                    connection.close()
+                    if not reused:
+                        raise
+            
+            try:
+                status = response.status
+                restart = False
+                if status in (301, 302, 303, 307, 308):
+                    response.read()
+                    url = urllib.parse.urljoin(url, response.getheader('Location', ''))
+                elif (status == 206) and not Downloader.resumes_at(response, offset):
+                    # The server did not send the rest of the partial download, start over
+                    restart = True
+                elif (status == 416) and (offset > 0):
+                    # The partial download does not match the file, start over
+                    response.read()
+                    restart = True
+                elif status in (200, 206):
+                    # Remember how to verify that the file is unchanged if the download is interrupted
+                    if status == 200:
+                        Downloader.save_validator(response, validator)
+                    # Write the file as it is received, append to the partial download if the server supports resumption
+                    if (status == 206) and (observer is not None):
+                        Downloader.replay(part, observer)
+                    with open(part, 'ab' if status == 206 else 'wb') as file:
+                        while True:
+                            chunk = response.read(DOWNLOADER_BLOCK_SIZE)
+                            if len(chunk) == 0:
+                                break
+                            file.write(chunk)
+                            if observer is not None:
+                                observer(chunk)
+                else:
+                    response.read()
+                    raise IOError('Cannot download %s: %i %s' % (url, status, response.reason))
+            except:
+                connection.close()
+                raise
+            if restart:
+                connection.close()
+                for file in (part, validator):
+                    if os.path.exists(file):
+                        os.unlink(file)
+                continue
+            if response.will_close:
+                connection.close()
+            else:
+                self.release(host, connection)
+            if status in (301, 302, 303, 307, 308):
+                continue
+            os.rename(part, dest)
+            if os.path.exists(validator):
+                os.unlink(validator)
+            return
+        raise IOError('Cannot download %s: too many redirections' % url)
+    
+    
+    @staticmethod
+    def resumes_at(response, offset):
+        '''
+        Check whether a partial response starts where the partial download ends
+        
+        @param   response:HTTPResponse  The response, with the status 206
+        @param   offset:int             The size of the partial download
+        @return  :bool                  Whether the response starts at `offset`
+        '''
+        content_range = response.getheader('Content-Range', '')
+        if not content_range.startswith('bytes '):
+            return False
+        start = content_range[len('bytes '):].split('-')[0].strip()
+        return start.isdigit() and (int(start) == offset)
+    
+    
+    @staticmethod
+    def save_validator(response, validator):
+        '''
+        Store the strong validator, the entity tag or the modification time, of a file that
+        is being downloaded so that the download can be resumed if it is interrupted
+        
+        @param  response:HTTPResponse  The response with the file
+        @param  validator:str          The file in which to store the validator
+        '''
+        value = response.getheader('ETag', None)
+        if (value is None) or value.startswith('W/'):
+            value = response.getheader('Last-Modified', None)
+        if value is None:
+            if os.path.exists(validator):
+                os.unlink(validator)
+        else:
+            with open(validator, 'wb') as file:
+                file.write(value.encode('utf-8'))
+    
+    
+    @staticmethod
+    def replay(file, observer):
+        '''
+        Feed the content of a partial download to an observer
+        
+        @param  file:str               The partial download
+        @param  observer:(bytes)→void  Function that is fed the content of the file
+        '''
+        with open(file, 'rb') as file:
+            while True:
+                chunk = file.read(DOWNLOADER_BLOCK_SIZE)
+                if len(chunk) == 0:
+                    break
+                observer(chunk)
+    
+    
+    def download_all(self, downloads):
+        '''
+        Download files concurrently
+        
+        @param   downloads:list<(str, str, ((bytes)→void)?)>  The URL of each file, the file to which to save it, and a function
+                                                             that is fed the content of the file as it is received or `None`
+        @return  :list<(str, str, str)>                       The URL, file and error message of each file that could not be downloaded
+        '''
+        queue = list(reversed(downloads))
+        failures = []
+        def work():
+            while True:
+                with self.mutex:
+                    if len(queue) == 0:
+                        return
+                    (url, dest, observer) = queue.pop()
+                try:
+                    self.download(url, dest, observer)
+                except Exception as err:
+                    if os.getenv('SPIKE_DEBUG', '').lower() == 'yes':
+                        import traceback
+                        traceback.print_exc()
+                    with self.mutex:
+                        failures.append((url, dest, str(err)))
+        workers = [threading.Thread(target = work) for _ in range(min(self.connections, len(downloads)))]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return failures
+    
+    
+    def close(self):
+        '''
+        Close all idle connections
+        '''
+        with self.mutex:
+            for host in self.pools:
+                for connection in self.pools[host]:
+                    connection.close()
+            self.pools = {}
+
+
+
+class TarStream():
+    '''
+    Extracts a tar archive, optionally compressed with gzip, bzip2 or xz,
+    while it is being downloaded, the content of the archive is fed by
+    calling the instance
+    '''
+    
+    SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tbz', '.tar.xz', '.txz', '.tar.lzma')
+    '''
+    The file name suffixes of archives that can be extracted
+    '''
+    
+    
+    def __init__(self, directory):
+        '''
+        Constructor
+        
+        @param  directory:str  The directory to which to extract the archive
+        '''
+        (reader, writer) = os.pipe()
+        self.reader = os.fdopen(reader, 'rb')
+        self.writer = os.fdopen(writer, 'wb')
+        self.error = None
+        self.thread = threading.Thread(target = self.extract, args = (directory,))
+        self.thread.start()
+    
+    
+    @staticmethod
+    def supported(file):
+        '''
+        Check whether an archive can be extracted while it is being downloaded
+        
+        @param   file:str  The file name of the archive
+        @return  :bool     Whether the archive can be extracted
+        '''
+        return file.lower().endswith(TarStream.SUFFIXES)
+    
+    
+    def extract(self, directory):
+        '''
+        Extract the archive as it is received
+        
+        @param  directory:str  The directory to which to extract the archive
+        '''
+        try:
+            with tarfile.open(fileobj = self.reader, mode = 'r|*') as archive:
+                if hasattr(tarfile, 'data_filter'):
+                    archive.extractall(directory, filter = 'data')
+                else:
+                    archive.extractall(directory)
+        except Exception as err:
+            self.error = err
+        finally:
+            # Consume the rest of the data so that feeding never blocks
+            while len(self.reader.read(DOWNLOADER_BLOCK_SIZE)) > 0:
+                pass
+            self.reader.close()
+    
+    
+    def __call__(self, chunk):
+        '''
+        Feed more of the archive
+        
+        @param  chunk:bytes  The next part of the archive
+        '''
+        self.writer.write(chunk)
+    
+    
+    def close(self):
+        '''
+        Wait for the extraction to finish, must be called after the entire archive has been fed,
+        or when the download has failed, calling it again has no effect
+        
+        @return  :bool  Whether the archive was extracted successfully
+        '''
+        if not self.writer.closed:
+            self.writer.close()
+        self.thread.join()
+        return self.error is None
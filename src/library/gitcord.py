@@ -329,7 +329,7 @@ class Gitcord():
         proc = None
         out = None
         try:
-            command = 'git whatchanged --pretty=format:%H'.split(' ')
+            command = 'git whatchanged --no-renames --pretty=format:%H'.split(' ')
             proc = Popen(command, cwd = self.dir, stdout = PIPE, stdin = sys.stdin, stderr = sys.stderr)
             out = proc.communicate()[0].decode('utf-8', 'replace')
             if proc.returncode != 0:
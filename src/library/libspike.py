@@ -19,7 +19,6 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <http://www.gnu.org/licenses/>.
 '''
 import os
-import inspect
 # TODO use git in commands
 
 from scales.installer import *
@@ -27,8 +26,19 @@ from scales.bootstrapper import *
 from scales.scrollfinder import *
 from scales.ownerfinder import *
 from scales.claimer import *
+from scales.proofreader import *
+from scales.installplan import *
+from scales.buildscheduler import *
+from scales.jobserver import *
 from database.spikedb import *
 from database.dbctrl import *
+from database.scrollindex import *
+from database.codecache import *
+from database.trigramindex import *
+from database.providesindex import *
+from database.resolutioncache import *
+from database.sourcecache import *
+from database.packagecache import *
 from algorithmic.algospike import *
 from algorithmic.scrlver import *
 from algorithmic.sha3sum import *
@@ -36,6 +46,7 @@ from auxiliary.scrollmagick import *
 from auxiliary.auxfunctions import *
 from library.libspikehelper import *
 from dragonsuite import *
+from spikeless import *
 
 
 
@@ -69,6 +80,8 @@ class LibSpike(LibSpikeHelper):
                  27 - Corrupt database
                  28 - Pony is required by another pony
                  29 - Circular make dependency
+                 30 - Installation plan is invalid or was resolved for another state of the system
+                 31 - Ponies were built but not installed, installation is not implemented
                 254 - User aborted
                 255 - Unknown error
     '''
@@ -81,6 +94,8 @@ class LibSpike(LibSpikeHelper):
         @param  shred:bool  Whether to preform secure removal when possible
         '''
         util = lambda u : SPIKE_PATH + 'src/util-replacements/' + u
+        if ScrollMagick.code_cache is None:
+            ScrollMagick.code_cache = CodeCache(SPIKE_PATH)
         export('SPIKE_SHRED_OPTS', '-n 3 -z -u')
         if shred:
             export('shred', get('SPIKE_SHRED_OPTS'))
@@ -93,6 +108,8 @@ class LibSpike(LibSpikeHelper):
         if shred:
             export('PATH', '%s:%s' % (util('shred'), get('PATH')))
         export('SPIKE_OLD_PATH', get('PATH'))
+        if Installer.index is None:
+            Installer.index = ScrollIndex(SPIKE_PATH)
     
     
     @staticmethod
@@ -100,6 +117,10 @@ class LibSpike(LibSpikeHelper):
         '''
         Perform terminations
         '''
+        if Installer.index is not None:
+            Installer.index.save()
+        if ScrollMagick.code_cache is not None:
+            ScrollMagick.code_cache.evict()
         LibSpike.unlock()
     
     
@@ -113,11 +134,7 @@ class LibSpike(LibSpikeHelper):
                 addon = SPIKE_PATH + 'add-on/' + addon
                 if (addon[-1] != '~') and os.path.isfile(addon) and os.access(addon, os.R_OK | os.X_OK):
                     try:
-                        code = None
-                        with open(addon, 'rb') as file:
-                            code = file.read().decode('utf8', 'replace') + '\n'
-                            code = compile(code, addon, 'exec')
-                        exec(code, globals())
+                        exec(ScrollMagick.code_cache.compile(addon), globals())
                     except:
                         if os.getenv('SPIKE_DEBUG', '').lower() == 'yes':
                             import traceback
@@ -151,6 +168,10 @@ class LibSpike(LibSpikeHelper):
         repos = [SPIKE_PATH + 'repositories'] + LibSpike.get_confs('repositories')
         Bootstrapper.queue_repositores(repos, repositories, update, aggregator)
         
+        # Load the catalogues of the scrolls in the repositories, before they are updated
+        catalogues = [Catalogue(repo) for repo in repositories if repo != os.path.realpath(SPIKE_PATH)]
+        catalogues = [(catalogue, catalogue.valid()) for catalogue in catalogues]
+        
         # Update Spike and repositories, those that are listed
         for repo in update:
             aggregator(repo, 1)
@@ -158,6 +179,10 @@ class LibSpike(LibSpikeHelper):
                 return 24
             aggregator(repo, 2)
         
+        # Catalogue the scrolls in the repositories
+        for (catalogue, valid) in catalogues:
+            Bootstrapper.catalogue(catalogue, valid)
+        
         return 0
     
     
@@ -185,13 +210,55 @@ class LibSpike(LibSpikeHelper):
                 for file in [SPIKE_PATH + superrepo] + LibSpike.get_confs(superrepo):
                     ScrollFinder.get_repositories(repositories, file)
         
-        ScrollFinder.match_repositories(repositories, patterns)
+        (repo_matcher, category_matcher, scroll_matcher) = ScrollFinder.get_matchers(patterns)
+        ScrollFinder.match_repositories(repositories, repo_matcher)
         categories = ScrollFinder.get_categories(repositories)
-        ScrollFinder.match_categories(repositories, categories)
+        ScrollFinder.match_categories(repositories, categories, category_matcher)
         ScrollFinder.flatten_categories(categories)
         scrolls = ScrollFinder.get_scrolls(categories)
-        ScrollFinder.match_and_report(categories, scrolls, aggregator)
+        ScrollFinder.match_and_report(categories, scrolls, scroll_matcher, aggregator)
+        
+        return 0
+    
+    
+    @staticmethod
+    def find_text(aggregator, patterns, installed = True, notinstalled = True):
+        '''
+        Search for a scroll by its description, groups and provides
+        
+        @param   aggregator:(str)→void
+                     Feed a scroll when one whose information matches one of the patterns has been found.
+        
+        @param   patterns:list<str>  Regular expression search patterns
+        @param   installed:bool      Look for installed packages
+        @param   notinstalled:bool   Look for not installed packages
+        @return  :byte               Exit value, see description of `LibSpike`, the possible ones are: 0
+        '''
+        LibSpike.lock(False)
+        
+        # Get scroll files
+        scrollfiles = []
+        for superrepo in [True if installed else None, False if notinstalled else None]:
+            if superrepo is not None:
+                scrollfiles += LibSpikeHelper.locate_all_scrolls(superrepo)
         
+        # Bring the index up to date, scrolls that have not been touched are not read
+        index = TrigramIndex(SPIKE_PATH)
+        for (scrollfile, version) in index.stale(scrollfiles):
+            try:
+                fields = Installer.load_fields(scrollfile)
+            except:
+                if os.getenv('SPIKE_DEBUG', '').lower() == 'yes':
+                    import traceback
+                    traceback.print_exc()
+                continue
+            index.update(scrollfile, version, fields)
+        
+        # Search and report
+        for (scrollfile, _field, _value) in index.search(patterns, set(scrollfiles)):
+            aggregator('/'.join(scrollfile.split('/')[-3:])[:-len('.scroll')])
+        
+        index.save()
         return 0
     
     
@@ -226,12 +293,12 @@ class LibSpike(LibSpikeHelper):
     
     
     @staticmethod
-    def write(aggregator, scrolls, root = '/', private = False, explicitness = 0, nodep = False, force = False):
+    def write(aggregator, scrolls, root = '/', private = False, explicitness = 0, nodep = False, force = False, plan_out = None, plan_in = None, jobs = 1):
         '''
         Install ponies from scrolls
         
         @param   aggregator:(str?, int, [*])→(void|bool|str|int?)
-                     Feed a scroll (`None` only at state 0, 3, 6, 7 and 9) and a state (can be looped) during the process of a scroll.
+                     Feed a scroll (`None` only at state 0, 3, 6, 7, 9 and 15) and a state (can be looped) during the process of a scroll.
                      The states are: 0 - inspecting installed scrolls
                                      1 - proofreading
                                      2 - scroll added because of being updated
@@ -250,6 +317,7 @@ class LibSpike(LibSpikeHelper):
                                     12 - compiling
                                     13 - file conflict check: Additional parameters: progress state:int, progress end:int
                                     14 - installing files: Additional parameters: progress state:int, progress end:int
+                                    15 - pipeline statistics, only if $SPIKE_BENCHMARK is yes. Additional parameters: stage:str, maximum queue depth:int, total wait time in seconds:float
                      when:excl-flag values: 0 - Build whenever
                                             1 - Build early
                                             2 - Build early and fetch separately
@@ -262,17 +330,76 @@ class LibSpike(LibSpikeHelper):
         @param   explicitness:int   -1 for install as dependency, 1 for install as explicit, and 0 for explicit if not previously as dependency
         @param   nodep:bool         Whether to ignore dependencies
         @param   force:bool         Whether to ignore file claims
-        @return  :byte              Exit value, see description of `LibSpike`, the possible ones are: 0, 6, 8, 9, 22, 29, 254, 255 (TODO)
+        @param   plan_out:str?      File to which to export the resolved installation instead of installing, `None` to install
+        @param   plan_in:str?       File with an exported installation to apply instead of resolving the other parameters, `None` to resolve
+        @param   jobs:int           The number of scrolls to build in parallel
+        @return  :byte              Exit value, see description of `LibSpike`, the possible ones are: 0, 6, 8, 9, 16, 22, 29, 30, 31, 254, 255 (TODO),
+                                    0 only if the installation was planned with `plan_out`, 31 if the ponies were built,
+                                    because installation is not implemented yet
+        '''
+        # All make invocations in all builds share one pool of job slots, if parallel builds are requested,
+        # otherwise make runs as it would without spike, as not all makefiles are safe to run in parallel
+        (jobserver, makeflags) = (None, os.getenv('MAKEFLAGS', None))
+        if (plan_out is None) and ((jobs > 1) or ('SPIKE_MAKE_JOBS' in os.environ)):
+            jobserver = Jobserver()
+            jobserver.export()
+        scheduler = BuildScheduler(jobs, jobserver = jobserver)
+        try:
+            return LibSpike.__write(scheduler, aggregator, scrolls, root, private, explicitness, nodep, force, plan_out, plan_in)
+        finally:
+            # Stop speculative fetches for scrolls that were not built
+            scheduler.close()
+            if jobserver is not None:
+                jobserver.close()
+                if makeflags is None:
+                    del os.environ['MAKEFLAGS']
+                else:
+                    os.environ['MAKEFLAGS'] = makeflags
+    
+    
+    @staticmethod
+    def __write(scheduler, aggregator, scrolls, root, private, explicitness, nodep, force, plan_out, plan_in):
+        '''
+        Install ponies from scrolls, see `write`
+        
+        @param   scheduler:BuildScheduler  The scheduler to use to fetch sources and build scrolls
+        @return  :byte                     Exit value, see description of `write`
         '''
         global SPIKE_PATH
         ## TODO checkdepends
         LibSpike.lock(True)
+        # Downloaded sources and built packages are shared between all installation roots
+        source_cache = SourceCache(SPIKE_PATH)
+        package_cache = PackageCache(SPIKE_PATH)
+        
         # Set root
         if root is not None:
             if root.endswith('/'):
                 root = root[:-1]
             SPIKE_PATH = root + SPIKE_PATH
         
+        # Fetch sources in separate directories as soon as a scroll is known, unless only planning
+        builddir = CacheStore.directory(SPIKE_PATH) + 'build' + os.sep
+        def fetch(scroll):
+            startdir = builddir + scroll.name
+            if not os.path.exists(startdir):
+                mkdir_p(startdir)
+            return Spikeless.fetch(scroll.file, startdir, source_cache)
+        if plan_out is None:
+            scheduler.fetch = fetch
+        
+        # Load the plan to apply, it contains the request
+        imported = None
+        if plan_in is not None:
+            try:
+                imported = InstallPlan.load(plan_in)
+                (scrolls, private, explicitness, nodep) = imported['request']
+            except:
+                if os.getenv('SPIKE_DEBUG', '').lower() == 'yes':
+                    import traceback
+                    traceback.print_exc()
+                return 30
+        
         # Information needed in the progress and may only be extended
         installed_info = {}
         scroll_info = {}
@@ -280,130 +407,232 @@ class LibSpike(LibSpikeHelper):
         field_scroll = {}
         installed_versions = {}
         providers = None
-        provider_files = None
         not_found = set()
         uninstall = []
         
+        # Added and replaced scrolls are remembered with the plan so that they can be reported when it is reused
+        notices = []
+        def notify(scroll, state, value):
+            notices.append((scroll, state, [str(v) for v in value] if isinstance(value, list) else str(value)))
+            aggregator(scroll, state, value)
+        asked = False
+        
         scroll_field = {}
         installing = {}
         new_scrolls = make_dictionary([(scroll, None) for scroll in scrolls])
         
-        # Load information about already installed scrolls
-        # TODO this should be better using spikedb
-        aggregator(None, 0)
-        try:
-            Installer.load_all_information(private, installed_info, installed_versions, field_installed)
-        except:
-            if os.getenv('SPIKE_DEBUG', '').lower() == 'yes':
-                import traceback
-                traceback.print_exc()
-            return 255 # So how did we install it...
-        
-        empty_dep_test = lambda scroll : (scroll.name == 'spike') and os.path.exists(SPIKE_PATH) and os.path.isdir(SPIKE_PATH)
-        while True:
-            # Proofread scrolls
-            def agg(scroll, state, *_):
-                if state == 0:
-                    aggregator(scroll, 1)
-            error = LibSpike.proofread(agg, list(new_scrolls.keys()))
-            if error != 0:
-                return error
+        # Get the state of the installed scrolls, the repositories and the environment that plans are resolved for
+        digest = CacheStore.digest if Installer.index is None else Installer.index.digest
+        repositories = LibSpikeHelper.locate_repositories(False)
+        installed_repositories = LibSpikeHelper.locate_repositories(True, None if private else False)
+        state = None
+        if (plan_in is not None) or (plan_out is not None):
+            state = {'environment'  : CacheStore.environment(),
+                     'installed'    : InstallPlan.fingerprint_installed(installed_repositories, digest),
+                     'repositories' : dict((repo, InstallPlan.fingerprint_repository(repositories[repo], digest)) for repo in repositories)}
+        
+        if imported is not None:
+            # Use the imported plan if it was resolved for this exact state
+            for field in ('environment', 'installed', 'repositories'):
+                if imported.get(field, None) != state[field]:
+                    return 30
+            plan = ([], imported['uninstall'], imported['summary'], imported['notices'])
+            for (scroll, later) in imported['scrolls']:
+                scrollfile = LibSpikeHelper.locate_scroll(scroll)
+                if scrollfile is None:
+                    return 30
+                plan[0].append((scrollfile, later))
+        else:
+            # Fingerprint the request, the installed scrolls, the repositories and the environment,
+            # repositories that are git clones by their commit, and scroll files by their identity
+            # rather than their content, so that no scroll file needs to be read
+            def identity(file):
+                return '%i:%i:%i' % CacheStore.identity(file)
+            request = (SPIKE_VERSION, SPIKE_PATH, sorted(scrolls), private, explicitness, nodep)
+            fingerprints = [(repositories[repo], InstallPlan.fingerprint_repository(repositories[repo], identity)) for repo in repositories]
+            fingerprints.append(('', InstallPlan.fingerprint_installed(installed_repositories, identity)))
+            cache = ResolutionCache(SPIKE_PATH)
+            key = ResolutionCache.key(request, fingerprints)
             
-            # Report that we are looking for conflicts
-            aggregator(None, 3)
+            # Reuse the plan from an identical earlier resolution
+            plan = cache.get(key)
+        
+        # Restore the remembered or imported plan
+        if plan is not None:
+            try:
+                tsorted = []
+                for (scrollfile, later) in plan[0]:
+                    later = None if later is None else [ScrollVersion(scroll) for scroll in later]
+                    tsorted.append((Installer.load_information(scrollfile), later))
+                    scheduler.prefetch(tsorted[-1][0])
+                uninstall = [ScrollVersion(scroll) for scroll in plan[1]]
+                notices = [tuple(notice) for notice in plan[3]]
+            except:
+                if os.getenv('SPIKE_DEBUG', '').lower() == 'yes':
+                    import traceback
+                    traceback.print_exc()
+                if imported is not None:
+                    return 30
+                plan = None
+        if plan is not None:
+            for notice in notices:
+                aggregator(*notice)
+            if not aggregator(None, 6, *[list(names) for names in plan[2]]):
+                return 254
+        else:
+            # Load information about already installed scrolls
+            # TODO this should be better using spikedb
+            aggregator(None, 0)
+            try:
+                Installer.load_all_information(private, installed_info, installed_versions, field_installed)
+            except:
+                if os.getenv('SPIKE_DEBUG', '').lower() == 'yes':
+                    import traceback
+                    traceback.print_exc()
+                return 255 # So how did we install it...
             
-            # Get scroll fields
-            for scroll in new_scrolls.keys():
-                scrollfile = LibSpikeHelper.locate_scroll(scroll) if new_scrolls[scroll] is None else new_scrolls[scroll]
-                if scrollfile is None:
-                    if os.getenv('SPIKE_DEBUG', '').lower() == 'yes':
-                        import traceback
-                        traceback.print_exc()
-                    return 255 # But, the proofreader already found them...
-                else:
-                    try:
-                        scrollinfo = Installer.load_information(scrollfile)
-                        Installer.transpose_fields(scrollinfo, field_scroll)
-                        scroll_info[scrollinfo.scroll] = scrollinfo
-                    except:
+            empty_dep_test = lambda scroll : (scroll.name == 'spike') and os.path.exists(SPIKE_PATH) and os.path.isdir(SPIKE_PATH)
+            while True:
+                # Proofread scrolls
+                def agg(scroll, state, *_):
+                    if state == 0:
+                        aggregator(scroll, 1)
+                error = LibSpike.proofread(agg, list(new_scrolls.keys()))
+                if error != 0:
+                    return error
+                
+                # Report that we are looking for conflicts
+                aggregator(None, 3)
+                
+                # Get scroll fields
+                for scroll in new_scrolls.keys():
+                    scrollfile = LibSpikeHelper.locate_scroll(scroll) if new_scrolls[scroll] is None else new_scrolls[scroll]
+                    if scrollfile is None:
                         if os.getenv('SPIKE_DEBUG', '').lower() == 'yes':
                             import traceback
                             traceback.print_exc()
-                        return 255 # But, the proofreader did not have any problem...
-            
-            # Identify scrolls that may not be installed at the same time
-            installed = set()
-            provided = set()
-            if not Installer.check_conflicts([scroll_info, installed_info], installed, provided):
-                return 8
-            
-            # Look for missing dependencies
-            needed = set()
-            requirer = {}
-            error = Installer.find_dependencies(scroll_info, needed, requirer, installed, provided, empty_dep_test)
-            if error != 0:
-                return error
-            
-            # Locate the missing dependencies
-            new_scrolls = {}
-            for scroll in needed:
-                path = LibSpikeHelper.locate_scroll(scroll.name, False)
-                if path is None:
-                    not_found.add(scroll)
+                        return 255 # But, the proofreader already found them...
+                    else:
+                        try:
+                            scrollinfo = Installer.load_information(scrollfile)
+                            Installer.transpose_fields(scrollinfo, field_scroll)
+                            scroll_info[scrollinfo.scroll] = scrollinfo
+                            scheduler.prefetch(scrollinfo)
+                        except:
+                            if os.getenv('SPIKE_DEBUG', '').lower() == 'yes':
+                                import traceback
+                                traceback.print_exc()
+                            return 255 # But, the proofreader did not have any problem...
+                
+                # Identify scrolls that may not be installed at the same time
+                installed = ScrollVersionSet()
+                provided = ScrollVersionSet()
+                if not Installer.check_conflicts([scroll_info, installed_info], installed, provided):
+                    return 8
+                
+                # Look for missing dependencies
+                needed = ScrollVersionSet()
+                requirer = {}
+                error = Installer.find_dependencies(scroll_info, needed, requirer, installed, provided, empty_dep_test)
+                if error != 0:
+                    return error
+                
+                # Locate the missing dependencies
+                new_scrolls = {}
+                for scroll in needed:
+                    path = LibSpikeHelper.locate_scroll(scroll.name, False)
+                    if path is None:
+                        not_found.add(scroll)
+                    else:
+                        new_scrolls[scroll] = path
+                        notify(scroll.name, 4, requirer[scroll.name])
+                
+                # Remove replaced ponies
+                Installer.replacements(scroll_info, installed_info, field_installed, uninstall, notify)
+                
+                # Loop if we got some additional scrolls
+                if len(new_scrolls.keys()) > 0:
+                    continue
+                
+                # We as for confirmation first because if optimisation is not done, finding provider can take some serious time
+                fresh_installs, reinstalls, update, downgrading, skipping = [], [], [], [], []
+                Installer.update_types(scroll_info, installed_versions, fresh_installs, reinstalls, update, downgrading, skipping)
+                if not aggregator(None, 6, fresh_installs, reinstalls, update, downgrading, skipping):
+                    return 254
+                
+                # Select providers and loop if any was needed
+                if len(not_found) > 0:
+                    # Bring the provides index up to date, only modified scrolls are read
+                    if providers is None:
+                        aggregator(None, 7)
+                        providers = ProvidesIndex(SPIKE_PATH)
+                        try:
+                            providers.refresh(LibSpikeHelper.locate_all_scrolls(False), Installer.load_provides)
+                        except:
+                            if os.getenv('SPIKE_DEBUG', '').lower() == 'yes':
+                                import traceback
+                                traceback.print_exc()
+                            return 255
+                        providers.save()
+                    
+                    # Select provider
+                    for scroll in not_found:
+                        provider_files = {}
+                        for (provision, provider, scrollfile) in providers.lookup(scroll.name):
+                            if scroll in ScrollVersion(provision):
+                                provider_files[provider] = scrollfile
+                        if len(provider_files) == 0:
+                            return 9
+                        option = aggregator(scroll, 8, sorted(provider_files.keys()))
+                        if option is None:
+                            return 254
+                        asked = True
+                        new_scrolls[ScrollVersion(option).name] = provider_files[option]
+                    not_found = set()
                 else:
-                    new_scrolls[scroll] = path
-                    aggregator(scroll.name, 4, requirer[scroll.name])
-            
-            # Remove replaced ponies
-            Installer.replacements(scroll_info, installed_info, field_installed, uninstall, aggregator)
+                    break
             
-            # Loop if we got some additional scrolls
-            if len(new_scrolls.keys()) > 0:
-                continue
+            # TODO at any time make dependencies have not yet been installed
+            #      all compiled scroll are to be installed. If an interactive scroll is non-installed
+            #      make dependancies whose scroll is not interactive, `when` make only be 0, or 3
+            #      if they are all at the end of the t:sorted list.
             
-            # We as for confirmation first because if optimisation is not done, finding provider can take some serious time
-            fresh_installs, reinstalls, update, downgrading, skipping = [], [], [], [], []
-            Installer.update_types(scroll_info, installed_versions, fresh_installs, reinstalls, update, downgrading, skipping)
-            if not aggregator(None, 6, fresh_installs, reinstalls, update, downgrading, skipping):
-                return 254
+            # Topologically sort scrolls
+            tsorted = Installer.tsort_scrolls(scroll_info)
+            if tsorted is None:
+                return 29
             
-            # Select providers and loop if any was needed
-            if len(not_found) > 0:
-                # Read all scrolls so we can find providers
-                # TODO this should be better using spikedb
-                if providers is None:
-                    aggregator(None, 7)
-                    providers = {}
-                    provider_files = {}
-                    for scrollfile in locate_all_scrolls(False):
-                        scroll = Installer.load_information(scrollfile)
-                        for provides in scroll['provides']:
-                            provides.slice_map(providers, scroll.scroll)
-                            provider_file[scroll.scroll.full] = scroll.file
-                
-                # Select provider
-                for scroll in not_found:
-                    options = ScrollVersion(scroll).get_all(providers)
-                    if len(options) == 0:
-                        return 9
-                    option = aggregator(scroll, 8, [opt.scroll.full for opt in options])
-                    if option is None:
-                        return 254
-                    option = ScrollVersion(option)
-                    new_scrolls[option.name] = provider_file[option]
-                not_found = set()
-            else:
-                break
-        
-        # TODO at any time make dependencies have not yet been installed
-        #      all compiled scroll are to be installed. If an interactive scroll is non-installed
-        #      make dependancies whose scroll is not interactive, `when` make only be 0, or 3
-        #      if they are all at the end of the t:sorted list.
-        
-        # Topologically sort scrolls
-        tsorted = Installer.tsort_scrolls(scroll_info)
-        if tsorted is None:
-            return 29
+            # Remember the plan, unless the user selected providers, those choices must be asked for again
+            plan = ([(scroll.file, None if later is None else [dep.full for dep in later]) for (scroll, later) in tsorted],
+                    [scroll.full for scroll in uninstall],
+                    (fresh_installs, reinstalls, update, downgrading, skipping),
+                    notices)
+            if not asked:
+                cache.put(key, plan)
+                cache.save()
+        
+        # Export the plan instead of installing
+        if plan_out is not None:
+            exported = dict(state)
+            exported['spike'] = SPIKE_VERSION
+            exported['request'] = (sorted(scrolls), private, explicitness, nodep)
+            exported['scrolls'] = []
+            exported['uninstall'] = plan[1]
+            exported['summary'] = plan[2]
+            exported['notices'] = plan[3]
+            for (scrollfile, later) in plan[0]:
+                scroll = InstallPlan.scroll_name(repositories, scrollfile)
+                if scroll is None:
+                    return 255 # Scrolls are only loaded from the repositories
+                exported['scrolls'].append((scroll, later))
+            try:
+                InstallPlan.save(plan_out, exported)
+            except:
+                if os.getenv('SPIKE_DEBUG', '').lower() == 'yes':
+                    import traceback
+                    traceback.print_exc()
+                return 255
+            return 0
         
         # Separate scrolls that need itneraction from those that do not
         interactively_installed = []
@@ -421,12 +650,12 @@ class LibSpike(LibSpikeHelper):
             when = aggregator(None, 9, [scroll.scroll.full for scroll in interactively_installed], allowed_when)
             if when is None:
                 return 254
-            if (0 < when) or (((1 << when) & allowed_when) == 0):
+            if (when < 0) or (((1 << when) & allowed_when) == 0):
                 return 255
         
         # Get order to download and build scrolls
-        first_download, second_download = tsorted, []
-        first_build, second_build = first_download, second_build
+        first_download, second_download = [scroll for (scroll, _) in tsorted], []
+        first_build, second_build = first_download, second_download
         if when == 1:
             first_download, second_download = interactively_installed, noninteractively_installed
         elif when == 2:
@@ -435,18 +664,74 @@ class LibSpike(LibSpikeHelper):
         elif when == 3:
             first_download, second_download = noninteractively_installed, interactively_installed
         
+        # Get the scrolls each scroll must wait for before it can be built
+        build_dependencies = dict((scroll.name, deps) for (scroll, deps) in Installer.build_dependencies(tsorted))
+        
+        # Look up the scrolls' packages in the package cache, those that have been built with
+        # the same input need not be fetched or built, a scroll's input includes its patches
+        patchers = {}
+        for (scroll, _) in tsorted:
+            if scroll['patches'] is not None:
+                dict_append(patchers, scroll['patches'].name, scroll.file)
+        package_keys = {}
+        for (scroll, _) in tsorted:
+            try:
+                fields = Installer.load_fields(scroll.file)
+                patches = patchers[scroll.name] if scroll.name in patchers else []
+                package_keys[scroll] = PackageCache.key(scroll.file, fields, patches, private, SPIKE_VERSION)
+            except:
+                package_keys[scroll] = None
+        pkgdirs = {}
+        for (scroll, _) in tsorted:
+            if package_cache.contains(package_keys[scroll]):
+                pkgdir = builddir + scroll.name + os.sep + 'pkg'
+                if not os.path.exists(builddir + scroll.name):
+                    mkdir_p(builddir + scroll.name)
+                if package_cache.get(package_keys[scroll], pkgdir):
+                    scheduler.discard(scroll)
+                    pkgdirs[scroll] = pkgdir
+        
+        # Build scrolls in their fetch directories, in parallel if requested, fresh installations are those not already installed,
+        # packages are built into empty package directories, so that the files in the package cache are not modified
+        fresh_installs = set(plan[2][0])
+        pinpal = os.sep if root is None else root + os.sep
+        def build(scroll):
+            startdir = builddir + scroll.name
+            if not os.path.exists(startdir):
+                mkdir_p(startdir)
+            if os.path.lexists(startdir + os.sep + 'pkg'):
+                rm_r(startdir + os.sep + 'pkg')
+            fresh = scroll.scroll.full in fresh_installs
+            (_pre, pkgdir, _post) = Spikeless.install(scroll.file, startdir, pinpal, private, fresh, fetch = False)
+            package_cache.put(package_keys[scroll], pkgdir)
+            return pkgdir
+        
         # Download and verify sources and compile
         for (download_list, build_list) in [(first_download, first_build), (second_download, second_build)]:
-            # Download sources
+            # Download and verify sources, in the background, those already fetched are not fetched again
             for scroll in download_list:
-                pass ## TODO download
-            
-            # Verify sources
-            ## TODO verify
+                scheduler.prefetch(scroll)
             
-            # Compile
-            for scroll in build_list:
-                pass ## TODO build
+            # Compile, each scroll as soon as its sources have been fetched and its make dependencies
+            # have been built, interactive scrolls are built in the foreground while nothing else is built
+            def agg(scroll, state, *args):
+                if state == 0:
+                    aggregator(scroll.name, 12)
+                elif state == 2:
+                    sources = args[0]
+                    for i in range(len(sources)):
+                        aggregator(scroll.name, 10, sources[i], i + 1, len(sources))
+                    aggregator(scroll.name, 11, 1, 1)
+            tasks = [(scroll, build_dependencies[scroll.name], scroll['interactive']) for scroll in build_list if scroll not in pkgdirs]
+            (built, failure) = scheduler.run(tasks, build, agg)
+            pkgdirs.update(built)
+            if failure is not None:
+                return 16
+        
+        # Report how long scrolls have waited in the pipeline, if benchmarking
+        if os.getenv('SPIKE_BENCHMARK', '').lower() == 'yes':
+            for stage in ('fetch', 'build'):
+                aggregator(None, 15, stage, *scheduler.stats[stage])
         
         # Check for file conflicts
         if not force:
@@ -454,7 +739,8 @@ class LibSpike(LibSpikeHelper):
         
         ## TODO install
         
-        return 0
+        # Nothing has been installed, do not report success
+        return 31
     
     
     @staticmethod
@@ -750,11 +1036,12 @@ class LibSpike(LibSpikeHelper):
             
             # Open scroll
             try:
-                ScrollMagick.init_methods(globals())
-                scroll = locate_scroll(pony, True, private)
+                scroll = LibSpikeHelper.locate_scroll(pony, True, private)
                 if scroll is None:
                     return 6
-                ScrollMagick.execute_scroll(scroll, globals())
+                globs = ScrollMagick.namespace()
+                ScrollMagick.execute_scroll(scroll, globs)
+                ride = globs['ride']
                 
                 # Ride pony
                 if ride is None:
@@ -893,13 +1180,7 @@ class LibSpike(LibSpikeHelper):
         
         LibSpike.lock(False)
         # Fields
-        preglobals = set(globals().keys())
-        ScrollMagick.init_fields(globals())
-        postglobals = list(globals().keys())
-        allowedfields = set()
-        for globalvar in postglobals:
-            if globalvar not in preglobals:
-                allowedfields.add(globalvar)
+        allowedfields = set(ScrollMagick.field_names())
         for var in ('noextract', 'source', 'sha3sums'):
             if var in allowedfields:
                 allowedfields.remove(var)
@@ -945,26 +1226,19 @@ class LibSpike(LibSpikeHelper):
                         try:
                             installed = scrollfile is scroll_installed
                             
-                            # Initalise or reset fields to their default values
-                            ScrollMagick.init_fields(globals())
+                            # Fetch fields
+                            values = Installer.load_fields(scrollfile)
                             
                             # Scroll location
-                            global repository, category
-                            repository = scrollfile.split('/')[-3]
-                            category = scrollfile.split('/')[-2]
-                            
-                            # Open installed scroll
-                            if scrollfile == None:
-                                return 6
-                            # Fetch fields
-                            ScrollMagick.execute_scroll(scrollfile, globals())
+                            values['repository'] = scrollfile.split('/')[-3]
+                            values['category'] = scrollfile.split('/')[-2]
                             
                             # Prepare for report
                             for field in fields:
                                 if field not in allowedfields:
                                     aggregator(scroll, field, None, installed)
                                     continue
-                                value = globals()[field]
+                                value = values[field]
                                 value = ScrollMagick.field_display_convert(field, value)
                                 value = convert(value)
                                 if isinstance(value, str):
@@ -1272,7 +1546,7 @@ class LibSpike(LibSpikeHelper):
     
     
     @staticmethod
-    def proofread(aggregator, scrolls):
+    def proofread(aggregator, scrolls, jobs = 1, incremental = False):
         '''
         Look for errors in a scrolls
         
@@ -1281,6 +1555,8 @@ class LibSpike(LibSpikeHelper):
                      Feed a scroll, 1, error message:str when a error is found
         
         @param   scrolls:list<str>  Scrolls to proofread
+        @param   jobs:int           The number of scrolls to proofread in parallel
+        @param   incremental:bool   Whether to skip scrolls that have already passed with this version of Spike
         @return  :byte              Exit value, see description of `LibSpike`, the possible ones are: 0, 6, 22
         '''
         # TODO proofread `metalicense` and check for conflicts in `freedom`
@@ -1288,158 +1564,51 @@ class LibSpike(LibSpikeHelper):
         (error, n) = (0, len(scrolls))
         scrollfiles = [(scrolls[i], LibSpikeHelper.locate_scroll(scrolls[i]), i) for i in range(n)]
         
-        allowed_options = 'strip docs info man licenses changelogs libtool docs= docs=gz docs=xz info= info=gz info=xz man= man=gz man=xz upx'.split(' ')
-        method_specs = {'ride'           : 'private',
-                        'build'          : 'startdir srcdir pkgdir private',
-                        'check'          : 'startdir srcdir pkgdir private',
-                        'package'        : 'startdir srcdir pkgdir private',
-                        'patch_build'    : 'startdir srcdir pkgdir private',
-                        'patch_check'    : 'startdir srcdir pkgdir private',
-                        'patch_package'  : 'startdir srcdir pkgdir private',
-                        'pre_install'    : 'tmpdir rootdir private',
-                        'post_install'   : 'tmpdir rootdir installedfiles private',
-                        'pre_upgrade'    : 'tmpdir rootdir installedfiles private',
-                        'post_upgrade'   : 'tmpdir rootdir installedfiles private',
-                        'pre_uninstall'  : 'tmpdir rootdir installedfiles private',
-                        'post_uninstall' : 'tmpdir rootdir installedfiles private'}
-        
-        def ishex(x):
-            for i in range(len(x)):
-                if x[i] not in '0123456789ABCDEFabcdef':
-                    return False
-            return True
-        
-        def ispony(x):
-            chars = set(('-', '+'))
-            for (start, end) in (('0', '9'), ('a', 'z')):
-                for c in range(ord(start), ord(end) + 1):
-                    chars.add(chr(c))
-            for i in range(len(x)):
-                if x[i] not in chars:
-                    return False
-            if x.startswith('.') or x.startswith('-'):
-                return False
-            return 0 < len(x) <= 64
-        
-        def isscroll(x):
-            s = ScrollVersion(x if ': ' not in x else x[:x.find(': ')])
-            if s.name is None:
-                return False
-            return ispony(s.name)
-        
-        for (scroll, scrollfile, i) in scrollfiles:
-            # Set environment variables (re-export before each scroll in case a scroll changes it)
-            ScrollMagick.export_environment()
-            
-            aggregator(scroll, 0, i, n)
-            if scrollfile is None:
-                error = max(error, 6)
-                aggregator(scroll, 1, 'Scroll not found')
-            else:
-                try:
-                    # Read scroll
-                    globs = globals()
-                    ScrollMagick.init_fields(globs)
-                    ScrollMagick.init_methods(globs)
-                    ScrollMagick.execute_scroll(scrollfile, globs)
-                    scrollmagick = ScrollMagick(globs)
-                    
-                    # TODO look for autoconflicts
-                    # Proofread scroll fields
-                    scrollmagick.check_type_format('pkgname', False, str, ispony)
-                    scrollmagick.check_type_format('pkgver', False, str, lambda x : isscroll('x=' + x))
-                    scrollmagick.check_type_format('pkgrel', False, int, lambda x : x >= 1)
-                    scrollmagick.check_type_format('epoch', False, int, lambda x : x >= 0)
-                    
-                    version_a = '%s=%i:%s-%i' % (pkgname, epoch, pkgver, pkgrel)
-                    version_b = scrollfile.replace(os.sep, '/').split('/')[-1][:-len('.scroll')]
-                    (version_a, version_b) = (ScrollVersion(version_a), ScrollVersion(version_b))
-                    if (version_b.name is False) or ('<' in version_b.full) or ('>' in version_b.full):
-                        raise Exception('Scroll file name is badly formated')
-                    if version_a not in version_b:
-                        raise Exception('Version and name fields conflicts with scroll file name')
-                    
-                    scrollmagick.check_type_format(['pkgdesc', 'upstream'], True, str, lambda x : len(x) > 0)
-                    scrollmagick.check_is_list_format('arch', False, str, lambda x : len(x) > 0)
-                    if len(arch) == 0:
-                        raise Exception('Field \'arch\' may not be empty')
-                    
-                    scrollmagick.check_type_format('freedom', False, int, lambda x : 0 <= x < (1 << 8))
-                    scrollmagick.check_is_list_format('license', False, str, lambda x : len(x) > 0)
-                    scrollmagick.check_type_format('private', False, int, lambda x : 0 <= x < 3)
-                    scrollmagick.check_type('interactive', False, bool)
-                    scrollmagick.check_is_list_format(['conflicts', 'replaces', 'provides'], False, str, isscroll)
-                    scrollmagick.check_type_format(['extension', 'variant', 'patches'], True, str, ispony)
-                    scrollmagick.check_type_format('reason', True, str, lambda x : len(x) > 0)
-                    scrollmagick.check_is_list_format(['patchbefore', 'patchafter'], False, str, isscroll)
-                    scrollmagick.check_is_list_format('groups', False, str, ispony)
-                    scrollmagick.check_is_list_format(['depends', 'makedepends', 'checkdepends', 'optdepends'], False, str, lambda x : len(x) == 0 or isscroll(x))
-                    scrollmagick.check_is_list('noextract', False, str)
-                    
-                    scrollmagick.check_is_list('source', False, str, list)
-                    elements = set()
-                    for element in source:
-                        if isinstance(element, list):
-                            if len(element) < 2:
-                                raise Exception('Lists in field \'source\' must be at least of length 2')
-                            for elem in element:
-                                if elem is None:
-                                    raise Exception('Lists in field \'source\' may not contain `None`')
-                                elif isinstance(elem, str):
-                                    raise Exception('Lists in field \'source\' is restricted to str elements')
-                            if len(element[0]):
-                                raise Exception('Source file in field \'source\' may not be empty')
-                            element = element[1]
-                        if element == '':
-                            raise Exception('Destination file in field \'source\' may not be empty')
-                        if element in elements:
-                            raise Exception('Duplicate destination file \'%s\' in field \'source\'', element)
-                        else:
-                            elements.add(element)
-                    
-                    scrollmagick.check_is_list_format('sha3sums', True, str, lambda x : len(x) == 144 and ishex(x))
-                    if len(sha3sums) != len(source):
-                        raise Exception('Fields \'sha3sums\' and \'source\' must be of same size')
-                    
-                    for field in ('noextract', 'backup'):
-                        have = set()
-                        value = globals()[field]
-                        for element in value:
-                            if element not in elements:
-                                raise Exception('Field \'%s\' may only contain destination files from \'source\'' % field)
-                            if element in have:
-                                raise Exception('Field \'%s\' contains duplicate file \'%s\'', (field, element))
-                            have.add(element)
-                    
-                    scrollmagick.check_is_list_elements('options', False, str, allowed_options)
-                    
-                    # Proofread scroll methods
-                    if ride is None:
-                        raise Exception('Method \'ride\' should be default, in worst case just echo some information')
-                    if package is None:
-                        raise Exception('Method \'package\' must be default, even if does nothing')
-                    
-                    for method in method_specs.keys():
-                        if globals()[method] is None:
-                            continue
-                        (args, varargs, keywords, defaults) = inspect.getargspec(globals()[method])
-                        if varargs  is not None:  raise Exception('Methods should not use varargs (i.e. *variables)')
-                        if keywords is not None:  raise Exception('Methods should not use keywords (i.e. **variables)')
-                        if defaults is not None:  raise Exception('Methods should specify default values for parameters')
-                        params_str = '(%s)' % method_specs[method].replace(' ', ', ')
-                        params_list = list(method_specs[method].split(' '))
-                        if list(args) != params_list:
-                            raise Exception('Method \'%s\' should have the parameters %s with those exact names', (method, params_str))
-                    
-                    # Proofread using extensions
-                    scrollmagick.addon_proofread(scroll, scrollfile)
-                    
-                except Exception as err:
-                    error = max(error, 22)
-                    if os.getenv('SPIKE_DEBUG', '').lower() == 'yes':
-                        import traceback
-                        traceback.print_exc()
-                    aggregator(scroll, 1, str(err))
+        # Get scrolls that have already passed
+        (store, passed, fingerprints) = (None, set(), [None] * n)
+        if incremental:
+            store = CacheStore(SPIKE_PATH, 'proofread')
+            data = store.load()
+            if isinstance(data, tuple) and (len(data) == 2) and (data[0] == SPIKE_VERSION):
+                passed = data[1]
+            for (scroll, scrollfile, i) in scrollfiles:
+                if scrollfile is not None:
+                    fingerprints[i] = Proofreader.fingerprint(scrollfile, SPIKE_VERSION)
+        passcount = len(passed)
+        
+        # Proofread scrolls, in parallel if requested, but report in order
+        tasks = [(scroll, scrollfile) for (scroll, scrollfile, i) in scrollfiles
+                 if (scrollfile is not None) and (fingerprints[i] not in passed)]
+        pool = None
+        if (jobs > 1) and (len(tasks) > 1):
+            import threading
+            import multiprocessing
+            # Forking a multi-threaded process, such as the daemon, can deadlock the children
+            method = 'fork' if threading.active_count() == 1 else 'spawn'
+            pool = multiprocessing.get_context(method).Pool(min(jobs, len(tasks)))
+            results = pool.imap(Proofreader.proofread, tasks)
+        else:
+            results = map(Proofreader.proofread, tasks)
+        try:
+            for (scroll, scrollfile, i) in scrollfiles:
+                aggregator(scroll, 0, i, n)
+                if scrollfile is None:
+                    error = max(error, 6)
+                    aggregator(scroll, 1, 'Scroll not found')
+                elif fingerprints[i] not in passed:
+                    message = next(results)
+                    if message is not None:
+                        error = max(error, 22)
+                        aggregator(scroll, 1, message)
+                    elif incremental:
+                        passed.add(fingerprints[i])
+        finally:
+            if pool is not None:
+                pool.terminate()
+        
+        # Remember scrolls that have passed
+        if incremental and (len(passed) != passcount):
+            store.save((SPIKE_VERSION, passed))
         return error
     
     
@@ -1462,72 +1631,37 @@ class LibSpike(LibSpikeHelper):
         # Create id → scroll map
         DB = DBCtrl(SPIKE_PATH)
         sink = DB.open_db(private, DB_PONY_NAME, DB_PONY_ID).list([])
-        id_scroll = {}
-        for (scroll, id) in sink:
-            id_scroll[id] = scroll
-        
-        # Queues for removable ponies
-        queue = []
-        newqueue = []
-        def found(id):
-            queue.append(id)
-            newqueue.append(id)
-            aggregator(id_scroll[id], 0, 1)
-        
-        # Get all ponies mapped to which packages have those as a dependency
-        sink = DB.open_db(private, DB_PONY_DEP, DB_PONY_ID).list([])
-        deps_id = {}
-        for (deps, id) in sink:
-            if deps not in id_scroll:
+        id_scroll = DBCtrl.transpose({}, sink, DB_PONY_ID, None)
+        for id in id_scroll.keys():
+            if len(id_scroll[id]) != 1:
                 return 27
-            if deps not in deps_id:
-                deps_id[deps] = set()
-            deps_id[deps].add(DBCtrl.value_convert(id, CONVERT_INT))
-        
-        # Forget explicitly installed ponies
-        iterator_remove(deps_id, lambda deps : deps_id[deps])
+            id_scroll[id] = id_scroll[id][0]
+        
+        # Read the reverse dependency index, ponies in it are installed as dependencies
+        implicit = set()
+        sink = DB.open_db(private, DB_PONY_DEPS, DB_PONY_ID).list([])
+        requirers = DBCtrl.tablise({}, sink, DB_PONY_ID, implicit.add, False)
+        implicit.update(requirers.keys())
+        dependencies = {}
+        for deps in requirers.keys():
+            for id in requirers[deps]:
+                if (deps not in id_scroll) or (id not in id_scroll):
+                    return 27
+                dict_append(dependencies, id, deps)
         
-        # Get minimal set of ponies that must be removed at the same time that can be cleaned (Not the normal meaning of 'clique')
-        def get_clique(deps, clique, visited):
-            if deps in visited:
-                return None
-            else:
-                visited.add(deps)
-            ids = deps_id[deps]
-            for id in ids:
-                if id not in deps_id:
-                    return None
-            clique.add(deps)
-            for id in ids:
-                if id not in clique:
-                    if get_clique(id, clique, visited) is None:
-                        return None
-            return clique
-        
-        # Enqueue cleanable ponies
-        while True:
-            newqueue[:] = []
-            for deps in deps_id.keys():
-                if len(deps_id[deps]) == 0:
-                    found(deps)
-            if len(newqueue) == 0:
-                visited = set()
-                for deps in deps_id.keys():
-                    if deps not in visited:
-                        clique = get_clique(deps, set(), visited)
-                        if clique is not None:
-                            newqueue.expand(list(clique))
-                            break
-                if len(newqueue) == 0:
-                    break
-            for deps in newqueue:
-                del deps_id[deps]
+        # Mark ponies needed by explicitly installed ponies, and enqueue the rest
+        needed = reachable([id for id in id_scroll.keys() if id not in implicit], dependencies)
+        queue = [id_scroll[id] for id in id_scroll.keys() if id not in needed]
+        if len(queue) == 0:
+            return 0
+        for scroll in queue:
+            aggregator(scroll, 0, 1)
         
         # Erase ponies
         def agg(scroll, state, end):
             if state != 0:
                 aggregator(scroll, state, end)
-        return erase(agg, queue, private = private)
+        return LibSpike.erase(agg, queue, private = private)
     
     
     @staticmethod
@@ -22,9 +22,11 @@ import os
 
 from database.spikedb import *
 from database.dbctrl import *
+from database.catalogue import *
 from algorithmic.algospike import *
 from algorithmic.sha3sum import *
 from library.gitcord import *
+from library.spikeclient import *
 from dragonsuite import *
 
 
@@ -39,6 +41,11 @@ SPIKE_PROGNAME = 'spike'
 The program name of Spike
 '''
 
+SPIKE_VERSION = '0.1'
+'''
+This version of spike
+'''
+
 
 
 class LibSpikeHelper():
@@ -59,6 +66,17 @@ class LibSpikeHelper():
         ## FIXME private locks must be supported for non-root
     
     
+    @staticmethod
+    def get_socket_file(spike_path):
+        '''
+        Gets the file name of the Spike daemon's socket
+        
+        @param   spike_path:str  Spike's location
+        @return  :str            The socket's file name
+        '''
+        return SpikeDaemonClient.get_socket_file(spike_path)
+    
+    
     @staticmethod
     def lock(exclusive):
         '''
@@ -206,35 +224,22 @@ class LibSpikeHelper():
                     if os.path.isdir(repo) and (repo not in repositories):
                         repositories.add(repo)
         
-        # Get category paths
-        paths = []
-        for repo in repositories:
-            for cat in os.listdir(repo):
-                path = '%s/%s' % (repo, cat)
-                if os.path.isdir(path):
-                    paths.append(path)
-        
         # Get scrolls
         rc = []
-        for path in paths:
-            for candidate in os.listdir(path):
-                if (not candidate.startswith('.')) and (not candidate.startswith('-')):
-                    if candidate.endswith('.scroll'):
-                        rc.append('%s/%s' % (path, candidate))
+        for repo in repositories:
+            rc += [file for (_cat, _scroll, file) in Catalogue.get(repo).files()]
         return rc
     
     
     @staticmethod
-    def locate_scroll(scroll, installed = False, private = None):
+    def locate_repositories(installed = False, private = None):
         '''
-        Locate the file for a scroll
+        Locate the scroll repositories
         
-        @param   scroll:str      The scroll
-        @parm    installed:bool  Whether the scroll is installed
-        @parm    private:bool?   Whether the scroll is installed privately, `None` for whatever
-        @return  :str            The file of the scroll
+        @parm    installed:bool   Whether the repositories are of installed scrolls
+        @parm    private:bool?    Whether the repositories are of privately installed scrolls, `None` for whatever
+        @return  :dict<str, str>  Map from repository names to their directories
         '''
-        # Get repository names and paths
         repositories = {}
         superrepo = 'installed' if installed else 'repositories'
         home = os.environ['HOME'].replace(os.sep, '/') + '/'
@@ -250,6 +255,21 @@ class LibSpikeHelper():
                     repo = os.path.realpath(file + '/' + repo)
                     if os.path.isdir(repo) and (reponame not in repositories):
                         repositories[reponame] = repo
+        return repositories
+    
+    
+    @staticmethod
+    def locate_scroll(scroll, installed = False, private = None):
+        '''
+        Locate the file for a scroll
+        
+        @param   scroll:str      The scroll
+        @parm    installed:bool  Whether the scroll is installed
+        @parm    private:bool?   Whether the scroll is installed privately, `None` for whatever
+        @return  :str            The file of the scroll
+        '''
+        # Get repository names and paths
+        repositories = LibSpikeHelper.locate_repositories(installed, private)
         
         # Split scroll parameter into logical parts
         (cat, scrl) = (None, None)
@@ -267,27 +287,16 @@ class LibSpikeHelper():
         else:
             return None
         
-        # Get category paths
-        paths = []
-        if cat is not None:
-            for repo in repositories:
-                paths.append('%s/%s' % (repositories[repo], cat))
-        else:
-            for repo in repositories:
-                repo = repositories[repo]
-                for cat in os.listdir(repo):
-                    path = '%s/%s' % (repo, cat)
-                    if os.path.isdir(path):
-                        paths.append(path)
-        
-        # Get scroll candidates
-        paths = ['%s/%s.scroll' % (path, scrl) for path in paths]
+        # Look up scroll in the repositories' catalogues
+        rc = []
+        for repo in repositories:
+            files = Catalogue.get(repositories[repo]).lookup(scrl)
+            if cat is None:
+                rc += list(files.values())
+            elif cat in files:
+                rc.append(files[cat])
         
         # Choose scroll file
-        rc = []
-        for path in paths:
-            if os.path.lexists(path) and os.path.isfile(path):
-                rc.append(path)
         if len(rc) > 1:
             printerr('%s: \033[01;31m%s\033[00m' % (SPIKE_PROGNAME, 'Multiple scrolls found, there should only be one!'));
         return rc[0] if len(rc) == 1 else None
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+spike – a package manager running on top of git
+
+Copyright © 2012, 2013, 2014  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import os
+import sys
+import json
+import socket
+import hashlib
+
+from auxiliary.auxfunctions import *
+from auxiliary.scrollmagick import *
+
+
+
+DAEMON_METHODS = {'find_scroll'  : False,
+                  'find_text'    : False,
+                  'find_owner'   : True,
+                  'read_files'   : False,
+                  'read_info'    : False,
+                  'proofread'    : False,
+                  'example_shot' : False,
+                  'sha3sum'      : True}
+'''
+LibSpike methods the daemon serves, mapped to whether their first parameter
+after the aggregator is a list of file names that are relative to the
+client's working directory, and are fed back as the first parameter to
+the aggregator
+'''
+
+
+
+class SpikeDaemonClient():
+    '''
+    Forwards requests to the Spike daemon, this module does not load LibSpike
+    so that requests served by the daemon do not have to wait for it
+    '''
+    
+    def __init__(self, socket_file = None):
+        '''
+        Constructor
+        
+        @param  socket_file:str?  The daemon's socket, `None` for default
+        '''
+        self.socket_file = SpikeDaemonClient.get_socket_file(SpikeDaemonClient.spike_path()) if socket_file is None else socket_file
+    
+    
+    @staticmethod
+    def spike_path():
+        '''
+        Get Spike's location, the same way as LibSpike does
+        
+        @return  :str  Spike's location, with a trailing slash
+        '''
+        if 'SPIKE_PATH' not in os.environ:
+            spike_path = os.path.realpath(sys.argv[0])
+            spike_path = os.path.dirname(os.path.dirname(spike_path))
+            os.environ['SPIKE_PATH'] = spike_path
+        spike_path = os.environ['SPIKE_PATH']
+        return spike_path if spike_path.endswith('/') else (spike_path + '/')
+    
+    
+    @staticmethod
+    def get_socket_file(spike_path):
+        '''
+        Gets the file name of the Spike daemon's socket
+        
+        @param   spike_path:str  Spike's location
+        @return  :str            The socket's file name
+        '''
+        # One socket per user and Spike location, a daemon will only serve its own user and Spike
+        spike_path = hashlib.sha3_256(spike_path.encode('utf-8')).hexdigest()[:16]
+        return '/dev/shm/spike-%i-%s.socket' % (os.getuid(), spike_path)
+    
+    
+    @staticmethod
+    def get_environment():
+        '''
+        Get the environment variables that affects the result of a request
+        
+        @return  :dict<str, str>  Environment variable → value
+        '''
+        ScrollMagick.export_environment()
+        rc = {}
+        for var in ('SPIKE_PATH', 'HOME', 'XDG_CONFIG_HOME', 'XDG_CONFIG_DIRS', 'ARCH', 'HOST', 'SPIKE_DEBUG'):
+            rc[var] = os.getenv(var, None)
+        for var in os.environ:
+            if var.lower().startswith('i_use_'):
+                rc[var] = os.environ[var]
+        return rc
+    
+    
+    @staticmethod
+    def encode(value):
+        '''
+        Encode a value as JSON serialisable data that `decode` restores
+        
+        @param   value:¿E?  The value, tuples, lists, sets, dictionaries, byte strings, strings, numbers,
+                            booleans and `None` are restored exactly, other values are restored as strings
+        @return  :¿E?       The value as JSON serialisable data
+        '''
+        encode = SpikeDaemonClient.encode
+        if (value is None) or isinstance(value, (str, bool, int, float)):
+            return value
+        elif isinstance(value, list):
+            return [encode(element) for element in value]
+        elif isinstance(value, tuple):
+            return {'tuple' : [encode(element) for element in value]}
+        elif isinstance(value, (set, frozenset)):
+            return {'set' : [encode(element) for element in value]}
+        elif isinstance(value, dict):
+            return {'dict' : [[encode(key), encode(value[key])] for key in value]}
+        elif isinstance(value, bytes):
+            return {'bytes' : value.hex()}
+        else:
+            return str(value)
+    
+    
+    @staticmethod
+    def decode(value):
+        '''
+        Decode a value encoded with `encode`
+        
+        @param   value:¿E?  The value as JSON serialisable data
+        @return  :¿E?       The value
+        '''
+        decode = SpikeDaemonClient.decode
+        if isinstance(value, list):
+            return [decode(element) for element in value]
+        elif not isinstance(value, dict):
+            return value
+        elif 'tuple' in value:
+            return tuple(decode(element) for element in value['tuple'])
+        elif 'set' in value:
+            return set(decode(element) for element in value['set'])
+        elif 'dict' in value:
+            return dict((decode(key), decode(element)) for (key, element) in value['dict'])
+        else:
+            return bytes.fromhex(value['bytes'])
+    
+    
+    @staticmethod
+    def send(sock, message):
+        '''
+        Send a message over a socket
+        
+        @param  sock:socket   The socket
+        @param  message:¿E?   The message, it is encoded with `encode`
+        '''
+        message = json.dumps(SpikeDaemonClient.encode(message)).encode('utf-8')
+        sock.sendall(len(message).to_bytes(4, 'big') + message)
+    
+    
+    @staticmethod
+    def receive(sock):
+        '''
+        Receive a message over a socket
+        
+        @param   sock:socket  The socket
+        @return  :¿E??        The message, decoded with `decode`, `None` if the other end hung up
+        '''
+        def read(n):
+            buf = b''
+            while len(buf) < n:
+                chunk = sock.recv(n - len(buf))
+                if len(chunk) == 0:
+                    return None
+                buf += chunk
+            return buf
+        n = read(4)
+        if n is None:
+            return None
+        message = read(int.from_bytes(n, 'big'))
+        if message is None:
+            return None
+        return SpikeDaemonClient.decode(json.loads(message.decode('utf-8')))
+    
+    
+    def request(self, method, aggregator, *args):
+        '''
+        Invoke a LibSpike method in the daemon
+        
+        @param   method:str      The name of the method in `LibSpike`
+        @param   aggregator:(*)  The aggregator for the method, it is invoked in this process
+        @param   args:*¿E?       The rest of the arguments for the method
+        @return  :byte?          Exit value, see description of `LibSpike`, `None` if the request
+                                 was not served and should be made without the daemon
+        '''
+        if (method not in DAEMON_METHODS) or not os.path.exists(self.socket_file):
+            return None
+        try:
+            if os.stat(self.socket_file).st_uid != os.getuid():
+                return None
+        except:
+            return None
+        
+        # Make file names absolute, but feed them back as specified
+        args = list(args)
+        files = None
+        if DAEMON_METHODS[method]:
+            files = make_dictionary([(os.path.abspath(file), file) for file in args[0]])
+            args[0] = [os.path.abspath(file) for file in args[0]]
+        
+        fed = False
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.socket_file)
+            request = {'method' : method, 'args' : args, 'environment' : SpikeDaemonClient.get_environment()}
+            SpikeDaemonClient.send(sock, request)
+            while True:
+                message = SpikeDaemonClient.receive(sock)
+                if message is None:
+                    return 255 if fed else None
+                if 'exit' in message:
+                    return message['exit']
+                if 'refused' in message:
+                    return None
+                feed = message['feed']
+                if files is not None:
+                    feed[0] = files[feed[0]] if feed[0] in files else feed[0]
+                fed = True
+                aggregator(*feed)
+        except:
+            if fed:
+                raise
+            return None
+        finally:
+            sock.close()
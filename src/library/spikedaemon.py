@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+spike – a package manager running on top of git
+
+Copyright © 2012, 2013, 2014  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import os
+import sys
+import signal
+import socket
+import threading
+import socketserver
+
+from library.libspike import *
+from library.spikeclient import *
+
+
+
+class SpikeDaemon():
+    '''
+    Spike daemon, keeps LibSpike initialised and serves read-only
+    requests, concurrently, over a Unix domain socket
+    '''
+    
+    def __init__(self, socket_file = None):
+        '''
+        Constructor
+        
+        @param  socket_file:str?  The socket to listen on, `None` for default
+        '''
+        self.socket_file = LibSpike.get_socket_file(SPIKE_PATH) if socket_file is None else socket_file
+        self.environment = None
+        self.readers = 0
+        self.readers_mutex = threading.Lock()
+    
+    
+    def serve(self):
+        '''
+        Start serving requests, returns when interrupted
+        
+        @return  :byte  Exit value, see description of `LibSpike`, the possible ones are: 0, 13
+        '''
+        if os.path.exists(self.socket_file):
+            # Check whether there is already a daemon running, otherwise remove the stale socket
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.socket_file)
+                return 13
+            except:
+                os.unlink(self.socket_file)
+            finally:
+                sock.close()
+        
+        LibSpike.initialise()
+        self.environment = SpikeDaemonClient.get_environment()
+        daemon = self
+        
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                daemon.handle(self.request)
+        
+        class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+        
+        # Stop gracefully on SIGTERM as well as on SIGINT
+        def terminate(signo, frame):
+            raise KeyboardInterrupt()
+        signal.signal(signal.SIGTERM, terminate)
+        
+        umask = os.umask(0o077)
+        try:
+            server = Server(self.socket_file, Handler)
+        finally:
+            os.umask(umask)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            if os.path.exists(self.socket_file):
+                os.unlink(self.socket_file)
+        return 0
+    
+    
+    def handle(self, sock):
+        '''
+        Serve one request
+        
+        @param  sock:socket  The connection to the client
+        '''
+        # Only serve our own user, the socket is private but check anyway
+        try:
+            import struct
+            creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+            (_pid, uid, _gid) = struct.unpack('3i', creds)
+            if uid != os.getuid():
+                return
+        except:
+            pass
+        
+        request = SpikeDaemonClient.receive(sock)
+        if request is None:
+            return
+        method = request['method']
+        if (method not in DAEMON_METHODS) or (request['environment'] != self.environment):
+            SpikeDaemonClient.send(sock, {'refused' : True})
+            return
+        
+        def aggregator(*args):
+            SpikeDaemonClient.send(sock, {'feed' : list(args)})
+        
+        # Hold a shared lock while there are any requests being served
+        with self.readers_mutex:
+            if self.readers == 0:
+                LibSpike.lock(False)
+            self.readers += 1
+        try:
+            exit_value = 255
+            try:
+                exit_value = getattr(LibSpike, method)(aggregator, *(request['args']))
+            except BrokenPipeError:
+                return
+            except:
+                if os.getenv('SPIKE_DEBUG', '').lower() == 'yes':
+                    import traceback
+                    traceback.print_exc()
+            SpikeDaemonClient.send(sock, {'exit' : exit_value})
+        finally:
+            with self.readers_mutex:
+                self.readers -= 1
+                if self.readers == 0:
+                    if Installer.index is not None:
+                        Installer.index.save()
+                    if ScrollMagick.code_cache is not None:
+                        ScrollMagick.code_cache.evict()
+                    LibSpike.unlock()
+
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+spike – a package manager running on top of git
+
+Copyright © 2012, 2013, 2014  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+'''
+Test for this directory
+'''
+import io
+import os
+import sys
+import shutil
+import socket
+import tarfile
+import tempfile
+import threading
+import http.server
+
+from downloader import *
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from library.spikeclient import *
+
+
+errno = 0
+def error(message, ok = False):
+    global errno
+    if not ok:
+        errno = 2
+        print('\033[31m%s\033[00m' % message)
+
+
+
+
+# Stand-in for a remote host, it supports keep-alive and range requests, and counts the connections
+files = dict(('/patch-%i.patch' % i, ('patch %i\n' % i).encode('utf-8') * 1000) for i in range(40))
+files['/moved'] = None
+files['/misranged'] = files['/patch-5.patch']
+archive = io.BytesIO()
+with tarfile.open(fileobj = archive, mode = 'w:gz') as tar:
+    info = tarfile.TarInfo('package/README')
+    info.size = len(files['/patch-3.patch'])
+    tar.addfile(info, io.BytesIO(files['/patch-3.patch']))
+files['/package.tar.gz'] = archive.getvalue()
+requests, connections = [], []
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    def setup(self):
+        connections.append(self.client_address)
+        http.server.BaseHTTPRequestHandler.setup(self)
+    def do_GET(self):
+        requests.append((self.path, self.headers.get('Range', None)))
+        if self.path not in files:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if files[self.path] is None:
+            self.send_response(302)
+            self.send_header('Location', '/patch-0.patch')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        data = files[self.path]
+        etag = '"%s"' % self.path
+        offset = 0
+        if (self.headers.get('Range', None) is not None) and (self.headers.get('If-Range', etag) == etag):
+            offset = int(self.headers['Range'][len('bytes='):-1])
+            if offset >= len(data):
+                self.send_response(416)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            if self.path == '/misranged':
+                offset = 0
+            self.send_header('Content-Range', 'bytes %i-%i/%i' % (offset, len(data) - 1, len(data)))
+        else:
+            self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(data) - offset))
+        self.end_headers()
+        self.wfile.write(data[offset:])
+    def log_message(self, *_):
+        pass
+server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+threading.Thread(target = server.serve_forever, daemon = True).start()
+url = 'http://127.0.0.1:%i' % server.server_address[1]
+directory = tempfile.mkdtemp()
+
+
+downloader = Downloader(4)
+names = sorted(name for name in files if name.endswith('.patch'))
+failures = downloader.download_all([(url + name, directory + name, None) for name in names])
+error('Downloader.download_all failed to download files', failures == [])
+error('Downloader.download_all did not download the files correctly',
+      all(open(directory + name, 'rb').read() == files[name] for name in names))
+error('Downloader.download_all did not reuse connections', len(connections) <= 4)
+error('Downloader.download_all left partial downloads', not any(name.endswith('.part') for name in os.listdir(directory)))
+
+
+def partial(name, data, validator):
+    with open(directory + name + '.part', 'wb') as file:
+        file.write(data)
+    if validator is not None:
+        with open(directory + name + '.part.validator', 'wb') as file:
+            file.write(validator.encode('utf-8'))
+
+partial('/resumed', files['/patch-1.patch'][:100], '"/patch-1.patch"')
+requests.clear()
+downloader.download(url + '/patch-1.patch', directory + '/resumed')
+error('Downloader.download did not resume the download', requests == [('/patch-1.patch', 'bytes=100-')])
+error('Downloader.download did not resume the download correctly', open(directory + '/resumed', 'rb').read() == files['/patch-1.patch'])
+error('Downloader.download left the validator', not os.path.exists(directory + '/resumed.part.validator'))
+
+for (name, data, validator, message) in (('/unvalidated', b'x' * 100, None, 'without a validator'),
+                                         ('/changed', b'x' * 100, '"old"', 'with a changed validator'),
+                                         ('/oversized', b'x' * 20000, '"/patch-1.patch"', 'that is larger than the file')):
+    partial(name, data, validator)
+    downloader.download(url + '/patch-1.patch', directory + name)
+    error('Downloader.download did not restart a partial download %s' % message,
+          open(directory + name, 'rb').read() == files['/patch-1.patch'])
+
+partial('/misranged', files['/patch-5.patch'][:100], '"/misranged"')
+downloader.download(url + '/misranged', directory + '/misranged')
+error('Downloader.download accepted a partial response that does not resume the download',
+      open(directory + '/misranged', 'rb').read() == files['/patch-5.patch'])
+
+
+received = []
+partial('/observed', files['/patch-2.patch'][:100], '"/patch-2.patch"')
+downloader.download(url + '/patch-2.patch', directory + '/observed', received.append)
+error('Downloader.download did not feed the observer the entire file', b''.join(received) == files['/patch-2.patch'])
+
+
+extractor = TarStream(directory + '/src')
+downloader.download(url + '/package.tar.gz', directory + '/package.tar.gz', extractor)
+error('TarStream did not extract the archive', extractor.close())
+error('TarStream did not extract the archive correctly', open(directory + '/src/package/README', 'rb').read() == files['/patch-3.patch'])
+error('TarStream.supported does not work', TarStream.supported('a.tar.xz') and not TarStream.supported('a.zip'))
+
+extractor = TarStream(directory + '/src')
+extractor(files['/patch-4.patch'])
+error('TarStream extracted a file that is not an archive', not extractor.close())
+
+extractor = TarStream(directory + '/truncated')
+with open(directory + '/package.tar.gz', 'rb') as file:
+    extractor(file.read()[:64])
+error('TarStream extracted a truncated archive', not extractor.close())
+error('TarStream.close did not stop the extraction', not extractor.thread.is_alive())
+error('TarStream.close cannot be called again', not extractor.close())
+
+
+count = len(connections)
+redirected = Downloader(1)
+redirected.download(url + '/moved', directory + '/moved')
+redirected.close()
+error('Downloader.download did not follow redirection', open(directory + '/moved', 'rb').read() == files['/patch-0.patch'])
+error('Downloader.download did not reuse the connection after redirection', len(connections) == count + 1)
+
+
+failures = downloader.download_all([(url + '/missing', directory + '/missing', None)])
+error('Downloader.download_all did not report missing file', (len(failures) == 1) and (failures[0][0] == url + '/missing'))
+error('Downloader.download_all created missing file', not os.path.exists(directory + '/missing'))
+
+
+downloader.close()
+server.shutdown()
+shutil.rmtree(directory)
+
+
+(left, right) = socket.socketpair()
+feed = ['core/example', ('core/example', 2), [('a', 'b')], {1 : [('core/example', 'bin/example')]}, {'x', ('y', 1)},
+        b'\x00\xff', None, True, 1.5, {'tuple' : 1}]
+SpikeDaemonClient.send(left, {'feed' : feed})
+error('SpikeDaemonClient did not restore the feed', SpikeDaemonClient.receive(right) == {'feed' : feed})
+SpikeDaemonClient.send(left, {'feed' : [ValueError('not found')]})
+error('SpikeDaemonClient did not send a value that is not JSON serialisable as a string',
+      SpikeDaemonClient.receive(right) == {'feed' : ['not found']})
+left.close()
+error('SpikeDaemonClient.receive did not notice the hang up', SpikeDaemonClient.receive(right) is None)
+right.close()
+
+
+
+
+if errno == 0:
+    print('\033[32m%s\033[00m' % 'Everyting seems to be working')
+exit(errno)
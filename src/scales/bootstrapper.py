@@ -21,6 +21,7 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import os
 
 from library.gitcord import *
+from database.catalogue import *
 
 
 class Bootstrapper():
@@ -71,4 +72,41 @@ class Bootstrapper():
         @return  :bool                   Whether the update was successful
         '''
         return Gitcord(repository).update_branch(verify_signatures)
-
+    
+    
+    @staticmethod
+    def catalogue(catalogue, valid):
+        '''
+        Update the catalogue of a repository, incrementally if it has been catalogued before
+        
+        @param  catalogue:Catalogue  The repository's catalogue, as loaded before the repository was updated
+        @param  valid:bool           Whether the catalogue was up to date before the repository was updated
+        '''
+        repository = catalogue.repository
+        gitcord = Gitcord(repository)
+        commit = gitcord.where_am_i() if os.path.isdir(repository + '/.git') else None
+        changes = None
+        if (commit is not None) and (catalogue.commit is not None) and valid:
+            changes = [] if commit == catalogue.commit else gitcord.what_changed(catalogue.commit)
+        
+        if changes is None:
+            # Catalogue from scratch
+            catalogue.rebuild()
+        else:
+            # Update only changed scrolls
+            for (filename, _old_mode, new_mode) in changes:
+                parts = filename.split('/')
+                if (len(parts) != 2) or parts[0].startswith('.'):
+                    continue
+                (category, scroll) = parts
+                cdir = '%s/%s' % (repository, category)
+                if (new_mode is not None) and Catalogue.is_scroll(cdir, scroll):
+                    catalogue.add(category, scroll[:-len('.scroll')])
+                elif scroll.endswith('.scroll'):
+                    catalogue.remove(category, scroll[:-len('.scroll')])
+            catalogue.refresh()
+        
+        catalogue.commit = commit
+        catalogue.save()
+        with Catalogue.mutex:
+            Catalogue.catalogues[repository] = catalogue
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+spike – a package manager running on top of git
+
+Copyright © 2012, 2013, 2014  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import os
+import sys
+import time
+
+
+
+class BuildScheduler():
+    '''
+    Module for libspike for running builds in parallel as a pipeline, the sources
+    for a build are fetched in the background as soon as the build is known, and
+    the build is started as soon as its sources have been fetched and the builds
+    it depends on have finished
+    
+    @variable  jobs:int                        The maximum number of builds, and of fetches, to run at the same time
+    @variable  fetch:(¿E?)?→¿F?                Function that fetches the sources for a build, `None` if builds fetch themselves
+    @variable  jobserver:Jobserver?            The jobserver shared by the builds, from which a token is taken
+                                               for every build but one that runs at the same time, `None` if none
+    @variable  stats:dict<str, [int, float]>   Stage name → the maximum number of builds waiting in the stage's queue,
+                                               and the total number of seconds builds have waited in the queue
+    '''
+    
+    def __init__(self, jobs = 1, fetch = None, jobserver = None):
+        '''
+        Constructor
+        
+        @param  jobs:int              The maximum number of builds, and of fetches, to run at the same time
+        @param  fetch:(¿E?)?→¿F?      Function that fetches the sources for a build, in a child process with its output
+                                      discarded, its return value must be serialisable with `pickle`, it shall raise an
+                                      exception on failure, `None` if builds fetch their sources themselves
+        @param  jobserver:Jobserver?  The jobserver shared by the builds, `None` if none
+        '''
+        import multiprocessing
+        self.context = multiprocessing.get_context('fork')
+        self.jobs = max(1, jobs)
+        self.fetch = fetch
+        self.jobserver = jobserver
+        self.stats = {'fetch' : [0, 0.0], 'build' : [0, 0.0]}
+        self.queue = []
+        self.fetching = {}
+        self.fetched = {}
+        self.known = set()
+    
+    
+    def prefetch(self, task):
+        '''
+        Start fetching the sources for a build in the background, unless already started
+        
+        @param  task:¿E?  The build
+        '''
+        if (self.fetch is not None) and (task not in self.known):
+            self.known.add(task)
+            self.queue.append((task, time.monotonic()))
+            self.pump()
+    
+    
+    def discard(self, task):
+        '''
+        Do not fetch the sources for a build, unless the fetch has already started
+        
+        @param  task:¿E?  The build
+        '''
+        self.queue = [(queued, at) for (queued, at) in self.queue if queued is not task]
+        self.known.add(task)
+    
+    
+    def pump(self):
+        '''
+        Collect finished fetches and start queued fetches
+        '''
+        self.collect(0)
+        stats = self.stats['fetch']
+        stats[0] = max(stats[0], len(self.queue))
+        while (len(self.queue) > 0) and (len(self.fetching) < self.jobs):
+            (task, queued) = self.queue.pop(0)
+            stats[1] += time.monotonic() - queued
+            self.fetching[self.start(self.fetch, task, True)[0]] = task
+    
+    
+    def collect(self, timeout, builds = None):
+        '''
+        Wait for fetches or builds to finish
+        
+        @param   timeout:float?                            The number of seconds to wait at most, `None` to wait until one has finished
+        @param   builds:dict<Connection, (¿E?, Process)>?  Running builds, `None` if none
+        @return  :list<(¿E?, bool, ¿R?)>                   Finished builds, whether they were successful, and their result or error message
+        '''
+        import multiprocessing.connection
+        rc = []
+        builds = {} if builds is None else builds
+        readers = list(self.fetching.keys()) + list(builds.keys())
+        if len(readers) == 0:
+            return rc
+        for reader in multiprocessing.connection.wait(readers, timeout):
+            try:
+                (ok, result) = reader.recv()
+            except EOFError:
+                (ok, result) = (False, 'Process died')
+            reader.close()
+            if reader in self.fetching:
+                self.fetched[self.fetching.pop(reader)] = (ok, result)
+            else:
+                (task, process) = builds.pop(reader)
+                process.join()
+                rc.append((task, ok, result))
+        return rc
+    
+    
+    def start(self, function, task, quiet):
+        '''
+        Start a fetch or a build in a child process
+        
+        @param   function:(¿E?)→¿R?      The function to run in the child process
+        @param   task:¿E?                The build
+        @param   quiet:bool              Whether to discard the output of the child process
+        @return  :(Connection, Process)  Connection from which the result is received, and the child process
+        '''
+        (reader, writer) = self.context.Pipe(False)
+        process = self.context.Process(target = BuildScheduler.work, args = (writer, function, task, quiet))
+        process.daemon = True
+        process.start()
+        writer.close()
+        return (reader, process)
+    
+    
+    def run(self, tasks, build, aggregator):
+        '''
+        Run builds, when a build fails no more builds are started, but those already running are finished
+        
+        @param   tasks:list<(¿E?, itr<¿E?>, bool)>  The builds in topological order, each with the builds it must wait for, those
+                                                    that are not in the list are ignored, and whether it must be run in the
+                                                    foreground without any other build running, for example because it is interactive
+        @param   build:(¿E?)→¿R?                    Function that performs a build, in a child process unless running in the foreground,
+                                                    its return value must be serialisable with `pickle`, it shall raise an exception on failure
+        @param   aggregator:(¿E?, int, [*])→void    Feed a build and 0 when it is started, a build, 1 and its result when it has finished,
+                                                    and a build, 2 and the result of the fetch when its sources have been fetched
+        @return  :(dict<¿E?, ¿R?>, (¿E?, str)?)     The result of each finished build, and the failed build with an error message, or `None`
+        '''
+        keys = set(task for (task, _deps, _fg) in tasks)
+        waiting = [(task, set(dep for dep in deps if dep in keys), foreground) for (task, deps, foreground) in tasks]
+        (results, failure, running, announced, ready, tokens) = ({}, None, {}, set(), {}, set())
+        stats = self.stats['build']
+        for (task, _deps, _fg) in tasks:
+            self.prefetch(task)
+        
+        def fetched(task):
+            if self.fetch is None:
+                return True
+            if task not in self.fetched:
+                return False
+            if task not in announced:
+                announced.add(task)
+                if self.fetched[task][0]:
+                    aggregator(task, 2, self.fetched[task][1])
+            return True
+        
+        def finish(task, ok, result):
+            nonlocal failure
+            if not ok:
+                if failure is None:
+                    failure = (task, result)
+                return
+            results[task] = result
+            aggregator(task, 1, result)
+            for (_task, deps, _fg) in waiting:
+                deps.discard(task)
+        
+        while (len(waiting) > 0) or (len(running) > 0):
+            self.pump()
+            
+            # Start builds whose dependencies have been built and whose sources have been fetched, in order
+            started = False
+            i = 0
+            while (failure is None) and (i < len(waiting)):
+                (task, deps, foreground) = waiting[i]
+                if len(deps) > 0:
+                    i += 1
+                    continue
+                if task not in ready:
+                    ready[task] = time.monotonic()
+                if not fetched(task):
+                    i += 1
+                    continue
+                if (self.fetch is not None) and not self.fetched[task][0]:
+                    failure = (task, self.fetched[task][1])
+                    break
+                foreground = foreground or (self.jobs == 1)
+                if foreground and (len(running) > 0):
+                    # Let the builds in the background finish first
+                    break
+                if (not foreground) and (len(running) >= self.jobs):
+                    break
+                token = (not foreground) and (len(running) > 0) and (self.jobserver is not None)
+                if token and not self.jobserver.acquire():
+                    # Every job slot is in use by the builds that are running
+                    break
+                del waiting[i]
+                stats[1] += time.monotonic() - ready.pop(task)
+                aggregator(task, 0)
+                started = True
+                if foreground:
+                    try:
+                        finish(task, True, build(task))
+                    except Exception as err:
+                        if os.getenv('SPIKE_DEBUG', '').lower() == 'yes':
+                            import traceback
+                            traceback.print_exc()
+                        finish(task, False, str(err))
+                    i = 0
+                else:
+                    (reader, process) = self.start(build, task, False)
+                    running[reader] = (task, process)
+                    if token:
+                        tokens.add(task)
+            stats[0] = max(stats[0], len(ready))
+            
+            if (len(running) == 0) and (failure is not None):
+                break
+            if started:
+                continue
+            if len(running) == 0:
+                # Nothing will finish unless sources are being fetched for a build that is ready
+                pending = set(task for (task, _queued) in self.queue) | set(self.fetching.values())
+                unfetched = [task for task in ready if not fetched(task)]
+                if len(unfetched) == 0:
+                    # Only builds that wait for themselves remain
+                    failure = (waiting[0][0], 'Build cannot be started before its dependencies')
+                    break
+                if not any(task in pending for task in unfetched):
+                    failure = (unfetched[0], 'Sources are not being fetched')
+                    break
+            
+            # Wait for fetches and builds to finish
+            for (task, ok, result) in self.collect(None, running):
+                if task in tokens:
+                    tokens.remove(task)
+                    self.jobserver.release()
+                finish(task, ok, result)
+        
+        return (results, failure)
+    
+    
+    def close(self):
+        '''
+        Stop all fetches that are still running or queued
+        '''
+        self.queue = []
+        for reader in self.fetching:
+            reader.close()
+        self.fetching = {}
+        for process in self.context.active_children():
+            process.terminate()
+            process.join()
+    
+    
+    @staticmethod
+    def work(writer, function, task, quiet):
+        '''
+        Perform a fetch or a build in a child process
+        
+        @param  writer:Connection   The connection over which to send whether the build was successful and its result or error message
+        @param  function:(¿E?)→¿R?  The function to run
+        @param  task:¿E?            The build
+        @param  quiet:bool          Whether to discard the output of the process
+        '''
+        if quiet and (os.getenv('SPIKE_DEBUG', '').lower() != 'yes'):
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, 1)
+            os.dup2(devnull, 2)
+            os.close(devnull)
+        try:
+            writer.send((True, function(task)))
+        except Exception as err:
+            if os.getenv('SPIKE_DEBUG', '').lower() == 'yes':
+                import traceback
+                traceback.print_exc()
+            writer.send((False, str(err)))
+        finally:
+            sys.stdout.flush()
+            writer.close()
@@ -22,12 +22,14 @@ from algorithmic.algospike import *
 from algorithmic.scrlver import *
 from auxiliary.scrollmagick import *
 from auxiliary.auxfunctions import *
+from database.scrollindex import *
+from library.libspikehelper import *
 
 
 
 # Constants
 store_fields = 'pkgname pkgver pkgrel epoch arch freedom private conflicts replaces'
-store_fields += ' provides extension variant patch patchbefore patchafter groups'
+store_fields += ' provides extension variant patches patchbefore patchafter groups interactive'
 store_fields += ' depends makedepends checkdepends optdepends'
 store_fields = store_fields.split(' ')
 
@@ -57,7 +59,7 @@ class Installer():
             Constructor
             
             @param  scrollfile:str          The scroll file
-            @param  globals:dict<str, any>  Should be `globals()`
+            @param  globals:dict<str, any>  The value of each field in the scroll
             '''
             # Store fields
             self.fields = {}
@@ -100,13 +102,39 @@ class Installer():
         @param   scrollfile:str  The scroll file
         @return  :Scroll         The scroll information
         '''
+        return Installer.Scroll(scrollfile, Installer.load_fields(scrollfile))
+    
+    
+    @staticmethod
+    def load_fields(scrollfile):
+        '''
+        Load the information fields of a scroll, from the scroll index if it is up to date
+        
+        @param   scrollfile:str   The scroll file
+        @return  :dict<str, ¿E?>  The value of each field
+        '''
         ScrollMagick.export_environment()
         
-        globs = globals()
-        ScrollMagick.init_fields(globs)
-        ScrollMagick.execute_scroll(scrollfile, globs)
+        def load(scrollfile):
+            globs = ScrollMagick.namespace()
+            ScrollMagick.execute_scroll(scrollfile, globs)
+            return dict((field, globs[field]) for field in ScrollMagick.field_names())
+        
+        if Installer.index is None:
+            return load(scrollfile)
+        return Installer.index.get(scrollfile, load)
+    
+    
+    @staticmethod
+    def load_provides(scrollfile):
+        '''
+        Load what a scroll provides
         
-        return Installer.Scroll(scrollfile, globs)
+        @param   scrollfile:str      The scroll file
+        @return  :(str, list<str>)  The scroll, with version, and the scrolls, with version ranges, it provides
+        '''
+        scroll = Installer.load_information(scrollfile)
+        return (scroll.scroll.full, [provides.full for provides in scroll['provides'] or []])
     
     
     @staticmethod
@@ -151,12 +179,12 @@ class Installer():
         Check for conflicts
         
         @param   scroll_infos:itr<dict<ScrollVersion, Scroll>>  Scrolls to check
-        @param   installed:set<ScrollVersion>                   Set to fill with installed packages
-        @param   provided:set<ScrollVersion>                    Set to fill with provided packages
+        @param   installed:ScrollVersionSet                     Set to fill with installed packages
+        @param   provided:ScrollVersionSet                      Set to fill with provided packages
         @return  :bool                                          Whether there are not conflicts
         '''
         checked = set()
-        conflicts = set()
+        conflicts = ScrollVersionSet()
         for scroll_info in scroll_infos:
             for scroll in scroll_info:
                 scroll = scroll_info[scroll]
@@ -184,7 +212,7 @@ class Installer():
         Identify missing dependencies
         
         @param   scroll_info:dict<ScrollVersion, Scroll>  The scrolls
-        @param   needed:set<ScrollVersion>                Missing dependencies, will be filled
+        @param   needed:ScrollVersionSet                  Missing dependencies, will be filled
         @param   requirer:dict<str, list<ScrollVersion>>  Mapping from scroll name to scrolls that requires the scroll, will be filled
         @param   empty_dep_evaluator:(Scroll)→bool        Function that evaluates if the empty dependency exists (a package manager with the same name)
         @return  :int                                     Value for indentified error, zero if none
@@ -251,7 +279,7 @@ class Installer():
         for scroll in scroll_info:
             scroll = scroll_info[scroll]
             scroll_version = '%s=%s' % (scroll.name, scroll.version)
-            if scroll.named not in installed_versions:
+            if scroll.name not in installed_versions:
                 fresh_installs.append(scroll_version)
             else:
                 if scroll.scroll.lower == installed_versions[scroll.name].lower:
@@ -286,4 +314,28 @@ class Installer():
         if not successful:
             return None
         return [(scroll_info[elem[0]], elem[1]) for elem in tsorted]
+    
+    
+    @staticmethod
+    def build_dependencies(tsorted):
+        '''
+        Get the scrolls that must be built before each scroll
+        
+        @param   tsorted:list<(Scroll, list<ScrollVersion>?)>  The scrolls in topological order, as returned by `tsort_scrolls`
+        @return  :list<(Scroll, list<Scroll>)>                 The scrolls in the same order, each with its make dependencies that
+                                                               are also being installed, except those that are installed after it
+        '''
+        rc, built = [], {}
+        for (scroll, later) in tsorted:
+            later = set() if later is None else set(dep.name for dep in later)
+            deps = {}
+            for dep in scroll['makedepends'] or []:
+                if (dep.name in built) and (dep.name not in later):
+                    deps[dep.name] = built[dep.name]
+            rc.append((scroll, list(deps.values())))
+            built[scroll.name] = scroll
+        return rc
+
+
+Installer.index = None
 
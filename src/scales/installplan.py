@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+spike – a package manager running on top of git
+
+Copyright © 2012, 2013, 2014  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import os
+import json
+import hashlib
+
+from library.gitcord import *
+from database.catalogue import *
+
+
+
+INSTALL_PLAN_FORMAT = 2
+'''
+The version of the install plan file format
+'''
+
+
+
+class InstallPlan():
+    '''
+    Module for libspike for exporting and importing resolved installation plans
+    
+    A plan file is a compact JSON document with the request, the state of the
+    system it was resolved for, and the resolution itself, the scrolls are
+    recorded as repository/category/name so they can be located on any system
+    '''
+    
+    @staticmethod
+    def fingerprint_repository(repository, digest):
+        '''
+        Get the state of a scroll repository
+        
+        @param   repository:str   The repository directory
+        @param   digest:(str)→str  Function that gets the hash of a file's content
+        @return  :str              The commit of the repository if it is a git repository, otherwise the hash of its scrolls
+        '''
+        if os.path.isdir(repository + '/.git'):
+            commit = Gitcord(repository).where_am_i()
+            if commit is not None:
+                return 'commit:' + commit
+        files = sorted((category, name, digest(file)) for (category, name, file) in Catalogue.get(repository).files())
+        return 'sha3:' + hashlib.sha3_256(json.dumps(files).encode('utf-8')).hexdigest()
+    
+    
+    @staticmethod
+    def fingerprint_installed(repositories, digest):
+        '''
+        Get the fingerprint of the set of installed scrolls
+        
+        @param   repositories:dict<str, str>  Map from installed scroll repository names to their directories
+        @param   digest:(str)→str             Function that gets the hash of a file's content
+        @return  :str                         The fingerprint
+        '''
+        files = []
+        for repo in repositories:
+            files += [(repo, category, name, digest(file)) for (category, name, file) in Catalogue.get(repositories[repo]).files()]
+        return hashlib.sha3_256(json.dumps(sorted(files)).encode('utf-8')).hexdigest()
+    
+    
+    @staticmethod
+    def scroll_name(repositories, file):
+        '''
+        Get the fully qualified name of a scroll file
+        
+        @param   repositories:dict<str, str>  Map from repository names to their directories
+        @param   file:str                     The scroll file
+        @return  :str?                        The scroll as repository/category/name, `None` if not in any of the repositories
+        '''
+        category = os.path.dirname(file)
+        repository = os.path.dirname(category)
+        for repo in repositories:
+            if repositories[repo] == repository:
+                return '%s/%s/%s' % (repo, os.path.basename(category), os.path.basename(file)[:-len('.scroll')])
+        return None
+    
+    
+    @staticmethod
+    def save(planfile, plan):
+        '''
+        Write a plan to a file
+        
+        @param  planfile:str  The plan file
+        @param  plan:dict     The plan, must be serialisable with `json`
+        '''
+        plan = dict(plan)
+        plan['format'] = INSTALL_PLAN_FORMAT
+        with open(planfile, 'wb') as file:
+            file.write(json.dumps(plan, separators = (',', ':'), sort_keys = True).encode('utf-8'))
+            file.write('\n'.encode('utf-8'))
+    
+    
+    @staticmethod
+    def load(planfile):
+        '''
+        Read a plan from a file
+        
+        @param   planfile:str  The plan file
+        @return  :dict?        The plan, `None` if the file is not a plan of a supported format
+        '''
+        with open(planfile, 'rb') as file:
+            plan = json.loads(file.read().decode('utf-8'))
+        if (not isinstance(plan, dict)) or (plan.get('format', None) != INSTALL_PLAN_FORMAT):
+            return None
+        return plan
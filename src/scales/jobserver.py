@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+spike – a package manager running on top of git
+
+Copyright © 2012, 2013, 2014  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import os
+
+
+
+class Jobserver():
+    '''
+    GNU make compatible jobserver shared by all builds, the `make` processes in every
+    build take tokens from the same pool, so that concurrent builds together do not run
+    more jobs than there are slots
+    
+    As with GNU make, every client, that is a `make` that was started by a build, may
+    run one job without a token. The build driver is itself a client: it may run
+    one build without a token, but must take a token for every other concurrent build
+    
+    @variable  slots:int    The total number of jobs that may run at the same time
+    @variable  reader:int   The file descriptor of the read end of the token pipe
+    @variable  writer:int   The file descriptor of the write end of the token pipe
+    @variable  taker:int?   Non-blocking file descriptor used by the driver to take tokens, `None` if not available,
+                            in which case the driver does not take tokens for its builds
+    '''
+    
+    def __init__(self, slots = None):
+        '''
+        Constructor
+        
+        @param  slots:int?  The total number of jobs that may run at the same time, `None` for
+                            the value of `SPIKE_MAKE_JOBS`, or the number of CPU:s if not set
+        '''
+        if slots is None:
+            slots = os.getenv('SPIKE_MAKE_JOBS', '')
+            slots = int(slots) if slots.isdigit() else (os.cpu_count() or 1)
+        self.slots = max(1, slots)
+        (self.reader, self.writer) = os.pipe()
+        os.set_inheritable(self.reader, True)
+        os.set_inheritable(self.writer, True)
+        os.write(self.writer, b'+' * (self.slots - 1))
+        # GNU make does not cope with a non-blocking jobserver pipe, so the driver
+        # uses a separate open file description to take tokens without blocking
+        try:
+            self.taker = os.open('/proc/self/fd/%i' % self.reader, os.O_RDONLY | os.O_NONBLOCK)
+        except OSError:
+            self.taker = None
+    
+    
+    def makeflags(self, makeflags = ''):
+        '''
+        Get the value of `MAKEFLAGS` that makes `make` use the jobserver
+        
+        @param   makeflags:str  The value of `MAKEFLAGS` without the jobserver
+        @return  :str           The value of `MAKEFLAGS` with the jobserver
+        '''
+        flags = [flag for flag in makeflags.split(' ') if flag != '']
+        flags = [flag for flag in flags if not (flag.startswith('-j') or flag.startswith('--jobserver-'))]
+        flags = [flag for flag in flags if flag != '--jobs' and not flag.startswith('--jobs=')]
+        return ' '.join([''] + flags + ['-j%i' % self.slots, '--jobserver-auth=%i,%i' % (self.reader, self.writer)])
+    
+    
+    def export(self):
+        '''
+        Make all `make` processes that are started from now on use the jobserver
+        '''
+        os.environ['MAKEFLAGS'] = self.makeflags(os.getenv('MAKEFLAGS', ''))
+    
+    
+    def acquire(self):
+        '''
+        Take a token, without waiting for one
+        
+        @return  :bool  Whether a token was taken, always `True` if the driver does not take tokens
+        '''
+        if self.taker is None:
+            return True
+        try:
+            return len(os.read(self.taker, 1)) == 1
+        except BlockingIOError:
+            return False
+    
+    
+    def release(self):
+        '''
+        Return a token
+        '''
+        if self.taker is not None:
+            os.write(self.writer, b'+')
+    
+    
+    def close(self):
+        '''
+        Close the token pipe
+        '''
+        for fd in (self.taker, self.reader, self.writer):
+            if fd is not None:
+                os.close(fd)
+        (self.taker, self.reader, self.writer) = (None, -1, -1)
+
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''
+spike – a package manager running on top of git
+
+Copyright © 2012, 2013, 2014  Mattias Andrée (maandree@member.fsf.org)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+import os
+import inspect
+import hashlib
+
+from algorithmic.scrlver import *
+from auxiliary.scrollmagick import *
+from database.cachestore import *
+
+
+
+ALLOWED_OPTIONS = 'strip docs info man licenses changelogs libtool docs= docs=gz docs=xz info= info=gz info=xz man= man=gz man=xz upx'.split(' ')
+'''
+The values allowed in the field `options`
+'''
+
+METHOD_SPECS = {'ride'           : 'private',
+                'build'          : 'startdir srcdir pkgdir private',
+                'check'          : 'startdir srcdir pkgdir private',
+                'package'        : 'startdir srcdir pkgdir private',
+                'patch_build'    : 'startdir srcdir pkgdir private',
+                'patch_check'    : 'startdir srcdir pkgdir private',
+                'patch_package'  : 'startdir srcdir pkgdir private',
+                'pre_install'    : 'tmpdir rootdir private',
+                'post_install'   : 'tmpdir rootdir installedfiles private',
+                'pre_upgrade'    : 'tmpdir rootdir installedfiles private',
+                'post_upgrade'   : 'tmpdir rootdir installedfiles private',
+                'pre_uninstall'  : 'tmpdir rootdir installedfiles private',
+                'post_uninstall' : 'tmpdir rootdir installedfiles private'}
+'''
+The parameters of each scroll method
+'''
+
+
+
+class Proofreader():
+    '''
+    Module for libspike for proofreading scrolls
+    '''
+    
+    @staticmethod
+    def ishex(x):
+        '''
+        Checks whether a string is hexadecimal
+        
+        @param   x:str  The string
+        @return  :bool  Whether the string is hexadecimal
+        '''
+        for i in range(len(x)):
+            if x[i] not in '0123456789ABCDEFabcdef':
+                return False
+        return True
+    
+    
+    @staticmethod
+    def ispony(x):
+        '''
+        Checks whether a string is a valid pony name
+        
+        @param   x:str  The string
+        @return  :bool  Whether the string is a valid pony name
+        '''
+        chars = set(('-', '+'))
+        for (start, end) in (('0', '9'), ('a', 'z')):
+            for c in range(ord(start), ord(end) + 1):
+                chars.add(chr(c))
+        for i in range(len(x)):
+            if x[i] not in chars:
+                return False
+        if x.startswith('.') or x.startswith('-'):
+            return False
+        return 0 < len(x) <= 64
+    
+    
+    @staticmethod
+    def isscroll(x):
+        '''
+        Checks whether a string is a valid scroll, optionally with a version and a comment
+        
+        @param   x:str  The string
+        @return  :bool  Whether the string is a valid scroll
+        '''
+        s = ScrollVersion(x if ': ' not in x else x[:x.find(': ')])
+        if s.name is None:
+            return False
+        return Proofreader.ispony(s.name)
+    
+    
+    @staticmethod
+    def fingerprint(scrollfile, version):
+        '''
+        Get a fingerprint of a scroll, that changes if the result of proofreading it can change
+        
+        @param   scrollfile:str  The scroll file
+        @param   version:str     The version of Spike
+        @return  :str            The fingerprint of the scroll
+        '''
+        sha3 = hashlib.sha3_256()
+        for part in (version, CacheStore.environment(), os.path.basename(scrollfile)):
+            sha3.update(part.encode('utf-8') + bytes([0]))
+        with open(scrollfile, 'rb') as file:
+            sha3.update(file.read())
+        return sha3.hexdigest()
+    
+    
+    @staticmethod
+    def proofread(scroll_scrollfile):
+        '''
+        Look for errors in a scroll
+        
+        @param   scroll_scrollfile:(str, str)  The specified scroll and the file found for the scroll
+        @return  :str?                         Error message, `None` if the scroll is correct
+        '''
+        (scroll, scrollfile) = scroll_scrollfile
+        (ispony, isscroll) = (Proofreader.ispony, Proofreader.isscroll)
+        try:
+            # Set environment variables (re-export before each scroll in case a scroll changes it)
+            ScrollMagick.export_environment()
+            
+            # Read scroll
+            globs = ScrollMagick.namespace()
+            ScrollMagick.execute_scroll(scrollfile, globs)
+            scrollmagick = ScrollMagick(globs)
+            
+            # TODO look for autoconflicts
+            # Proofread scroll fields
+            scrollmagick.check_type_format('pkgname', False, str, ispony)
+            scrollmagick.check_type_format('pkgver', False, str, lambda x : isscroll('x=' + x))
+            scrollmagick.check_type_format('pkgrel', False, int, lambda x : x >= 1)
+            scrollmagick.check_type_format('epoch', False, int, lambda x : x >= 0)
+            
+            version_a = '%s=%i:%s-%i' % (globs['pkgname'], globs['epoch'], globs['pkgver'], globs['pkgrel'])
+            version_b = scrollfile.replace(os.sep, '/').split('/')[-1][:-len('.scroll')]
+            (version_a, version_b) = (ScrollVersion(version_a), ScrollVersion(version_b))
+            if (version_b.name is False) or ('<' in version_b.full) or ('>' in version_b.full):
+                raise Exception('Scroll file name is badly formated')
+            if version_a not in version_b:
+                raise Exception('Version and name fields conflicts with scroll file name')
+            
+            scrollmagick.check_type_format(['pkgdesc', 'upstream'], True, str, lambda x : len(x) > 0)
+            scrollmagick.check_is_list_format('arch', False, str, lambda x : len(x) > 0)
+            if len(globs['arch']) == 0:
+                raise Exception('Field \'arch\' may not be empty')
+            
+            scrollmagick.check_type_format('freedom', False, int, lambda x : 0 <= x < (1 << 8))
+            scrollmagick.check_is_list_format('license', False, str, lambda x : len(x) > 0)
+            scrollmagick.check_type_format('private', False, int, lambda x : 0 <= x < 3)
+            scrollmagick.check_type('interactive', False, bool)
+            scrollmagick.check_is_list_format(['conflicts', 'replaces', 'provides'], False, str, isscroll)
+            scrollmagick.check_type_format(['extension', 'variant', 'patches'], True, str, ispony)
+            scrollmagick.check_type_format('reason', True, str, lambda x : len(x) > 0)
+            scrollmagick.check_is_list_format(['patchbefore', 'patchafter'], False, str, isscroll)
+            scrollmagick.check_is_list_format('groups', False, str, ispony)
+            scrollmagick.check_is_list_format(['depends', 'makedepends', 'checkdepends', 'optdepends'], False, str, lambda x : len(x) == 0 or isscroll(x))
+            scrollmagick.check_is_list('noextract', False, str)
+            
+            scrollmagick.check_is_list('source', False, str, list)
+            elements = set()
+            for element in globs['source']:
+                if isinstance(element, list):
+                    if len(element) < 2:
+                        raise Exception('Lists in field \'source\' must be at least of length 2')
+                    for elem in element:
+                        if elem is None:
+                            raise Exception('Lists in field \'source\' may not contain `None`')
+                        elif not isinstance(elem, str):
+                            raise Exception('Lists in field \'source\' is restricted to str elements')
+                    if len(element[0]) == 0:
+                        raise Exception('Source file in field \'source\' may not be empty')
+                    element = element[1]
+                if element == '':
+                    raise Exception('Destination file in field \'source\' may not be empty')
+                if element in elements:
+                    raise Exception('Duplicate destination file \'%s\' in field \'source\'' % element)
+                else:
+                    elements.add(element)
+            
+            scrollmagick.check_is_list_format('sha3sums', True, str, lambda x : len(x) == 144 and Proofreader.ishex(x))
+            if len(globs['sha3sums']) != len(globs['source']):
+                raise Exception('Fields \'sha3sums\' and \'source\' must be of same size')
+            
+            for field in ('noextract', 'backup'):
+                have = set()
+                for element in globs[field]:
+                    if element not in elements:
+                        raise Exception('Field \'%s\' may only contain destination files from \'source\'' % field)
+                    if element in have:
+                        raise Exception('Field \'%s\' contains duplicate file \'%s\'' % (field, element))
+                    have.add(element)
+            
+            scrollmagick.check_is_list_elements('options', False, str, ALLOWED_OPTIONS)
+            
+            # Proofread scroll methods
+            if globs['ride'] is None:
+                raise Exception('Method \'ride\' should be default, in worst case just echo some information')
+            if globs['package'] is None:
+                raise Exception('Method \'package\' must be default, even if does nothing')
+            
+            for method in METHOD_SPECS.keys():
+                if globs[method] is None:
+                    continue
+                spec = inspect.getfullargspec(globs[method])
+                if spec.varargs is not None:
+                    raise Exception('Methods should not use varargs (i.e. *variables)')
+                if (spec.varkw is not None) or (len(spec.kwonlyargs) > 0):
+                    raise Exception('Methods should not use keywords (i.e. **variables)')
+                if spec.defaults is not None:
+                    raise Exception('Methods should not specify default values for parameters')
+                params_str = '(%s)' % METHOD_SPECS[method].replace(' ', ', ')
+                params_list = list(METHOD_SPECS[method].split(' '))
+                if list(spec.args) != params_list:
+                    raise Exception('Method \'%s\' should have the parameters %s with those exact names' % (method, params_str))
+            
+            # Proofread using extensions
+            scrollmagick.addon_proofread(scroll, scrollfile)
+        
+        except Exception as err:
+            if os.getenv('SPIKE_DEBUG', '').lower() == 'yes':
+                import traceback
+                traceback.print_exc()
+            return str(err)
+        return None
+
@@ -22,6 +22,7 @@ import os
 import re
 
 from auxiliary.auxfunctions import *
+from database.catalogue import *
 
 
 
@@ -29,16 +30,124 @@ class ScrollFinder():
     '''
     Module for libspike for finding scrolls
     '''
-    @staticmethod
-    def regex_match(needle, haystack):
+    
+    class Matcher():
         '''
-        Tests if a pattern can be found in a text
-        
-        @param   needle:str    The pattern to search for
-        @param   haystack:str  The text to search in
-        @return  :bool         Whether the pattern can be found in the text
+        Matches a text against multiple patterns at once
         '''
-        return re.search(needle, haystack) is not None
+        
+        def __init__(self, patterns):
+            '''
+            Constructor
+            
+            @param  patterns:list<str>  Regular expression search patterns, empty patterns match everything
+            '''
+            self.everything = 0
+            (self.equal, self.prefixes, self.suffixes, self.infixes) = ({}, [], [], [])
+            (self.combined, self.groups, self.separate) = (None, [], [])
+            self.cache = {}
+            
+            # Merge duplicate patterns, each pattern is identified by a bit
+            masks = {}
+            for i in range(len(patterns)):
+                masks[patterns[i]] = (masks[patterns[i]] if patterns[i] in masks else 0) | (1 << i)
+            
+            # Use fast paths for literal patterns, and combined the rest
+            combined = []
+            for pattern in masks.keys():
+                mask = masks[pattern]
+                re.compile(pattern) # Fail early on bad patterns
+                head = pattern.startswith('^')
+                tail = pattern.endswith('$') and not pattern.endswith('\\$')
+                literal = pattern[1 if head else 0 : -1 if tail else len(pattern)]
+                if len(pattern) == 0:
+                    self.everything |= mask
+                elif not ScrollFinder.Matcher.is_literal(literal):
+                    if ScrollFinder.Matcher.is_combinable(pattern):
+                        self.groups.append(('p%i' % len(self.groups), mask))
+                        combined.append((pattern, '(?:(?=.*?(?P<%s>%s)))?' % (self.groups[-1][0], pattern), mask))
+                    else:
+                        self.separate.append((re.compile(pattern), mask))
+                elif head and tail:
+                    self.equal[literal] = mask
+                elif head:
+                    self.prefixes.append((literal, mask))
+                elif tail:
+                    self.suffixes.append((literal, mask))
+                else:
+                    self.infixes.append((literal, mask))
+            if len(combined) > 0:
+                try:
+                    self.combined = re.compile(''.join(part for (_pattern, part, _mask) in combined), re.DOTALL)
+                except re.error:
+                    # The patterns cannot be combined after all, match them separately
+                    self.groups = []
+                    self.separate += [(re.compile(pattern), mask) for (pattern, _part, mask) in combined]
+        
+        
+        @staticmethod
+        def is_literal(pattern):
+            '''
+            Checks whether a pattern only matches itself
+            
+            @param   pattern:str  The pattern
+            @return  :bool        Whether the pattern is free from special characters
+            '''
+            for c in '.^$*+?{}[]\\|()':
+                if c in pattern:
+                    return False
+            return True
+        
+        
+        @staticmethod
+        def is_combinable(pattern):
+            '''
+            Checks whether a pattern can be embedded in a larger pattern without changing its meaning
+            
+            @param   pattern:str  The pattern
+            @return  :bool        Whether the pattern can be combined with other patterns
+            '''
+            # Back references, named groups, whose names may collide, and inline flags cannot be combined
+            if re.search(r'\\[1-9]|\(\?P[=<]|\(\?[aiLmsux]', pattern) is not None:
+                return False
+            try:
+                re.compile('(?:(?=.*?(?P<p>%s)))?' % pattern)
+            except re.error:
+                return False
+            return True
+        
+        
+        def match(self, text):
+            '''
+            Match a text against the patterns
+            
+            @param   text:str  The text
+            @return  :int      Bit mask of the patterns that can be found in the text
+            '''
+            if text in self.cache:
+                return self.cache[text]
+            rc = self.everything
+            if text in self.equal:
+                rc |= self.equal[text]
+            for (literal, mask) in self.prefixes:
+                if text.startswith(literal):
+                    rc |= mask
+            for (literal, mask) in self.suffixes:
+                if text.endswith(literal):
+                    rc |= mask
+            for (literal, mask) in self.infixes:
+                if literal in text:
+                    rc |= mask
+            if self.combined is not None:
+                groups = self.combined.match(text)
+                for (group, mask) in self.groups:
+                    if groups.group(group) is not None:
+                        rc |= mask
+            for (pattern, mask) in self.separate:
+                if pattern.search(text) is not None:
+                    rc |= mask
+            self.cache[text] = rc
+            return rc
     
     
     @staticmethod
@@ -71,39 +180,43 @@ class ScrollFinder():
         return None
     
     
+    @staticmethod
+    def get_matchers(patterns):
+        '''
+        Create matchers for the patterns
+        
+        @param   patterns:list<(repo:str, cat:str, scroll:str)>  The patterns
+        @return  :(Matcher, Matcher, Matcher)                    Matcher for repositories, categories and scrolls, respectively
+        '''
+        return tuple(ScrollFinder.Matcher([pattern[i] for pattern in patterns]) for i in range(3))
+    
+    
     @staticmethod
     def get_repositories(repositories, file):
         '''
         Get repositories
         
-        @param  repositories:dict<str, (str, list=[])>  Map to fill with repository name → (repository directory, empty list)
-        @param  file:str                                Candidate file for containg repositories
+        @param  repositories:dict<str, [str, int=0]>  Map to fill with repository name → [repository directory, 0]
+        @param  file:str                              Candidate file for containg repositories
         '''
         if os.path.isdir(file):
             for repo in os.listdir(file):
                 reponame = repo
                 repo = os.path.realpath(file + '/' + repo)
                 if os.path.isdir(repo) and (reponame not in repositories):
-                    repositories[reponame] = (repo, [])
+                    repositories[reponame] = [repo, 0]
     
     
     @staticmethod
-    def match_repositories(repositories, patterns):
+    def match_repositories(repositories, matcher):
         '''
         Match patterns to repositories
         
-        @param  repositories:dict<str, (str, list<(str, str, str)>)>  Map to fill with matching patterns
-        @param  patterns:itr<(repo:str, str, str)>                    Patterns
+        @param  repositories:dict<str, [str, int]>  Map to fill with bit masks of matching patterns
+        @param  matcher:Matcher                     Matcher for the repository patterns
         '''
-        for pattern in patterns:
-            r = pattern[0]
-            if len(r) == 0:
-                for repo in repositories.keys():
-                    repositories[repo][1].append(pattern)
-            else:
-                for repo in repositories.keys():
-                    if regex_match(r, repo):
-                        repositories[repo][1].append(pattern)
+        for repo in repositories.keys():
+            repositories[repo][1] = matcher.match(repo)
     
     
     @staticmethod
@@ -111,42 +224,33 @@ class ScrollFinder():
         '''
         Get categories
         
-        @param   repositories:dict<str, (str, list)>    Map of repositories
-        @return  :dict<str, dict<str, (str, list=[])>>  Map to fill with repository name → category name → (category directory, empty list)
+        @param   repositories:dict<str, [str, int]>   Map of repositories
+        @return  :dict<str, dict<str, [str, int=0]>>  Map to fill with repository name → category name → [category directory, 0]
         '''
         categories = {}
         for repo in repositories.keys():
             rdir = repositories[repo][0]
-            for category in os.listdir(rdir):
-                cdir = '%s/%s' % (rdir, category)
-                if os.path.isdir(cdir):
-                    if repo not in categories:
-                        categories[repo] = {}
-                    categories[repo][category] = (cdir, [])
+            categories[repo] = {}
+            if repositories[repo][1] != 0:
+                for category in Catalogue.get(rdir).categories():
+                    categories[repo][category] = ['%s/%s' % (rdir, category), 0]
         return categories
         
     
     @staticmethod
-    def match_categories(repositories, categories):
+    def match_categories(repositories, categories, matcher):
         '''
         Match patterns to categories
         
-        @param  repositories:dict<str, (str, list)>                            Map of repositories
-        @param  categories:dict<str, dict<str, (str, list<(str, str, str)>)>>  Map to fill with matching patterns
+        @param  repositories:dict<str, [str, int]>           Map of repositories
+        @param  categories:dict<str, dict<str, [str, int]>>  Map to fill with bit masks of matching patterns
+        @param  matcher:Matcher                              Matcher for the category patterns
         '''
         for repo in repositories.keys():
-            pats = repositories[repo][1]
+            mask = repositories[repo][1]
             out = categories[repo]
-            cats = out.keys()
-            for pat in pats:
-                c = pat[1]
-                if len(c) == 0:
-                    for cat in cats:
-                        out[cat][1].append(pat)
-                else:
-                    for cat in cats:
-                        if regex_match(c, cat):
-                            out[cat][1].append(pat)
+            for cat in out.keys():
+                out[cat][1] = mask & matcher.match(cat)
     
     
     @staticmethod
@@ -154,8 +258,8 @@ class ScrollFinder():
         '''
         Flatten the category map
         
-        @param:in   categories:dict<str, dict<str, (str, list<(str, str, str)>)>>  The category map
-        @param:out  categories:dict<str, (str, list<(str, str, str)>)>             Repository–category map
+        @param:in   categories:dict<str, dict<str, [str, int]>>  The category map
+        @param:out  categories:dict<str, [str, int]>             Repository–category map
         '''
         repos = list(categories.keys())
         for repo in repos:
@@ -171,34 +275,39 @@ class ScrollFinder():
         '''
         Get scrolls
         
-        @param   categories:dict<str, (str, list<(str, str, str)>)>  The repository–category map
-        @return  :dict<str, (str, str)>                              Repository–category → (scroll, scrollfile) map
+        @param   categories:dict<str, [str, int]>  The repository–category map
+        @return  :dict<str, (str, str)>            Repository–category → (scroll, scrollfile) map
         '''
         scrolls = {}
+        repos = {}
         for cat in categories.keys():
-            cdir = categories[cat][0]
-            for scroll in os.listdir(cdir):
-                sfile = '%s/%s' % (cdir, scroll)
-                if os.path.isfile(sfile) and scroll.endswith('.scroll') and not scroll.startswith('.'):
-                    scroll = scroll[:-len('.scroll')]
+            if categories[cat][1] == 0:
+                continue
+            repo = cat.split('/')[0]
+            if repo not in repos:
+                repos[repo] = Catalogue.get(os.path.dirname(categories[cat][0]))
+        for repo in repos.keys():
+            for (category, scroll, _file) in repos[repo].files():
+                cat = '%s/%s' % (repo, category)
+                if (cat in categories) and (categories[cat][1] != 0):
                     dict_append(scrolls, cat, (scroll, '%s/%s' % (cat, scroll)))
         return scrolls
     
     
     @staticmethod
-    def match_and_report(categories, scrolls, aggregator):
+    def match_and_report(categories, scrolls, matcher, aggregator):
         '''
         Match scrolls to patterns and report them
         
-        @param  categories:dict<str, (str, list<(str, str, str)>)>  Repository–category map
-        @param  scrolls:dict<str, (str, str)>                       Repository–category → (scroll, scroll file) map
-        @param  aggregator:(str)→void                               Function invoked with a scroll file when matched
+        @param  categories:dict<str, [str, int]>  Repository–category map
+        @param  scrolls:dict<str, (str, str)>     Repository–category → (scroll, scroll file) map
+        @param  matcher:Matcher                   Matcher for the scroll patterns
+        @param  aggregator:(str)→void             Function invoked with a scroll file when matched
         '''
         for cat in categories.keys():
             if cat in scrolls:
-                for pat in categories[cat][1]:
-                    p = pat[2]
-                    for (scroll, full) in scrolls[cat]:
-                        if regex_match(p, scroll):
-                            aggregator(full)
+                mask = categories[cat][1]
+                for (scroll, full) in scrolls[cat]:
+                    if (mask & matcher.match(scroll)) != 0:
+                        aggregator(full)
 
@@ -22,18 +22,12 @@ import sys
 import os
 from subprocess import Popen
 
-from library.libspike import *
+from library.spikeclient import *
 from auxiliary.argparser import *
 from auxiliary.printhacks import *
 
 
 
-SPIKE_VERSION = '0.1'
-'''
-This version of spike
-'''
-
-
 SPIKE_DEBUG = os.getenv('SPIKE_DEBUG', '') == 'yes'
 '''
 Whether spike has been started in debug mode
@@ -41,6 +35,20 @@ Whether spike has been started in debug mode
 
 
 
+def load_libspike():
+    '''
+    Load LibSpike and the Spike daemon, this is deferred so that
+    requests served by the daemon do not have to wait for it
+    '''
+    import library.libspike
+    import library.spikedaemon
+    for module in (library.libspike, library.spikedaemon):
+        for name in dir(module):
+            if not name.startswith('_'):
+                globals()[name] = getattr(module, name)
+
+
+
 class Spike():
     '''
     Spike is your number one package manager
@@ -50,7 +58,7 @@ class Spike():
         '''
         Constructor
         '''
-        self.version = SPIKE_VERSION
+        self.version = None
         self.execprog = 'spike'
         self.prog = 'spike'
 
@@ -89,6 +97,8 @@ class Spike():
                      27 - Corrupt database
                      28 - Pony is required by another pony
                      29 - Circular make dependency
+                     30 - Installation plan is invalid or was resolved for another state of the system
+                     31 - Ponies were built but not installed, installation is not implemented
                     254 - User aborted
                     255 - Unknown error
         
@@ -128,9 +138,9 @@ class Spike():
         opts.add_argumentless(['-B', '--bootstrap'],                  help = 'Update spike and scroll repositories\n'
                                                              'slaves: [--no-verify]')
         opts.add_argumentless(['-F', '--find'],                       help = 'Find a scroll either by name or by ownership\n'
-                                                             'slaves: [--owner | --written=]')
+                                                             'slaves: [--owner | --written=] [--text]')
         opts.add_argumentless(['-W', '--write'],                      help = 'Install a pony (package) from scroll\n'
-                                                             'slaves: [--pinpal= | --private] [--asdep | --asexplicit] [--nodep] [--force] [--shred]')
+                                                             'slaves: [--pinpal= | --private] [--asdep | --asexplicit] [--nodep] [--force] [--shred] [--jobs=] [--plan-out=]')
         opts.add_argumentless(['-U', '--update'],                     help = 'Update to new versions of the installed ponies\n'
                                                              'slaves: [--pinpal= | --private] [--ignore=]... [--shred]')
         opts.add_argumentless(['-E', '--erase'],                      help = 'Uninstall a pony\n'
@@ -151,19 +161,25 @@ class Spike():
                                                              'slaves: [--scrolls]')
         opts.add_argumented(  ['--restore-archive'], arg = 'ARCHIVE', help = 'Roll back to an archived state of the system\n'
                                                              'slaves: [--shared | --full | --old] [--downgrade | --upgrade] [--shred]')
+        opts.add_argumented(  ['--apply-plan'],      arg = 'PLAN',    help = 'Install ponies as planned by --write --plan-out\n'
+                                                             'slaves: [--pinpal=] [--force] [--shred] [--jobs=]')
         opts.add_argumentless(['-N', '--clean'],                      help = 'Uninstall unneeded ponies\n'
                                                              'slaves: [--private] [--shred]')
-        opts.add_argumentless(['-P', '--proofread'],                  help = 'Verify that a scroll is correct')
+        opts.add_argumentless(['-P', '--proofread'],                  help = 'Verify that a scroll is correct\n'
+                                                             'slaves: [--jobs=] [--incremental]')
         opts.add_argumentless(['-S', '--example-shot'],               help = 'Display example shot for scrolls\n'
                                                              'slaves: [--viewer=] [--all-at-once]')
         opts.add_argumentless(['-I', '--interactive'],                help = 'Start in interative graphical terminal mode\n'
                                                                              '(supports installation and uninstallation only)\n'
                                                                              'slaves: [--shred]')
+        opts.add_argumentless([      '--daemon'],                     help = 'Start a daemon that keeps Spike loaded and serves\n'
+                                                                             'read-only requests from other instances of Spike')
         opts.add_argumentless(['-3', '--sha3sum'],                    help = 'Calculate the SHA3 checksums for files\n'
                                                                              '(do not expect files to be listed in order)')
         
         opts.add_argumentless(['-o', '--owner'],                      help = 'Find owner pony for file')
         opts.add_argumented(  ['-w', '--written'],   arg = 'boolean', help = 'Search only for installed (\'yes\' or \'y\') or not installed (\'no\' or \'n\') ponies')
+        opts.add_argumentless([      '--text'],                       help = 'Search scroll descriptions, groups and provides rather than names')
         opts.add_argumented(  [      '--pinpal'],    arg = 'ROOT',    help = 'Mounted system for which to do installation or unstallation')
         opts.add_argumentless(['-u', '--private'],                    help = 'Private pony installation')
         opts.add_argumentless([      '--asdep'],                      help = 'Install pony as implicitly installed (a dependency)')
@@ -182,6 +198,9 @@ class Spike():
         opts.add_argumentless([      '--downgrade'],                  help = 'Do only perform pony downgrades')
         opts.add_argumentless([      '--upgrade'],                    help = 'Do only perform pony upgrades')
         opts.add_argumentless([      '--shred'],                      help = 'Perform secure removal with `shred` when removing old files')
+        opts.add_argumented(  [      '--plan-out'],  arg = 'PLAN',    help = 'Export the resolved installation rather than installing')
+        opts.add_argumented(  [      '--jobs'],      arg = 'N',       help = 'Number of scrolls to process in parallel')
+        opts.add_argumentless([      '--incremental'],                help = 'Skip scrolls that have already passed proofreading')
         opts.add_argumentless([      '--no-verify'],                  help = 'Skip verification of signatures')
         opts.add_argumentless(['-a', '--all-at-once'],                help = 'Display all example shots in one single process instance')
         opts.add_argumented(  [      '--viewer'],    arg = 'VIEWER',  help = 'Select image viewer for example shots')
@@ -222,8 +241,10 @@ class Spike():
         for opt in 'vhcBFWUEXRCDANPSI3':
             exclusives.add('-' + opt)
         exclusives.add('--restore-archive')
+        exclusives.add('--apply-plan')
         exclusives.add('--demote')
         exclusives.add('--promote')
+        exclusives.add('--daemon')
         opts.test_exclusiveness(self.execprog, exclusives, longmap, True)
         
         for opt in opts.opts:
@@ -252,6 +273,19 @@ class Spike():
                 rc += value.split(',')
             return rc
         
+        def jobs():
+            if opts.opts['--jobs'] is None:
+                return 1
+            if not opts.opts['--jobs'][0].isdigit() or (int(opts.opts['--jobs'][0]) < 1):
+                printerr(self.execprog + ': only positive integers are allowed for --jobs')
+                exit(4)
+            return int(opts.opts['--jobs'][0])
+        
+        # Requests that the daemon can serve load LibSpike only if the daemon does not serve them
+        if all(opts.opts[opt] is None for opt in ('-3', '-F', '-R', '-P', '-S')):
+            load_libspike()
+            self.version = SPIKE_VERSION
+        
         try:
             if opts.opts['-v'] is not None:
                 opts.test_allowed(self.execprog, allowed, longmap, True)
@@ -271,9 +305,13 @@ class Spike():
             
             elif opts.opts['-3'] is not None:
                 opts.test_allowed(self.execprog, allowed, longmap, True)
-                LibSpike.initialise()
                 exit_value = self.sha3sum(opts.files)
             
+            elif opts.opts['--daemon'] is not None:
+                opts.test_allowed(self.execprog, allowed, longmap, True)
+                opts.test_files(self.execprog, 0, 0, True)
+                exit_value = self.daemon()
+            
             elif opts.opts['-B'] is not None:
                 allowed.add('--no-verify')
                 opts.test_allowed(self.execprog, allowed, longmap, True)
@@ -285,24 +323,27 @@ class Spike():
                 exclusives.add('-o')
                 exclusives.add('-w')
                 opts.test_exclusiveness(self.execprog, exclusives, longmap, True)
-                opts.test_allowed(self.execprog, allowed, longmap, True)
+                exclusives = set()
+                exclusives.add('-o')
+                exclusives.add('--text')
+                opts.test_exclusiveness(self.execprog, exclusives, longmap, True)
                 allowed.add('-o')
                 allowed.add('-w')
+                allowed.add('--text')
+                opts.test_allowed(self.execprog, allowed, longmap, True)
+                find = self.find_text if opts.opts['--text'] is not None else self.find_scroll
                 if opts.opts['-w'] is not None:
                     if opts.opts['-w'][0] not in ('y', 'yes', 'n', 'no'):
                         printerr(self.execprog + ': only \'yes\',  \'y\', \'no\' and \'n\' are allowed for -w(--written)')
                         exit(4)
-                    LibSpike.initialise()
-                    exit_value = self.find_scroll(opts.files,
-                                                  installed    = opts.opts['-w'][0][0] == 'y',
-                                                  notinstalled = opts.opts['-w'][0][0] == 'n')
+                    exit_value = find(opts.files,
+                                      installed    = opts.opts['-w'][0][0] == 'y',
+                                      notinstalled = opts.opts['-w'][0][0] == 'n')
                 elif opts.opts['-o'] is not None:
                     opts.test_files(self.execprog, 1, None, True)
-                    LibSpike.initialise()
                     exit_value = self.find_owner(opts.files)
                 else:
-                    LibSpike.initialise()
-                    exit_value = self.find_scroll(opts.files, installed = True, notinstalled = True)
+                    exit_value = find(opts.files, installed = True, notinstalled = True)
                 
             elif opts.opts['-W'] is not None:
                 exclusives.add('--pinpal')
@@ -319,6 +360,8 @@ class Spike():
                 allowed.add('--nodep')
                 allowed.add('--force')
                 allowed.add('--shred')
+                allowed.add('--plan-out')
+                allowed.add('--jobs')
                 opts.test_allowed(self.execprog, allowed, longmap, True)
                 opts.test_files(self.execprog, 1, None, True)
                 LibSpike.initialise(shred = opts.opts['--shred'] is not None)
@@ -328,7 +371,25 @@ class Spike():
                                         explicitness = 1  if opts.opts['--asexplicit'] is not None else
                                                        -1 if opts.opts['--asdep']      is not None else 0,
                                         nodep        = opts.opts['--nodep'] is not None,
-                                        force        = opts.opts['--force'] is not None)
+                                        force        = opts.opts['--force'] is not None,
+                                        plan_out     = opts.opts['--plan-out'][0] if opts.opts['--plan-out'] is not None else None,
+                                        jobs         = jobs())
+            
+            elif opts.opts['--apply-plan'] is not None:
+                allowed.add('--pinpal')
+                allowed.add('--force')
+                allowed.add('--shred')
+                allowed.add('--jobs')
+                opts.test_allowed(self.execprog, allowed, longmap, True)
+                opts.test_files(self.execprog, 0, 0, True)
+                LibSpike.initialise(shred = opts.opts['--shred'] is not None)
+                exit_value = self.write([],
+                                        root    = opts.opts['--pinpal'][0] if opts.opts['--pinpal'] is not None else '/',
+                                        force   = opts.opts['--force'] is not None,
+                                        plan_in = opts.opts['--apply-plan'][0],
+                                        jobs    = jobs())
+                if exit_value == 30:
+                    printerr('%s: %s was not planned for this system' % (self.execprog, opts.opts['--apply-plan'][0]))
                 
             elif opts.opts['-U'] is not None:
                 allowed.add('--pinpal')
@@ -400,12 +461,10 @@ class Spike():
                         if opts.opts['-w'][0] not in ('y', 'yes', 'n', 'no'):
                             printerr(self.execprog + ': only \'yes\',  \'y\', \'no\' and \'n\' are allowed for -w(--written)')
                             exit(4)
-                        LibSpike.initialise()
                         exit_value = self.read_info(opts.files, field = comma_split(opts.opts['-f']),
                                                     installed = opts.opts['-w'][0][0] == 'y',
                                                     notinstalled = opts.opts['-w'][0][0] == 'n')
                     else:
-                        LibSpike.initialise()
                         exit_value = self.read_info(opts.files, field = comma_split(opts.opts['-f']))
                     
             elif opts.opts['-C'] is not None:
@@ -467,18 +526,19 @@ class Spike():
                                                        1  if opts.opts['--upgrade']   is not None else 0)
                 
             elif opts.opts['-P'] is not None:
+                allowed.add('--jobs')
+                allowed.add('--incremental')
                 opts.test_allowed(self.execprog, allowed, longmap, True)
                 opts.test_files(self.execprog, 1, None, True)
-                LibSpike.initialise()
-                exit_value = self.proofread(opts.files)
+                exit_value = self.proofread(opts.files, jobs = jobs(), incremental = opts.opts['--incremental'] is not None)
             
             elif opts.opts['-N'] is not None:
-                allowed.add('--private')
+                allowed.add('-u')
                 allowed.add('--shred')
                 opts.test_allowed(self.execprog, allowed, longmap, True)
-                opts.test_files(self.execprog, 1, None, True)
+                opts.test_files(self.execprog, 0, 0, True)
                 LibSpike.initialise(shred = opts.opts['--shred'] is not None)
-                exit_value = self.clean(private = opts.opts['--private'] is not None)
+                exit_value = self.clean(private = opts.opts['-u'] is not None)
                 
             elif opts.opts['-S'] is not None:
                 allowed.add('--viewer')
@@ -487,7 +547,6 @@ class Spike():
                 opts.test_files(self.execprog, 1, None, True)
                 env_display = os.environ['DISPLAY']
                 default_viewer = 'xloadimage' if (env_display is not None) and env_display.startsWith(':') else 'jfbview'
-                LibSpike.initialise()
                 exit_value = self.example_shot(opts.files,
                                                viewer      = opts.opts['--viewer'][0] if opts.opts['--viewer'] is not None else default_viewer,
                                                all_at_once = opts.opts['-a'] is not None)
@@ -514,8 +573,11 @@ class Spike():
         
         if exit_value == 27:
             printerr('%s: \033[01;31m%s\033[00m' % (self.execprog, 'corrupt database'))
+        elif exit_value == 31:
+            printerr('%s: %s' % (self.execprog, 'the ponies were built, but installation is not implemented, nothing was installed'))
         
-        LibSpike.terminate()
+        if 'LibSpike' in globals():
+            LibSpike.terminate()
         exit(exit_value)
     
     
@@ -550,6 +612,36 @@ class Spike():
     
     
     
+    def invoke(self, method, aggregator, *args):
+        '''
+        Invoke a read-only method in LibSpike, in the Spike daemon if it is running
+        
+        @param   method:str      The name of the method in `LibSpike`
+        @param   aggregator:(*)  The aggregator for the method
+        @param   args:*¿E?       The rest of the arguments for the method
+        @return  :byte           Exit value, see description of `mane`
+        '''
+        exit_value = SpikeDaemonClient().request(method, aggregator, *args)
+        if exit_value is None:
+            load_libspike()
+            LibSpike.initialise()
+            exit_value = getattr(LibSpike, method)(aggregator, *args)
+        return exit_value
+    
+    
+    def daemon(self):
+        '''
+        Start the Spike daemon
+        
+        @return  :byte  Exit value, see description of `mane`
+        '''
+        exit_value = SpikeDaemon().serve()
+        if exit_value == 13:
+            printerr(self.execprog + ': the daemon is already running')
+        return exit_value
+    
+    
+    
     def bootstrap(self, verify):
         '''
         Update the spike and the scroll archives
@@ -592,7 +684,29 @@ class Spike():
             def __call__(self, found):
                 print(found)
         
-        return LibSpike.find_scroll(Agg(), patterns, installed, notinstalled)
+        return self.invoke('find_scroll', Agg(), patterns, installed, notinstalled)
+    
+    
+    def find_text(self, patterns, installed = True, notinstalled = True):
+        '''
+        Search for a scroll by its description, groups and provides
+        
+        @param   patterns:list<str>  Regular expression search patterns
+        @param   installed:bool      Look for installed packages
+        @param   notinstalled:bool   Look for not installed packages
+        @return  :byte               Exit value, see description of `mane`
+        '''
+        class Agg:
+            '''
+            aggregator:(str)→void
+                Feed a scroll when one whose information matches one of the patterns has been found.
+            '''
+            def __init__(self):
+                pass
+            def __call__(self, found):
+                print(found)
+        
+        return self.invoke('find_text', Agg(), patterns, installed, notinstalled)
     
     
     def find_owner(self, files):
@@ -616,10 +730,10 @@ class Spike():
                 else:
                     print('%s has not owner\n' % filepath)
         
-        return LibSpike.find_owner(Agg(), files)
+        return self.invoke('find_owner', Agg(), files)
     
     
-    def write(self, scrolls, root = '/', private = False, explicitness = 0, nodep = False, force = False):
+    def write(self, scrolls, root = '/', private = False, explicitness = 0, nodep = False, force = False, plan_out = None, plan_in = None, jobs = 1):
         '''
         Install ponies from scrolls
         
@@ -629,12 +743,15 @@ class Spike():
         @param   explicitness:int   -1 for install as dependency, 1 for install as explicit, and 0 for explicit if not previously as dependency
         @param   nodep:bool         Whether to ignore dependencies
         @param   force:bool         Whether to ignore file claims
+        @param   plan_out:str?      File to which to export the resolved installation instead of installing, `None` to install
+        @param   plan_in:str?       File with an exported installation to apply instead of resolving the other parameters, `None` to resolve
+        @param   jobs:int           The number of scrolls to build in parallel
         @return  :byte              Exit value, see description of `mane`
         '''
         class Agg:
             '''
             aggregator:(str?, int, [*])→(void|bool|str|int?)
-                Feed a scroll (`None` only at state 0, 3, 6, 7 and 9) and a state (can be looped) during the process of a scroll.
+                Feed a scroll (`None` only at state 0, 3, 6, 7, 9 and 15) and a state (can be looped) during the process of a scroll.
                 The states are: 0 - inspecting installed scrolls
                                 1 - proofreading
                                 2 - scroll added because of being updated
@@ -653,6 +770,7 @@ class Spike():
                                12 - compiling
                                13 - file conflict check: Additional parameters: progress state:int, progress end:int
                                14 - installing files: Additional parameters: progress state:int, progress end:int
+                               15 - pipeline statistics, only if $SPIKE_BENCHMARK is yes. Additional parameters: stage:str, maximum queue depth:int, total wait time in seconds:float
                 when:excl-flag values: 0 - Build whenever
                                        1 - Build early
                                        2 - Build early and fetch separately
@@ -765,6 +883,9 @@ class Spike():
                         if when == 'a':
                             return None
                         print('\033[01mInvalid option!\033[00m')
+                elif state == 15:
+                    (stage, depth, waited) = args
+                    print('%s stage: at most %i scrolls queued, %.1f seconds waited in total' % (stage.capitalize(), depth, waited))
                 else:
                     if scroll not in self.scrls[state - 10][1]:
                         self.scrls[state - 10][0] += 1
@@ -784,7 +905,7 @@ class Spike():
                         bar %= (2, 'DONE') if progress == end else (3, '%2.1f' % (progress / end))
                         print('[%s] (%i/%i) Verifing %s' % (bar, scrli, scrln, scroll))
                     elif state == 12:
-                        print('(%i/%i) Compiling %s' % (scrli + 1, scrln, scroll))
+                        print('(%i/%i) Compiling %s' % (scrli, scrln, scroll))
                     elif state == 13:
                         (progress, end) = args
                         bar = '[\033[01;3%im%s\033[00m]'
@@ -800,7 +921,7 @@ class Spike():
                             print('\033[%iBm', scrln - (scrli + 1))
                 return None
                 
-        return LibSpike.write(Agg(), scrolls, root, private, explicitness, nodep, force)
+        return LibSpike.write(Agg(), scrolls, root, private, explicitness, nodep, force, plan_out, plan_in, jobs)
     
     
     def update(self, root = '/', ignores = [], private = False):
@@ -961,7 +1082,7 @@ class Spike():
                         bar %= (2, 'DONE') if progress == end else (3, '%2.1f' % (progress / end))
                         print('[%s] (%i/%i) Verifing %s' % (bar, scrli, scrln, scroll))
                     elif state == 12:
-                        print('(%i/%i) Compiling %s' % (scrli + 1, scrln, scroll))
+                        print('(%i/%i) Compiling %s' % (scrli, scrln, scroll))
                     elif state == 13:
                         (progress, end) = args
                         bar = '[\033[01;3%im%s\033[00m]'
@@ -1062,7 +1183,7 @@ class Spike():
                 else:
                     print('%s: %s' % (owner, filename))
         
-        return LibSpike.read_files(Agg(), ponies)
+        return self.invoke('read_files', Agg(), ponies)
     
     
     def read_info(self, scrolls, field = None, installed = True, notinstalled = True):
@@ -1100,7 +1221,7 @@ class Spike():
                     else:
                         print('%s: %s: %s' % (scroll, meta, info))
         
-        return LibSpike.read_info(Agg(), scrolls, field, installed, notinstalled)
+        return self.invoke('read_info', Agg(), scrolls, field, installed, notinstalled)
     
     
     def claim(self, files, pony, recursiveness = 0, private = False, force = False):
@@ -1220,11 +1341,13 @@ class Spike():
         return LibSpike.rollback(Agg(), archive, keep, skipe, gradeness)
     
     
-    def proofread(self, scrolls):
+    def proofread(self, scrolls, jobs = 1, incremental = False):
         '''
         Look for errors in a scrolls
         
         @param   scrolls:list<str>  Scrolls to proofread
+        @param   jobs:int           The number of scrolls to proofread in parallel
+        @param   incremental:bool   Whether to skip scrolls that have already passed
         @return  :byte              Exit value, see description of `mane`
         '''
         class Agg:
@@ -1244,7 +1367,7 @@ class Spike():
                     message = args[0]
                     print('Error: %s: %s' % (scroll, message))
         
-        return LibSpike.proofread(Agg(), scrolls)
+        return self.invoke('proofread', Agg(), scrolls, jobs, incremental)
     
     
     def clean(self, private = False):
@@ -1314,7 +1437,7 @@ class Spike():
                 if all_at_once:
                     Popen(self.queue).communicate()
         
-        exit_value = LibSpike.example_shot(Agg(), scrolls)
+        exit_value = self.invoke('example_shot', Agg(), scrolls)
         if exit_value != 0:
             Agg.done()
         return exit_value
@@ -1356,7 +1479,7 @@ class Spike():
                 else:
                     print('\033[01m%s\033[21m  %s' % (checksum, filename));
         
-        return LibSpike.sha3sum(Agg(), files)
+        return self.invoke('sha3sum', Agg(), files)
         
 
 
@@ -23,6 +23,8 @@ import sys
 
 from dragonsuite import *
 from auxiliary.scrollmagick import *
+from library.downloader import *
+from algorithmic.sha3sum import *
 
 
 
@@ -51,6 +53,8 @@ OSI_APPROVED = 64
 GPL_COMPATIBLE = 128
 COPYLEFT = 256
 
+useopts = None
+
 
 
 class Spikeless():
@@ -59,7 +63,7 @@ class Spikeless():
     '''
     
     @staticmethod
-    def install(scroll, startdir, pinpal = '', private = False, fresh_installation = True, buildpatch = None, checkpatch = None, packagepatch = None, inspection = None):
+    def install(scroll, startdir, pinpal = '', private = False, fresh_installation = True, buildpatch = None, checkpatch = None, packagepatch = None, inspection = None, fetch = True, cache = None):
         '''
         Installs a scroll, but does not do any package managing
         
@@ -72,6 +76,8 @@ class Spikeless():
         @param   checkpatch:(srcdir:str, pkgdir:str)?→void                      Scroll check patch function
         @param   packagepatch:(srcdir:str, pkgdir:str)?→void                    Scroll package patch function
         @param   inspection:(pkgdir:str)?→bool                                  Function that checks that the package can be installed
+        @param   fetch:bool                                                     Whether to fetch the sources, rather than use those fetched by `fetch`
+        @param   cache:SourceCache?                                             Cache of downloaded sources, `None` to always download
         @return  (pre, pkgdir, post):((list<str>)→void, str, (list<str>)→void)  Preinstall functor, director with files to install, postinstall functor.
                                                                                 The functors takes the files installed by the scrolls, before and after the installation, respectively.
                                                                                 Between calling the functor you just install file files in the returned directory
@@ -79,8 +85,7 @@ class Spikeless():
         global _dragonsuite_output
         _dragonsuite_output = sys.stdout.buffer
         
-        ScrollMagick.init_methods(globals())
-        ScrollMagick.init_fields(globals())
+        scroll_globals = ScrollMagick.namespace()
         
         scrolldir = os.path.abspath(dirname(scroll))
         cwd = os.getcwd()
@@ -114,97 +119,15 @@ class Spikeless():
         if not os.path.exists(pkgdir):
             os.mkdir(pkgdir)
         
-        ScrollMagick.execute_scroll(scroll, globals())
-        
-        def sources(scrolldir):
-            global noextract, source, sha3sums
-            noextract = set([] if noextract is None else noextract)
-            extract = []
-            
-            pushd(scrolldir)
-            for i in range(len(source)):
-                src = source[i]
-                extras = None
-                if not isinstance(src, str):
-                    extras = list(src[1:])
-                    src = src[0]
-                _src = src
-                if src.startswith('file:'):
-                    src = src[5:]
-                    if src.startswith('//'):
-                        src = src[2:]
-                elif ':' in src:
-                    if extras is not None:
-                        src = [src] + extras
-                    source[i] = (src, _src not in noextract)
-                    continue
-                src = os.path.abspath(src)
-                src = 'file://' + src
-                if extras is not None:
-                    src = [src] + extras
-                source[i] = (src, _src not in noextract)
-            popd()
-            
-            def inetget(params, dest, sha3sum):
-                if os.path.exists(dest):
-                    if sha3sum is not None:
-                        if sha3sum(dest) != sha3sum.upper():
-                            wget(params)
-                else:
-                    wget(params)
-            
-            i = 0
-            for (src, extractsrc) in source:
-                dest = None
-                d = None
-                if isinstance(src, str):
-                    dest = src[src.rfind('/'):]
-                    if dest == '':
-                        dest = 'index.html'
-                    d = dest
-                    dest = startdir + os.sep + dest
-                    if ':' not in src:
-                        cp(src.replace('/', os.sep), dest)
-                    elif src.startswith('file:'):
-                        src = src[5:]
-                        if src.startswith('//'):
-                            src = src[2:]
-                        cp(src.replace('/', os.sep), dest)
-                    else:
-                        inetget(src, dest, sha3sums[i])
-                else:
-                    extras = src[2:]
-                    (src, dest) = src[:2]
-                    if dest is None:
-                        dest = src[src.rfind('/'):]
-                        if dest == '':
-                            dest = 'index.html'
-                    d = dest
-                    dest = startdir + os.sep + dest
-                    if ':' not in src:
-                        cp(src.replace('/', os.sep), dest)
-                    elif src.startswith('file:'):
-                        src = src[5:]
-                        if src.startswith('//'):
-                            src = src[2:]
-                        cp(src.replace('/', os.sep), dest)
-                    else:
-                        inetget([src, '-O', dest] + extras, dest, sha3sums[i])
-                if sha3sums[i] is not None:
-                    sha3 = sha3sum(sumdests)
-                    if sha3 != sha3sums[i].upper():
-                        raise Exception('sha3sum is not matching for %s' % d)
-                if extractsrc:
-                    extract.append(os.path.abspath(dest))
-                i += 1
-            
-            cd('src')
-            decompress(extract)
-            cd('..')
+        ScrollMagick.execute_scroll(scroll, scroll_globals)
+        (build, check, package) = [scroll_globals[method] for method in ('build', 'check', 'package')]
+        options = scroll_globals['options']
         
-        cd(startdir)
-        msg('Fetching sources')
-        sources(scrolldir)
+        if fetch:
+            cd(startdir)
+            msg('Fetching sources')
+            Spikeless.sources(scroll_globals, scrolldir, startdir, cache)
+            cd(cwd)
         
         if build is not None:
             if buildpatch is not None:
@@ -272,7 +195,7 @@ class Spikeless():
                 self.root = root
                 self.env = env
             def __call__(self, installedfiles = []):
-                global pre_install, pre_upgrade
+                (pre_install, pre_upgrade) = (scroll_globals['pre_install'], scroll_globals['pre_upgrade'])
                 cwd = os.getcwd()
                 os.chdir(self.root)
                 os.umask(0o022)
@@ -300,7 +223,7 @@ class Spikeless():
                 self.root = root
                 self.env = env
             def __call__(self, installedfiles = []):
-                global post_install, post_upgrade
+                (post_install, post_upgrade) = (scroll_globals['post_install'], scroll_globals['post_upgrade'])
                 cwd = os.getcwd()
                 os.chdir(self.root)
                 os.umask(0o022)
@@ -326,18 +249,244 @@ class Spikeless():
         reset_environ(environ, False)
         return (pre, pkgdir, post)
 
+    
+    
+    @staticmethod
+    def fetch(scroll, startdir, cache = None):
+        '''
+        Fetch, verify and extract the sources of a scroll, so that it can be installed without fetching them
+        
+        @param   scroll:str          Scroll whose sources to fetch, by filename
+        @param   startdir:str        Scroll base working directory
+        @param   cache:SourceCache?  Cache of downloaded sources, `None` to always download
+        @return  :list<str>          The fetched sources
+        '''
+        scroll_globals = ScrollMagick.namespace()
+        
+        scrolldir = os.path.abspath(dirname(scroll))
+        cwd = os.getcwd()
+        
+        ScrollMagick.export_environment()
+        
+        startdir = os.path.abspath(startdir)
+        srcdir = startdir + os.sep + 'src'
+        if not os.path.exists(srcdir):
+            os.makedirs(srcdir)
+        
+        ScrollMagick.execute_scroll(scroll, scroll_globals)
+        
+        cd(startdir)
+        try:
+            msg('Fetching sources')
+            return Spikeless.sources(scroll_globals, scrolldir, startdir, cache)
+        finally:
+            cd(cwd)
+    
+    
+    @staticmethod
+    def sources(scroll_globals, scrolldir, startdir, cache = None):
+        '''
+        Fetch, verify and extract the sources of a scroll, the current working directory must be `startdir`
+        
+        @param   scroll_globals:dict<str, ¿E?>  The namespace the scroll has been executed in
+        @param   scrolldir:str                  The directory of the scroll, relative sources are relative to it
+        @param   startdir:str                   Scroll base working directory
+        @param   cache:SourceCache?             Cache of downloaded sources, `None` to always download
+        @return  :list<str>                     The fetched sources
+        '''
+        (source, sha3sums) = (scroll_globals['source'], scroll_globals['sha3sums'])
+        fetched = []
+        noextract = scroll_globals['noextract']
+        noextract = set([] if noextract is None else noextract)
+        extract = []
+        
+        pushd(scrolldir)
+        for i in range(len(source)):
+            src = source[i]
+            extras = None
+            if not isinstance(src, str):
+                extras = list(src[1:])
+                src = src[0]
+            _src = src
+            if src.startswith('file:'):
+                src = src[5:]
+                if src.startswith('//'):
+                    src = src[2:]
+            elif ':' in src:
+                if extras is not None:
+                    src = [src] + extras
+                source[i] = (src, _src not in noextract)
+                continue
+            src = os.path.abspath(src)
+            src = 'file://' + src
+            if extras is not None:
+                src = [src] + extras
+            source[i] = (src, _src not in noextract)
+        popd()
+        
+        # Request the entity tags of the remote sources without sums, that address them in the cache, concurrently
+        if cache is not None:
+            urls = []
+            for i in range(len(source)):
+                url = source[i][0] if isinstance(source[i][0], str) else source[i][0][0]
+                if (':' in url) and not url.startswith('file:') and (sha3sums[i] is None):
+                    urls.append(url)
+            cache.resolve(urls)
+        
+        # Place cached sources and find the remote sources that must be downloaded,
+        # remember the sums that are calculated so that no file is hashed twice,
+        # cached sources are verified too, and are discarded if they are corrupt
+        (downloads, sums) = ([], {})
+        def inetget(url, params, dest, checksum, extractsrc):
+            key = None if cache is None else cache.key(url, checksum)
+            if (key is not None) and cache.get(key, dest):
+                if checksum is None:
+                    return (key, True)
+                sums[dest] = sha3sum(dest)
+                if sums[dest] == checksum.upper():
+                    return (key, True)
+                del sums[dest]
+                cache.discard(key)
+            if os.path.exists(dest):
+                if checksum is None:
+                    return (key, False)
+                sums[dest] = sha3sum(dest)
+                if sums[dest] == checksum.upper():
+                    return (key, False)
+                del sums[dest]
+            # Do not write through an old file, it may be linked to other files
+            if os.path.lexists(dest):
+                os.unlink(dest)
+            downloads.append((url, params, dest, isinstance(params, str) or (len(params) == 3), checksum, extractsrc))
+            return (key, False)
+        
+        placed = []
+        i = 0
+        for (src, extractsrc) in source:
+            dest = None
+            d = None
+            (key, cached) = (None, False)
+            if isinstance(src, str):
+                dest = src[src.rfind('/'):]
+                if dest == '':
+                    dest = 'index.html'
+                d = dest
+                dest = startdir + os.sep + dest
+                if ':' not in src:
+                    cp(src.replace('/', os.sep), dest)
+                elif src.startswith('file:'):
+                    src = src[5:]
+                    if src.startswith('//'):
+                        src = src[2:]
+                    cp(src.replace('/', os.sep), dest)
+                else:
+                    (key, cached) = inetget(src, src, dest, sha3sums[i], extractsrc)
+            else:
+                extras = src[2:]
+                (src, dest) = src[:2]
+                if dest is None:
+                    dest = src[src.rfind('/'):]
+                    if dest == '':
+                        dest = 'index.html'
+                d = dest
+                dest = startdir + os.sep + dest
+                if ':' not in src:
+                    cp(src.replace('/', os.sep), dest)
+                elif src.startswith('file:'):
+                    src = src[5:]
+                    if src.startswith('//'):
+                        src = src[2:]
+                    cp(src.replace('/', os.sep), dest)
+                else:
+                    (key, cached) = inetget(src, [src, '-O', dest] + extras, dest, sha3sums[i], extractsrc)
+            placed.append((src, dest, d, key, cached, extractsrc, sha3sums[i]))
+            i += 1
+        
+        # Download the remote sources, concurrently over reused connections when possible,
+        # otherwise, or if that fails, with wget, sources with extra wget options always use wget.
+        # Sources downloaded in-process are hashed, and optionally extracted, as they are received,
+        # they are extracted into a staging directory and are moved into `src` when they have been verified
+        stream_extract = os.getenv('SPIKE_STREAM_EXTRACT', '').lower() == 'yes'
+        (hashers, extractors, staging, streamed) = ({}, {}, {}, set())
+        def observer(dest, checksum, extractsrc):
+            observers = []
+            if checksum is not None:
+                hashers[dest] = SHA3()
+                observers.append(hashers[dest].update)
+            if extractsrc and stream_extract and TarStream.supported(dest):
+                staging[dest] = startdir + os.sep + '.stream-%i' % len(staging)
+                if os.path.lexists(staging[dest]):
+                    rm_r(staging[dest])
+                extractors[dest] = TarStream(staging[dest])
+                observers.append(extractors[dest])
+            def observe(chunk):
+                for observer in observers:
+                    observer(chunk)
+            return observe if len(observers) > 0 else None
+        downloader = Downloader()
+        try:
+            direct = [(url, dest, observer(dest, checksum, extractsrc)) for (url, _params, dest, plain, checksum, extractsrc) in downloads
+                      if plain and Downloader.supported(url)]
+            try:
+                failed = set(dest for (_url, dest, _error) in downloader.download_all(direct))
+            finally:
+                # Finish the extractions even if the downloads fail, so that no extraction thread is left running
+                extracted = set(dest for dest in extractors if extractors[dest].close())
+            for (_url, dest, _observer) in direct:
+                if (dest in extracted) and (dest not in failed):
+                    streamed.add(dest)
+                if (dest in hashers) and (dest not in failed):
+                    sums[dest] = hashers[dest].hexdigest()
+            for (url, params, dest, plain, _checksum, _extractsrc) in downloads:
+                if (not plain) or (not Downloader.supported(url)) or (dest in failed):
+                    wget(params)
+        finally:
+            downloader.close()
+        
+        def merge(source, destination):
+            if not os.path.lexists(destination):
+                mkdir_p(destination)
+            for name in os.listdir(source):
+                (src, dest) = (source + os.sep + name, destination + os.sep + name)
+                if os.path.isdir(src) and not os.path.islink(src) and os.path.isdir(dest) and not os.path.islink(dest):
+                    merge(src, dest)
+                else:
+                    if os.path.lexists(dest):
+                        rm_r(dest)
+                    os.rename(src, dest)
+        
+        # Verify and cache the sources, cached sources have already been verified,
+        # files extracted from a source that is not verified are removed
+        try:
+            for (src, dest, d, key, cached, extractsrc, checksum) in placed:
+                if (checksum is not None) and not cached:
+                    sha3 = sums[dest] if dest in sums else sha3sum(dest)
+                    if sha3 != checksum.upper():
+                        raise Exception('sha3sum is not matching for %s' % d)
+                if (key is not None) and not cached:
+                    cache.put(key, dest)
+                if dest in streamed:
+                    merge(staging[dest], startdir + os.sep + 'src')
+                elif extractsrc:
+                    extract.append(os.path.abspath(dest))
+                fetched.append(src)
+        finally:
+            for directory in staging.values():
+                if os.path.lexists(directory):
+                    rm_r(directory)
+        
+        cd('src')
+        decompress(extract)
+        cd('..')
+        return fetched
+
 
 if __name__ == '__main__': # sic
     if len(sys.argv) < 3:
         print('USAGE: spikeless SCROLL STARTDIR PINPAL [private]')
         sys.exit(1)
-    global useopts
-    useopts = None
     def installdir(src, dest):
-        if not os.path.exists(dest):
-            os.makedirs(dest)
-        files = [src + os.sep + f for f in os.listdir(src)]
-        cp_r(files, dest)
+        install_tree(src, dest)
     scroll = os.path.abspath(sys.argv[1])
     startdir = os.path.abspath(sys.argv[2])
     pinpal = os.path.abspath(sys.argv[3])